@@ -6,8 +6,10 @@ import os
 import hashlib
 import json
 from datetime import datetime
+from common.instrumentation import instrument_app, span
 
 app = FastAPI(title="JARVIS Action Exec", version="0.1.0")
+instrument_app(app, "action_exec")
 
 class ExecuteRequest(BaseModel):
     cmd: str
@@ -60,14 +62,15 @@ async def execute_command(request: ExecuteRequest):
         stdout = f"[DRY RUN] Would execute: {request.cmd}"
     else:
         try:
-            result = subprocess.run(
-                request.cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=request.timeout,
-                env={**os.environ, **request.env}
-            )
+            with span("action.exec", timeout=request.timeout):
+                result = subprocess.run(
+                    request.cmd,
+                    shell=True,
+                    capture_output=True,
+                    text=True,
+                    timeout=request.timeout,
+                    env={**os.environ, **request.env}
+                )
             stdout = result.stdout
             stderr = result.stderr
             exit_code = result.returncode
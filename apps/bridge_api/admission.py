@@ -0,0 +1,211 @@
+from typing import Any, Deque, Dict, Optional
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import time
+
+
+class AdmissionRejected(Exception):
+    """Requête refusée avant d'atteindre un service (429 ou 503 + Retry-After)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` requêtes/s en régime permanent, rafales jusqu'à `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost: float = 1.0) -> float:
+        """Consomme `cost` jetons ; sinon retourne l'attente nécessaire (s)."""
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class ServiceGate:
+    """
+    Limite globale de requêtes en vol vers un service, avec file FIFO bornée.
+    Un créneau libéré est transmis directement au plus ancien en attente.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        if limit < 1:
+            raise ValueError(f"Admission limit for '{name}' must be at least 1")
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        # Compteurs
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.hold_s_avg = 1.0
+
+    def retry_after(self) -> float:
+        """Estimation du temps avant qu'un créneau se libère pour un nouvel arrivant."""
+        return self.hold_s_avg * (len(self._waiters) + 1) / self.limit
+
+    async def acquire(self, timeout: float) -> None:
+        """Attend un créneau au plus `timeout` secondes (0 : pas de file d'attente)."""
+        start = time.monotonic()
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+
+        if timeout <= 0 or len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(503, f"{self.name} service saturated", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                # Créneau transmis au moment de l'échéance : le rendre
+                self.release()
+            else:
+                future.cancel()
+                self._waiters.remove(future)
+            self.rejected_deadline += 1
+            raise AdmissionRejected(503, f"{self.name} queue deadline exceeded", self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+                if future in self._waiters:
+                    self._waiters.remove(future)
+            raise
+
+        wait_ms = (time.monotonic() - start) * 1000
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        self.admitted += 1
+
+    def release(self, held_s: Optional[float] = None) -> None:
+        if held_s is not None:
+            self.hold_s_avg = 0.8 * self.hold_s_avg + 0.2 * held_s
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        waited = self.queued - self.rejected_deadline
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued_now": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+            "wait_ms": {
+                "avg": round(self.wait_ms_total / waited, 1) if waited > 0 else 0.0,
+                "max": round(self.wait_ms_max, 1),
+            },
+        }
+
+
+class AdmissionController:
+    """
+    Contrôle d'admission du bridge, avant tout appel aux services CPU :
+    1. seau à jetons par utilisateur -> 429 si le débit est dépassé
+    2. limite de requêtes en vol par service, file d'attente bornée avec
+       échéance -> 503 si la file est pleine ou l'échéance dépassée
+    Les refus portent un Retry-After.
+    """
+
+    def __init__(self, user_rate: float = 1.0, user_burst: float = 5.0, limits: Optional[Dict[str, int]] = None,
+                 max_queue: int = 16, queue_timeout: float = 10.0, max_users: int = 10000):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.queue_timeout = queue_timeout
+        self.max_users = max_users
+        self.gates = {
+            name: ServiceGate(name, limit, max_queue)
+            for name, limit in (limits or {}).items()
+        }
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.rate_limited = 0
+
+    def _bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            # Utilisateur le moins récemment vu oublié en premier
+            if len(self._buckets) >= self.max_users:
+                self._buckets.popitem(last=False)
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._buckets[user_id] = bucket
+        self._buckets.move_to_end(user_id)
+        return bucket
+
+    def check_rate(self, user_id: str, cost: float = 1.0) -> None:
+        wait = self._bucket(user_id).take(cost)
+        if wait > 0:
+            self.rate_limited += 1
+            raise AdmissionRejected(429, "Rate limit exceeded", wait)
+
+    async def acquire(self, service: str, timeout: Optional[float] = None) -> None:
+        gate = self.gates.get(service)
+        if gate is not None:
+            await gate.acquire(self.queue_timeout if timeout is None else timeout)
+
+    def release(self, service: str, held_s: Optional[float] = None) -> None:
+        gate = self.gates.get(service)
+        if gate is not None:
+            gate.release(held_s)
+
+    @asynccontextmanager
+    async def slot(self, service: str, timeout: Optional[float] = None):
+        """Créneau sur le service, libéré en sortie."""
+        await self.acquire(service, timeout)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(service, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, service: str, timeout: Optional[float] = None):
+        """Débit utilisateur puis créneau sur le service, libéré en sortie."""
+        self.check_rate(user_id)
+        async with self.slot(service, timeout):
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "user_rate": self.user_rate,
+            "user_burst": self.user_burst,
+            "tracked_users": len(self._buckets),
+            "rate_limited": self.rate_limited,
+            "services": {name: gate.stats() for name, gate in self.gates.items()},
+        }
@@ -0,0 +1,141 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import OrderedDict
+import asyncio
+import time
+import uuid
+
+
+class AudioSegment:
+    """Une phrase et sa synthèse (en cours ou terminée)."""
+
+    def __init__(self, index: int, text: str, task: asyncio.Task):
+        self.index = index
+        self.text = text
+        self.task = task
+
+    @property
+    def ready(self) -> bool:
+        return self.task.done() and not self.task.cancelled() and self.task.exception() is None
+
+    @property
+    def failed(self) -> bool:
+        return self.task.done() and (self.task.cancelled() or self.task.exception() is not None)
+
+    @property
+    def size(self) -> int:
+        return len(self.task.result()) if self.ready else 0
+
+
+class AudioClip:
+    """Réponse audio découpée en segments, lisibles dès qu'ils sont synthétisés."""
+
+    def __init__(self, user_id: str, ttl: float):
+        self.id = uuid.uuid4().hex[:16]
+        self.user_id = user_id
+        self.expires_at = time.monotonic() + ttl
+        self.segments: List[AudioSegment] = []
+        self.complete = False
+
+    def cancel(self) -> None:
+        for segment in self.segments:
+            segment.task.cancel()
+
+
+class AudioStore:
+    """
+    Stockage en mémoire, à courte durée de vie, des réponses audio de /command.
+    Chaque phrase est synthétisée dans sa propre tâche (au plus
+    `max_concurrency` synthèses simultanées) ; le client récupère les segments
+    dans l'ordre, le premier pouvant être lu pendant la synthèse des suivants.
+    Éviction par TTL, par nombre de clips et par volume audio total.
+    """
+
+    def __init__(self, ttl: float = 120.0, max_clips: int = 256, max_bytes: int = 64 * 1024 * 1024,
+                 max_concurrency: int = 4):
+        self.ttl = ttl
+        self.max_clips = max_clips
+        self.max_bytes = max_bytes
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._clips: "OrderedDict[str, AudioClip]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        expired = [clip_id for clip_id, clip in self._clips.items() if clip.expires_at <= now]
+        for clip_id in expired:
+            self._clips.pop(clip_id).cancel()
+        self.expirations += len(expired)
+
+        while self._clips and (len(self._clips) > self.max_clips or self.total_bytes() > self.max_bytes):
+            _, clip = self._clips.popitem(last=False)
+            clip.cancel()
+            self.evictions += 1
+
+    def total_bytes(self) -> int:
+        return sum(segment.size for clip in self._clips.values() for segment in clip.segments)
+
+    def create(self, user_id: str) -> AudioClip:
+        self._purge()
+        clip = AudioClip(user_id, self.ttl)
+        self._clips[clip.id] = clip
+        return clip
+
+    def add_segment(self, clip: AudioClip, text: str, synthesize: Callable[[str], Awaitable[bytes]]) -> AudioSegment:
+        """Lance la synthèse d'une phrase (la tâche continue après la réponse HTTP)."""
+        async def run() -> bytes:
+            async with self.semaphore:
+                audio = await synthesize(text)
+            self._purge()
+            return audio
+
+        segment = AudioSegment(len(clip.segments), text, asyncio.create_task(run()))
+        # Erreur consultée par le client via /audio ; évite l'avertissement asyncio
+        segment.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        clip.segments.append(segment)
+        return segment
+
+    def finish(self, clip: AudioClip) -> None:
+        clip.complete = True
+
+    def discard(self, clip_id: str) -> None:
+        clip = self._clips.pop(clip_id, None)
+        if clip:
+            clip.cancel()
+
+    def get(self, clip_id: str) -> Optional[AudioClip]:
+        self._purge()
+        return self._clips.get(clip_id)
+
+    async def wait_segment(self, clip: AudioClip, index: int, timeout: float) -> bytes:
+        """Attend la synthèse d'un segment (asyncio.TimeoutError si trop long)."""
+        segment = clip.segments[index]
+        return await asyncio.wait_for(asyncio.shield(segment.task), timeout=timeout)
+
+    def manifest(self, clip: AudioClip, base_url: str) -> Dict[str, Any]:
+        return {
+            "clip_id": clip.id,
+            "complete": clip.complete,
+            "segments": [
+                {
+                    "index": segment.index,
+                    "text": segment.text,
+                    "url": f"{base_url}/{clip.id}/{segment.index}",
+                    "ready": segment.ready,
+                    "failed": segment.failed,
+                }
+                for segment in clip.segments
+            ],
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        self._purge()
+        return {
+            "clips": len(self._clips),
+            "max_clips": self.max_clips,
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,112 @@
+from typing import Any, Dict, Optional
+from datetime import datetime
+import asyncio
+import time
+
+from common.http_client import HTTPClient, CircuitOpenError
+
+
+class ServiceHealth:
+    """Dernier résultat de sonde d'un service."""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self.status = "unknown"
+        self.latency_ms: Optional[float] = None
+        self.failure_streak = 0
+        self.last_checked: Optional[str] = None
+        self.last_ok: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.changed_at: Optional[str] = None
+
+    def record(self, status: str, latency_ms: Optional[float], error: Optional[str] = None) -> None:
+        now = datetime.utcnow().isoformat()
+        if status != self.status:
+            self.changed_at = now
+        self.status = status
+        self.latency_ms = latency_ms
+        self.last_checked = now
+        self.last_error = error
+        if status == "healthy":
+            self.failure_streak = 0
+            self.last_ok = now
+        else:
+            self.failure_streak += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "latency_ms": self.latency_ms,
+            "failure_streak": self.failure_streak,
+            "last_checked": self.last_checked,
+            "last_ok": self.last_ok,
+            "last_error": self.last_error,
+            "changed_at": self.changed_at,
+        }
+
+
+class HealthMonitor:
+    """
+    Sonde en tâche de fond le /health de chaque service, tous en parallèle,
+    toutes les `interval` secondes. /status lit la table en cache : sa latence
+    ne dépend plus du nombre de services ni de leurs timeouts.
+    """
+
+    def __init__(self, http_client: HTTPClient, services: Dict[str, str], interval: float = 10.0,
+                 timeout: float = 2.0):
+        self.http_client = http_client
+        self.interval = interval
+        self.timeout = timeout
+        self.services = {name: ServiceHealth(name, url) for name, url in services.items()}
+        self.rounds = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.interval)
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self._probe(health) for health in self.services.values()))
+        self.rounds += 1
+
+    async def _probe(self, health: ServiceHealth) -> None:
+        start = time.monotonic()
+        try:
+            resp = await self.http_client.get(health.url, timeout=self.timeout, retries=0)
+            latency_ms = round((time.monotonic() - start) * 1000, 1)
+            if resp.status == 200:
+                health.record("healthy", latency_ms)
+            else:
+                health.record("unhealthy", latency_ms, f"HTTP {resp.status}")
+        except CircuitOpenError as e:
+            health.record("circuit_open", None, str(e))
+        except asyncio.TimeoutError:
+            health.record("unreachable", None, f"Timeout after {self.timeout}s")
+        except Exception as e:
+            health.record("unreachable", None, str(e) or type(e).__name__)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: health.to_dict() for name, health in self.services.items()}
+
+    def overall(self) -> str:
+        statuses = {health.status for health in self.services.values()}
+        if statuses <= {"healthy"}:
+            return "healthy"
+        if "healthy" not in statuses:
+            return "unknown" if statuses == {"unknown"} else "down"
+        return "degraded"
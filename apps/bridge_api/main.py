@@ -1,16 +1,27 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
+from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional
-import aiohttp
+import asyncio
 import os
 from dotenv import load_dotenv
 from datetime import datetime
 import json
 
+from common.http_client import HTTPClient, CircuitOpenError
+from common.instrumentation import instrument_app
+from common.coalescing import RequestCoalescer, cancel_on_disconnect
+from voice_pipeline import VoiceSession, SentenceSplitter, iter_sse, synthesize_speech
+from audio_store import AudioStore
+from admission import AdmissionController, AdmissionRejected
+from session_store import SessionStore
+from health_monitor import HealthMonitor
+
 load_dotenv()
 
 app = FastAPI(title="JARVIS Bridge API", version="0.1.0")
+instrument_app(app, "bridge_api")
 
 # CORS pour frontend web
 app.add_middleware(
@@ -19,22 +30,112 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
 # Configuration services
 STT_HOST = os.getenv("STT_HOST", "localhost:5000")
 TTS_HOST = os.getenv("TTS_HOST", "localhost:7000")
 LLM_HOST = os.getenv("LLM_HOST", "localhost:9000")
-VISION_HOST = os.getenv("VISION_HOST", "localhost:8001")
+VISION_HOST = os.getenv("VISION_HOST", "localhost:8002")
+MEMORY_HOST = os.getenv("MEMORY_HOST", "localhost:8003")
+ACTION_EXEC_HOST = os.getenv("ACTION_EXEC_HOST", "localhost:8001")
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", "60"))
+VISION_MAX_UPLOAD_BYTES = int(os.getenv("VISION_MAX_UPLOAD_MB", "25")) * 1024 * 1024
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
+# Client HTTP partagé : sessions keep-alive, retries et disjoncteur par service
+http_client = HTTPClient.from_env()
+
+# Sondes /health des services en tâche de fond ; /status lit le cache
+health_monitor = HealthMonitor(
+    http_client,
+    services={
+        "llm": f"http://{LLM_HOST}/health",
+        "stt": f"http://{STT_HOST}/health",
+        "tts": f"http://{TTS_HOST}/health",
+        "vision": f"http://{VISION_HOST}/health",
+        "memory": f"http://{MEMORY_HOST}/health",
+        "action_exec": f"http://{ACTION_EXEC_HOST}/health",
+    },
+    interval=float(os.getenv("HEALTH_CHECK_INTERVAL", "10")),
+    timeout=float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+)
+
+# Audio des réponses /command, synthétisé phrase par phrase
+audio_store = AudioStore(
+    ttl=float(os.getenv("AUDIO_STORE_TTL", "120")),
+    max_clips=int(os.getenv("AUDIO_STORE_MAX_CLIPS", "256")),
+    max_bytes=int(os.getenv("AUDIO_STORE_MAX_MB", "64")) * 1024 * 1024,
+    max_concurrency=int(os.getenv("TTS_CONCURRENCY", "4"))
+)
+TTS_VOICE = os.getenv("VOICE_TTS_VOICE", "jarvis_fr")
+
+def parse_limits(raw: str) -> dict:
+    """Limites par service, ex: "llm=4,vision=2,voice=8" ; 0 (ou moins) : service non limité."""
+    limits = {}
+    for item in raw.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            if int(value) >= 1:
+                limits[name.strip()] = int(value)
+    return limits
+
+# Contrôle d'admission : débit par utilisateur et requêtes en vol par service
+admission = AdmissionController(
+    user_rate=float(os.getenv("ADMISSION_USER_RATE", "1")),
+    user_burst=float(os.getenv("ADMISSION_USER_BURST", "5")),
+    limits=parse_limits(os.getenv("ADMISSION_LIMITS", "llm=4,vision=2,voice=8")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "16")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+)
+
+# Derniers échanges par utilisateur, ajoutés au contexte du LLM
+session_store = SessionStore(
+    max_turns=int(os.getenv("SESSION_MAX_TURNS", "8")),
+    context_turns=int(os.getenv("SESSION_CONTEXT_TURNS", "4")),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "1800")),
+    max_bytes=int(os.getenv("SESSION_MAX_MB", "8")) * 1024 * 1024,
+    snapshot_path=os.getenv("SESSION_SNAPSHOT_PATH") or None
+)
+
+# Commandes identiques en cours (appareils d'un même foyer, retries) : un seul calcul
+command_coalescer = RequestCoalescer(
+    enabled=os.getenv("COALESCE_REQUESTS", "true").lower() == "true",
+    grace_period=float(os.getenv("COALESCE_GRACE_S", "5"))
+)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.on_event("startup")
+async def startup():
+    await http_client.start()
+    health_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    session_store.save()
+    await health_monitor.stop()
+    await http_client.close()
 
 class CommandRequest(BaseModel):
     user_id: str
     text: str
     context: Optional[list] = []
+    speak: bool = True
+    use_session: bool = True  # False : ni contexte de session ajouté, ni tour enregistré
+    use_cache: bool = True  # False pour les demandes dépendant de l'instant (cache de réponses du LLM)
 
 class CommandResponse(BaseModel):
     response_text: str
     audio_url: Optional[str] = None
+    audio_segments: Optional[list] = []
     actions: Optional[list] = []
 
 @app.get("/health")
@@ -47,113 +148,332 @@ async def health():
             "stt": STT_HOST,
             "tts": TTS_HOST,
             "llm": LLM_HOST,
-            "vision": VISION_HOST
-        }
+            "vision": VISION_HOST,
+            "memory": MEMORY_HOST,
+            "action_exec": ACTION_EXEC_HOST
+        },
+        "http_client": http_client.stats(),
+        "audio_store": audio_store.stats(),
+        "admission": admission.stats(),
+        "coalescing": command_coalescer.stats(),
+        "sessions": session_store.stats()
     }
 
 @app.post("/command", response_model=CommandResponse)
-async def process_command(request: CommandRequest):
+async def process_command(request: CommandRequest, http_request: Request):
+    """
+    Admission (débit utilisateur) puis traitement de la commande. Une
+    commande identique déjà en cours (même utilisateur, texte normalisé et
+    contexte) est attendue au lieu d'être recalculée.
+    """
+    admission.check_rate(request.user_id)
+    key = command_coalescer.make_key(request.user_id, request.text, request.context,
+                                     speak=request.speak, use_session=request.use_session,
+                                     use_cache=request.use_cache)
+    return await cancel_on_disconnect(
+        http_request,
+        command_coalescer.run(key, lambda: run_admitted_command(request))
+    )
+
+async def run_admitted_command(request: CommandRequest) -> CommandResponse:
+    """Calcul partagé : un seul créneau LLM quel que soit le nombre de clients."""
+    async with admission.slot("llm"):
+        return await run_command(request)
+
+async def run_command(request: CommandRequest) -> CommandResponse:
     """
     Traite une commande texte et retourne la réponse de JARVIS.
-    Workflow: text -> LLM -> actions -> TTS -> response
+    Workflow: text -> LLM (streaming) -> TTS par phrase -> response
+    Chaque phrase de l'explication part au TTS dès qu'elle est complète ;
+    `audio_url` décrit les segments, lisibles avant la fin de la synthèse.
+    Les derniers échanges de l'utilisateur complètent le contexte fourni.
     """
+    # Échanges de session à part : le LLM les exclut de la clé de son cache de réponses
+    session = session_store.context(request.user_id) if request.use_session else []
+    
+    clip = audio_store.create(request.user_id) if request.speak else None
+    
+    def speak(sentences: list) -> None:
+        for sentence in sentences:
+            audio_store.add_segment(
+                clip, sentence,
+                lambda text: synthesize_speech(http_client, TTS_HOST, text, voice=TTS_VOICE)
+            )
+    
     try:
-        # Appel au LLM agent
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"http://{LLM_HOST}/think",
-                json={
-                    "user_id": request.user_id,
-                    "input": request.text,
-                    "context": request.context,
-                    "tools": ["action_exec", "memory", "notify"]
-                }
-            ) as resp:
-                if resp.status != 200:
-                    raise HTTPException(status_code=500, detail="LLM service error")
-                llm_response = await resp.json()
+        # Appel au LLM agent (streaming SSE)
+        splitter = SentenceSplitter()
+        spoken = False
+        llm_response = None
+        async with http_client.stream(
+            "POST",
+            f"http://{LLM_HOST}/think/stream",
+            json={
+                "user_id": request.user_id,
+                "input": request.text,
+                "context": request.context or [],
+                "session": session,
+                "tools": ["action_exec", "memory", "notify"],
+                "use_cache": request.use_cache
+            },
+            timeout=LLM_TIMEOUT
+        ) as resp:
+            if resp.status == 429:
+                raise HTTPException(
+                    status_code=429,
+                    detail="LLM service overloaded",
+                    headers={"Retry-After": resp.headers.get("Retry-After", "1")}
+                )
+            if resp.status != 200:
+                raise HTTPException(status_code=500, detail="LLM service error")
+            async for event, data in iter_sse(resp.content):
+                if event == "explanation":
+                    spoken = True
+                    if clip:
+                        speak(splitter.feed(data["text"]))
+                elif event == "result":
+                    llm_response = data
+                elif event == "error":
+                    raise HTTPException(status_code=500, detail=data.get("detail", "LLM service error"))
+        
+        if llm_response is None:
+            raise HTTPException(status_code=500, detail="LLM service error")
         
         # TODO: Exécuter tool_calls si nécessaire
-        # TODO: Générer audio via TTS
+        
+        if request.use_session:
+            session_store.add_turn(request.user_id, request.text, llm_response.get("explanation", ""))
+        
+        audio_url = None
+        audio_segments = []
+        if clip:
+            if not spoken:
+                splitter.feed(llm_response.get("explanation", ""))
+            speak(splitter.flush())
+            audio_store.finish(clip)
+            if clip.segments:
+                audio_url = f"/audio/{clip.id}"
+                audio_segments = [f"/audio/{clip.id}/{segment.index}" for segment in clip.segments]
+            else:
+                audio_store.discard(clip.id)
         
         return CommandResponse(
             response_text=llm_response.get("explanation", "Commande reçue."),
+            audio_url=audio_url,
+            audio_segments=audio_segments,
             actions=llm_response.get("tool_calls", [])
         )
     
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="LLM service unavailable",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Échec ou client parti avant la réponse : abandonner les synthèses
+        if clip and not clip.complete:
+            audio_store.discard(clip.id)
+
+@app.get("/audio/{clip_id}")
+async def get_audio_clip(clip_id: str):
+    """Segments audio d'une réponse /command (état de synthèse et URLs)."""
+    clip = audio_store.get(clip_id)
+    if clip is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired audio clip")
+    return audio_store.manifest(clip, base_url="/audio")
+
+@app.get("/audio/{clip_id}/{index}")
+async def get_audio_segment(clip_id: str, index: int):
+    """Segment WAV d'une réponse ; attend la fin de sa synthèse si nécessaire."""
+    clip = audio_store.get(clip_id)
+    if clip is None or not 0 <= index < len(clip.segments):
+        raise HTTPException(status_code=404, detail="Unknown or expired audio segment")
+    try:
+        audio = await audio_store.wait_segment(clip, index, timeout=float(os.getenv("AUDIO_SEGMENT_WAIT", "30")))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Audio segment not ready")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"TTS synthesis failed: {e}")
+    return Response(content=audio, media_type="audio/wav")
+
+@app.get("/session/{user_id}")
+async def get_session(user_id: str):
+    """Derniers échanges conservés pour un utilisateur."""
+    return {"user_id": user_id, "turns": session_store.turns(user_id)}
+
+@app.delete("/session/{user_id}")
+async def clear_session(user_id: str):
+    """Oublie le contexte conversationnel d'un utilisateur."""
+    return {"user_id": user_id, "cleared": session_store.clear(user_id)}
 
 @app.websocket("/voice/stream")
-async def voice_stream(websocket: WebSocket):
+async def voice_stream(websocket: WebSocket, user_id: str = "default"):
     """
     Websocket pour streaming audio bidirectionnel.
     Client envoie audio -> STT -> LLM -> TTS -> Client reçoit audio
+    Les étapes sont pipelinées (cf. voice_pipeline.VoiceSession).
     """
     await websocket.accept()
     try:
-        while True:
-            # Reçoit chunks audio du client
-            audio_data = await websocket.receive_bytes()
-            
-            # TODO: Envoyer à STT service
-            # TODO: Traiter avec LLM
-            # TODO: Générer réponse TTS
-            # TODO: Streamer audio au client
-            
-            await websocket.send_json({
-                "status": "processing",
-                "message": "Audio reçu, traitement en cours..."
-            })
+        # Une session vocale occupe un créneau "voice" sans file d'attente
+        admission.check_rate(user_id)
+        await admission.acquire("voice", timeout=0)
+    except AdmissionRejected as e:
+        await websocket.send_json({
+            "type": "error",
+            "stage": "admission",
+            "status": e.status_code,
+            "detail": e.detail,
+            "retry_after": e.retry_after
+        })
+        await websocket.close(code=1013)
+        return
     
+    session = VoiceSession(
+        websocket,
+        http_client,
+        stt_host=STT_HOST,
+        llm_host=LLM_HOST,
+        tts_host=TTS_HOST,
+        user_id=user_id,
+        sample_rate=int(os.getenv("VOICE_SAMPLE_RATE", "16000")),
+        voice=os.getenv("VOICE_TTS_VOICE", "jarvis_fr"),
+        stt_profile=os.getenv("VOICE_STT_PROFILE", "command") or None,
+        vad_threshold=float(os.getenv("VOICE_VAD_THRESHOLD", "500")),
+        silence_ms=int(os.getenv("VOICE_SILENCE_MS", "600")),
+        partial_interval_ms=int(os.getenv("VOICE_PARTIAL_INTERVAL_MS", "500")),
+        max_utterance_s=float(os.getenv("VOICE_MAX_UTTERANCE_S", "30")),
+        llm_timeout=LLM_TIMEOUT,
+        admission=admission,
+        session_store=session_store
+    )
+    try:
+        await session.run()
     except WebSocketDisconnect:
-        print("Client disconnected from voice stream")
+        pass
+    finally:
+        admission.release("voice")
+    print("Client disconnected from voice stream")
+
+@app.post(
+    "/vision/upload",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+)
+async def upload_vision(request: Request, user_id: str = "default"):
+    """Admission (débit utilisateur, créneau Vision) puis relais de l'upload."""
+    async with admission.admit(user_id, "vision"):
+        return await forward_vision_upload(request, user_id)
 
-@app.post("/vision/upload")
-async def upload_vision(file: UploadFile = File(...), user_id: str = "default"):
+async def forward_vision_upload(request: Request, user_id: str) -> dict:
     """
     Upload d'image ou vidéo pour analyse Vision.
+    Le corps multipart (champ `file`, options de /analyze en champs de
+    formulaire) est relayé tel quel, par morceaux, au service Vision : le
+    bridge ne garde jamais le fichier complet en mémoire. Le morceau suivant
+    n'est lu que lorsque le précédent a été écrit vers le service Vision
+    (contre-pression jusqu'au client).
     """
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=415, detail="multipart/form-data expected")
+    
+    declared_size = request.headers.get("content-length")
+    if declared_size:
+        try:
+            size = int(declared_size)
+        except ValueError:
+            size = -1
+        if size < 0:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+        if size > VISION_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload too large (max {VISION_MAX_UPLOAD_BYTES} bytes)")
+        declared_size = str(size)
+    
+    received = 0
+    too_large = False
+    
+    async def body():
+        nonlocal received, too_large
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > VISION_MAX_UPLOAD_BYTES:
+                too_large = True
+                raise ValueError("Upload too large")
+            yield chunk
+    
+    headers = {"Content-Type": content_type}
+    if declared_size:
+        headers["Content-Length"] = declared_size
+    
     try:
-        contents = await file.read()
-        
-        # TODO: Envoyer au service Vision
-        # TODO: Retourner objets détectés, texte OCR, etc.
+        async with http_client.stream(
+            "POST",
+            f"http://{VISION_HOST}/analyze",
+            data=body(),
+            headers=headers,
+            timeout=VISION_TIMEOUT
+        ) as resp:
+            payload = await resp.read()
+            if resp.status != 200:
+                status_code = resp.status if 400 <= resp.status < 500 else 502
+                try:
+                    detail = json.loads(payload).get("detail", "Vision service error")
+                except ValueError:
+                    detail = "Vision service error"
+                raise HTTPException(status_code=status_code, detail=detail)
         
         return {
-            "status": "received",
-            "filename": file.filename,
-            "size": len(contents),
-            "analysis": "Vision service en cours d'implémentation"
+            "status": "analyzed",
+            "user_id": user_id,
+            "size": received,
+            "analysis": json.loads(payload)
         }
     
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Vision service unavailable",
+            headers={"Retry-After": str(max(1, int(e.retry_after)))}
+        )
     except Exception as e:
+        if too_large:
+            raise HTTPException(status_code=413, detail=f"Upload too large (max {VISION_MAX_UPLOAD_BYTES} bytes)")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/status")
 async def get_status():
-    """Status complet de tous les services connectés."""
-    services_status = {}
-    
-    # Test connexion à chaque service
-    services = {
-        "llm": f"http://{LLM_HOST}/health",
-        # "stt": f"http://{STT_HOST}/health",
-        # "tts": f"http://{TTS_HOST}/health",
-        # "vision": f"http://{VISION_HOST}/health"
-    }
-    
-    async with aiohttp.ClientSession() as session:
-        for name, url in services.items():
-            try:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=2)) as resp:
-                    services_status[name] = "healthy" if resp.status == 200 else "unhealthy"
-            except:
-                services_status[name] = "unreachable"
-    
+    """
+    Status de tous les services connectés, depuis le cache du moniteur
+    (aucune sonde pendant la requête). `details` : latence de la dernière
+    sonde, échecs consécutifs, dernière erreur.
+    """
+    details = health_monitor.snapshot()
     return {
         "bridge": "healthy",
-        "services": services_status,
+        "overall": health_monitor.overall(),
+        "services": {name: entry["status"] for name, entry in details.items()},
+        "details": details,
+        "check_interval": health_monitor.interval,
         "timestamp": datetime.utcnow().isoformat()
     }
 
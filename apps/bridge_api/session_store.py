@@ -0,0 +1,163 @@
+from typing import Any, Deque, Dict, List, Optional
+from collections import OrderedDict, deque
+import json
+import os
+import time
+
+
+class Session:
+    """Derniers échanges d'un utilisateur (buffer circulaire de `max_turns` tours)."""
+
+    def __init__(self, user_id: str, max_turns: int):
+        self.user_id = user_id
+        self.turns: Deque[Dict[str, Any]] = deque(maxlen=max_turns)
+        self.last_seen = time.time()
+        self.size = 0
+
+    def add(self, turn: Dict[str, Any]) -> None:
+        self.turns.append(turn)
+        self.last_seen = turn["at"]
+        self.size = sum(_turn_size(t) for t in self.turns)
+
+
+def _turn_size(turn: Dict[str, Any]) -> int:
+    return len(turn["user"].encode("utf-8")) + len(turn["assistant"].encode("utf-8"))
+
+
+class SessionStore:
+    """
+    Contexte conversationnel court terme du bridge, en mémoire : les derniers
+    tours de chaque utilisateur sont ajoutés au contexte envoyé au LLM sans
+    aller-retour vers Memory/Chroma.
+    Éviction des sessions inactives depuis `idle_ttl` et des moins récemment
+    actives au-delà de `max_bytes` de texte ; snapshot JSON optionnel à l'arrêt.
+    """
+
+    def __init__(self, max_turns: int = 8, context_turns: int = 4, idle_ttl: float = 1800.0,
+                 max_bytes: int = 8 * 1024 * 1024, max_chars: int = 500,
+                 snapshot_path: Optional[str] = None):
+        self.max_turns = max_turns
+        self.context_turns = context_turns
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.snapshot_path = snapshot_path
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.snapshot_path:
+            self.load()
+
+    def _purge(self) -> None:
+        cutoff = time.time() - self.idle_ttl
+        # Sessions ordonnées par activité : les inactives sont en tête
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_seen > cutoff:
+                break
+            self._drop(session.user_id)
+            self.expirations += 1
+
+        while self._sessions and self._bytes > self.max_bytes:
+            self._drop(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def _drop(self, user_id: str) -> None:
+        session = self._sessions.pop(user_id)
+        self._bytes -= session.size
+
+    def add_turn(self, user_id: str, user_text: str, assistant_text: str) -> None:
+        """Enregistre un échange (textes tronqués à `max_chars`)."""
+        if self.max_turns <= 0:
+            return
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = Session(user_id, self.max_turns)
+            self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+
+        previous_size = session.size
+        session.add({
+            "user": user_text.strip()[:self.max_chars],
+            "assistant": assistant_text.strip()[:self.max_chars],
+            "at": time.time(),
+        })
+        self._bytes += session.size - previous_size
+        self._purge()
+
+    def context(self, user_id: str) -> List[str]:
+        """Derniers échanges, du plus récent au plus ancien, au format snippet de contexte."""
+        self._purge()
+        session = self._sessions.get(user_id)
+        if session is None or self.context_turns <= 0:
+            return []
+        recent = list(session.turns)[-self.context_turns:]
+        return [
+            f"Échange récent — utilisateur : « {turn['user']} » ; JARVIS : « {turn['assistant']} »"
+            for turn in reversed(recent)
+        ]
+
+    def turns(self, user_id: str) -> List[Dict[str, Any]]:
+        self._purge()
+        session = self._sessions.get(user_id)
+        return list(session.turns) if session else []
+
+    def clear(self, user_id: str) -> bool:
+        if user_id not in self._sessions:
+            return False
+        self._drop(user_id)
+        return True
+
+    def load(self) -> None:
+        """Recharge le snapshot disque (sessions encore actives uniquement)."""
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                sessions = json.load(f)
+            cutoff = time.time() - self.idle_ttl
+            for user_id, turns in sessions.items():
+                turns = [turn for turn in turns if turn["at"] > cutoff]
+                if not turns:
+                    continue
+                session = Session(user_id, self.max_turns)
+                for turn in turns:
+                    session.add(turn)
+                self._sessions[user_id] = session
+                self._bytes += session.size
+            # Ordre d'activité, puis respect du plafond mémoire
+            self._sessions = OrderedDict(sorted(self._sessions.items(), key=lambda item: item[1].last_seen))
+            self._purge()
+            print(f"✅ Sessions restored: {len(self._sessions)}")
+        except Exception as e:
+            print(f"Sessions load error: {e}")
+
+    def save(self) -> None:
+        """Écrit le snapshot disque de manière atomique."""
+        if not self.snapshot_path:
+            return
+        self._purge()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_path)), exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({user_id: list(session.turns) for user_id, session in self._sessions.items()},
+                          f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"Sessions save error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        self._purge()
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_turns": self.max_turns,
+            "context_turns": self.context_turns,
+            "idle_ttl_seconds": self.idle_ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
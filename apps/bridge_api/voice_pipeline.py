@@ -0,0 +1,426 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from array import array
+from contextlib import nullcontext
+import asyncio
+import io
+import json
+import math
+import re
+import sys
+import time
+import wave
+
+import aiohttp
+from fastapi import WebSocket
+
+from common.http_client import HTTPClient
+from common.instrumentation import span, record_span
+from admission import AdmissionController, AdmissionRejected
+from session_store import SessionStore
+
+# Fin de phrase : ponctuation forte suivie d'un espace (évite de couper "3.5")
+_SENTENCE_END = re.compile(r"[.!?…]+[\"»)\]]*\s+|\n+")
+
+
+class SentenceSplitter:
+    """
+    Découpe un texte reçu par fragments en phrases complètes, dès que la
+    ponctuation finale est confirmée par l'espace qui la suit.
+    Les phrases trop courtes ("Oui.") sont regroupées avec la suivante pour
+    limiter le nombre d'appels TTS.
+    """
+
+    def __init__(self, min_chars: int = 12):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Retourne le texte restant (fin de réponse)."""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+class EnergyVAD:
+    """
+    Détection d'activité vocale par énergie (PCM 16 bits mono).
+    - speech_start : énergie au-dessus du seuil pendant `min_speech_ms`
+    - speech_end : silence continu pendant `silence_ms` après de la parole
+    """
+
+    def __init__(self, sample_rate: int = 16000, threshold: float = 500.0,
+                 min_speech_ms: int = 150, silence_ms: int = 600):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.min_speech_ms = min_speech_ms
+        self.silence_ms = silence_ms
+        self.in_speech = False
+        self._voiced_ms = 0.0
+        self._silent_ms = 0.0
+
+    def _rms(self, pcm: bytes) -> float:
+        samples = array("h")
+        samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        if not samples:
+            return 0.0
+        return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+    def process(self, pcm: bytes) -> Optional[str]:
+        duration_ms = len(pcm) / 2 / self.sample_rate * 1000
+        voiced = self._rms(pcm) >= self.threshold
+
+        if not self.in_speech:
+            self._voiced_ms = self._voiced_ms + duration_ms if voiced else 0.0
+            if self._voiced_ms >= self.min_speech_ms:
+                self.in_speech = True
+                self._silent_ms = 0.0
+                return "speech_start"
+            return None
+
+        self._silent_ms = 0.0 if voiced else self._silent_ms + duration_ms
+        if self._silent_ms >= self.silence_ms:
+            self.reset()
+            return "speech_end"
+        return None
+
+    def reset(self) -> None:
+        self.in_speech = False
+        self._voiced_ms = 0.0
+        self._silent_ms = 0.0
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Encapsule du PCM 16 bits mono dans un conteneur WAV."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+async def synthesize_speech(http_client: HTTPClient, tts_host: str, text: str,
+                            voice: str = "jarvis_fr", language: str = "fr") -> bytes:
+    """Synthétise une phrase via le service TTS et retourne le WAV."""
+    resp = await http_client.post(
+        f"http://{tts_host}/synthesize",
+        json={"text": text, "voice": voice, "language": language},
+        idempotent=True
+    )
+    if resp.status != 200:
+        raise RuntimeError(f"TTS service error: {resp.status}")
+    return resp.body
+
+
+async def iter_sse(content: aiohttp.StreamReader) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Lit un flux Server-Sent Events et produit des couples (event, data)."""
+    event, data_lines = "message", []
+    async for raw_line in content:
+        line = raw_line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+class VoiceSession:
+    """
+    Boucle vocale full-duplex sur un websocket.
+    Client -> serveur :
+    - frames binaires : PCM 16 bits mono little-endian à `sample_rate`
+    - {"type": "start", "user_id", "sample_rate", "language", "use_cache"} : configuration
+    - {"type": "end_of_utterance"} : fin d'énoncé forcée (push-to-talk)
+    - {"type": "cancel"} : interrompt la réponse en cours
+    Serveur -> client (JSON, puis audio en frames binaires) :
+    - partial / final : transcription intermédiaire / définitive
+    - explanation : fragment de réponse du LLM
+    - audio : en-tête {index, text, bytes} suivi d'une frame binaire WAV
+    - result : réponse complète du LLM ; barge_in / error
+    Les étapes se chevauchent : le LLM démarre dès l'énoncé final, chaque
+    phrase terminée part au TTS pendant que la génération continue, et une
+    reprise de parole de l'utilisateur annule la réponse en cours.
+    """
+
+    def __init__(self, websocket: WebSocket, http_client: HTTPClient, stt_host: str, llm_host: str,
+                 tts_host: str, user_id: str = "default", sample_rate: int = 16000,
+                 language: Optional[str] = None, voice: str = "jarvis_fr", vad_threshold: float = 500.0,
+                 silence_ms: int = 600, partial_interval_ms: int = 500, max_utterance_s: float = 30.0,
+                 llm_timeout: float = 120.0, admission: Optional[AdmissionController] = None,
+                 session_store: Optional[SessionStore] = None, stt_profile: Optional[str] = "command"):
+        self.websocket = websocket
+        self.http_client = http_client
+        self.stt_host = stt_host
+        self.llm_host = llm_host
+        self.tts_host = tts_host
+        self.user_id = user_id
+        self.sample_rate = sample_rate
+        self.language = language
+        # Profil de décodage STT des énoncés finaux (commandes courtes : greedy)
+        self.stt_profile = stt_profile
+        # False : chaque énoncé est régénéré par le LLM (demandes dépendant de l'instant)
+        self.use_cache = True
+        self.voice = voice
+        self.partial_interval_ms = partial_interval_ms
+        self.max_utterance_s = max_utterance_s
+        self.llm_timeout = llm_timeout
+        self.admission = admission
+        self.session_store = session_store
+
+        self.vad = EnergyVAD(sample_rate=sample_rate, threshold=vad_threshold, silence_ms=silence_ms)
+        self.utterance = bytearray()
+        self._partial_mark = 0
+        self._partial_task: Optional[asyncio.Task] = None
+        self._response_task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    # --- Envoi (plusieurs tâches écrivent sur le même socket) ---
+
+    async def send_json(self, payload: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(payload)
+
+    async def send_audio(self, header: Dict[str, Any], audio: bytes) -> None:
+        # En-tête et données envoyés sans entrelacement possible
+        async with self._send_lock:
+            await self.websocket.send_json(header)
+            await self.websocket.send_bytes(audio)
+
+    # --- Réception ---
+
+    async def run(self) -> None:
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await self.on_audio(message["bytes"])
+                elif message.get("text"):
+                    await self.on_control(json.loads(message["text"]))
+        finally:
+            await self.cancel_response()
+            if self._partial_task:
+                self._partial_task.cancel()
+
+    async def on_control(self, message: Dict[str, Any]) -> None:
+        kind = message.get("type")
+        if kind == "start":
+            self.user_id = message.get("user_id", self.user_id)
+            self.language = message.get("language", self.language)
+            self.use_cache = bool(message.get("use_cache", self.use_cache))
+            self.sample_rate = int(message.get("sample_rate", self.sample_rate))
+            self.vad.sample_rate = self.sample_rate
+        elif kind == "end_of_utterance":
+            self.vad.reset()
+            await self.end_utterance()
+        elif kind == "cancel":
+            await self.cancel_response()
+
+    @property
+    def responding(self) -> bool:
+        return self._response_task is not None and not self._response_task.done()
+
+    async def on_audio(self, chunk: bytes) -> None:
+        event = self.vad.process(chunk)
+
+        if event == "speech_start" and self.responding:
+            # Barge-in : l'utilisateur reprend la parole pendant la réponse
+            await self.cancel_response()
+            await self.send_json({"type": "barge_in"})
+
+        self.utterance += chunk
+        if not self.vad.in_speech and event != "speech_end":
+            # Hors parole : ne conserver qu'un court pré-roulage (300 ms)
+            preroll = int(self.sample_rate * 2 * 0.3)
+            if len(self.utterance) > preroll:
+                del self.utterance[:len(self.utterance) - preroll]
+            self._partial_mark = 0
+            return
+
+        if event == "speech_end" or len(self.utterance) >= self.max_utterance_s * self.sample_rate * 2:
+            self.vad.reset()
+            await self.end_utterance()
+            return
+
+        # Transcription partielle périodique (une seule en vol)
+        interval = int(self.sample_rate * 2 * self.partial_interval_ms / 1000)
+        if len(self.utterance) - self._partial_mark >= interval and \
+                (self._partial_task is None or self._partial_task.done()):
+            self._partial_mark = len(self.utterance)
+            self._partial_task = asyncio.create_task(self.send_partial(bytes(self.utterance)))
+
+    async def end_utterance(self) -> None:
+        pcm = bytes(self.utterance)
+        self.utterance.clear()
+        self._partial_mark = 0
+        if self._partial_task:
+            self._partial_task.cancel()
+        if len(pcm) < self.sample_rate * 2 * 0.2:
+            return
+        await self.cancel_response()
+        self._response_task = asyncio.create_task(self.respond(pcm))
+
+    async def cancel_response(self) -> None:
+        task = self._response_task
+        self._response_task = None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    # --- Étapes du pipeline ---
+
+    async def transcribe(self, pcm: bytes, final: bool) -> str:
+        form = aiohttp.FormData()
+        field = "audio" if final else "audio_chunk"
+        form.add_field(field, pcm_to_wav(pcm, self.sample_rate), filename="utterance.wav",
+                       content_type="audio/wav")
+        if final and self.language:
+            form.add_field("language", self.language)
+        if final and self.stt_profile:
+            form.add_field("profile", self.stt_profile)
+        endpoint = "/transcribe" if final else "/transcribe/stream"
+        resp = await self.http_client.post(f"http://{self.stt_host}{endpoint}", data=form, retries=0)
+        if resp.status != 200:
+            raise RuntimeError(f"STT service error: {resp.status}")
+        result = resp.json()
+        return (result.get("text") if final else result.get("partial_text")) or ""
+
+    async def send_partial(self, pcm: bytes) -> None:
+        try:
+            text = await self.transcribe(pcm, final=False)
+            if text and self.vad.in_speech:
+                await self.send_json({"type": "partial", "text": text})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Partial transcription error: {e}")
+
+    async def synthesize(self, text: str) -> bytes:
+        return await synthesize_speech(self.http_client, self.tts_host, text, self.voice, self.language or "fr")
+
+    async def respond(self, pcm: bytes) -> None:
+        """Un tour de conversation, tracé de bout en bout (span voice.turn)."""
+        with span("voice.turn", user_id=self.user_id, audio_bytes=len(pcm)):
+            await self._respond(pcm)
+
+    async def _respond(self, pcm: bytes) -> None:
+        """STT final -> LLM en streaming -> TTS par phrase -> audio au client."""
+        turn_start = time.time()
+        tts_queue: asyncio.Queue = asyncio.Queue()
+        tts_tasks: List[asyncio.Task] = []
+
+        async def audio_sender() -> None:
+            index = 0
+            while True:
+                item = await tts_queue.get()
+                if item is None:
+                    return
+                text, task = item
+                try:
+                    audio = await task
+                    if index == 0:
+                        # Latence perçue : fin d'énoncé -> premier audio envoyé
+                        record_span("voice.first_audio", turn_start, time.time() - turn_start)
+                    await self.send_audio(
+                        {"type": "audio", "index": index, "text": text, "format": "wav", "bytes": len(audio)},
+                        audio
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await self.send_json({"type": "error", "stage": "tts", "detail": str(e)})
+                index += 1
+
+        def speak(sentence: str) -> None:
+            task = asyncio.create_task(self.synthesize(sentence))
+            tts_tasks.append(task)
+            tts_queue.put_nowait((sentence, task))
+
+        sender = asyncio.create_task(audio_sender())
+        try:
+            text = await self.transcribe(pcm, final=True)
+            await self.send_json({"type": "final", "text": text})
+            if not text.strip():
+                return
+
+            splitter = SentenceSplitter()
+            spoken = False
+            result = None
+            # Chaque énoncé compte dans le débit utilisateur et la limite du LLM
+            admitted = self.admission.admit(self.user_id, "llm") if self.admission else nullcontext()
+            async with admitted, self.http_client.stream(
+                "POST",
+                f"http://{self.llm_host}/think/stream",
+                json={
+                    "user_id": self.user_id,
+                    "input": text,
+                    "session": self.session_store.context(self.user_id) if self.session_store else [],
+                    "tools": ["action_exec", "memory", "notify"],
+                    "use_cache": self.use_cache
+                },
+                timeout=self.llm_timeout
+            ) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"LLM service error: {resp.status}")
+                async for event, data in iter_sse(resp.content):
+                    if event == "explanation":
+                        spoken = True
+                        await self.send_json({"type": "explanation", "text": data["text"]})
+                        for sentence in splitter.feed(data["text"]):
+                            speak(sentence)
+                    elif event == "result":
+                        result = data
+                    elif event == "error":
+                        raise RuntimeError(data.get("detail", "LLM processing error"))
+
+            if result is not None and self.session_store:
+                self.session_store.add_turn(self.user_id, text, result.get("explanation", ""))
+            if not spoken and result:
+                splitter.feed(result.get("explanation", ""))
+            for sentence in splitter.flush():
+                speak(sentence)
+            tts_queue.put_nowait(None)
+            await sender
+
+            if result is not None:
+                await self.send_json({"type": "result", "response": result})
+
+        except asyncio.CancelledError:
+            raise
+        except AdmissionRejected as e:
+            await self.send_json({
+                "type": "error",
+                "stage": "admission",
+                "status": e.status_code,
+                "detail": e.detail,
+                "retry_after": e.retry_after
+            })
+        except Exception as e:
+            await self.send_json({"type": "error", "stage": "pipeline", "detail": str(e)})
+        finally:
+            # Annulation (barge-in, déconnexion) : libérer LLM et TTS en cours
+            sender.cancel()
+            for task in tts_tasks:
+                task.cancel()
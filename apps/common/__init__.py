@@ -0,0 +1 @@
+"""Modules partagés entre les services JARVIS."""
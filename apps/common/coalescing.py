@@ -0,0 +1,124 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import copy
+import hashlib
+import json
+
+from fastapi import HTTPException
+
+
+class _Flight:
+    """Calcul en cours partagé par toutes les requêtes identiques."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+        # Annulation différée programmée quand plus personne n'attend
+        self.abandon_handle: Optional[asyncio.TimerHandle] = None
+
+
+class RequestCoalescer:
+    """
+    Fusion des requêtes identiques en vol : la première lance le calcul dans
+    une tâche détachée, les suivantes l'attendent au lieu de le dupliquer, et
+    chacune reçoit sa propre copie du résultat (ou la même erreur).
+    Un client qui part ne fait qu'annuler son attente ; le calcul n'est
+    annulé que si personne ne l'a rejoint `grace_period` secondes après le
+    départ du dernier client (le retry d'un client ayant expiré le rejoint).
+    Seuls les calculs en cours sont partagés : une requête arrivée après la
+    fin du calcul est recalculée.
+    """
+
+    def __init__(self, enabled: bool = True, grace_period: float = 5.0):
+        self.enabled = enabled
+        self.grace_period = grace_period
+        self._flights: Dict[str, _Flight] = {}
+
+        # Compteurs
+        self.computed = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    @staticmethod
+    def make_key(user_id: str, text: str, context: Optional[Any] = None, **extra: Any) -> str:
+        """Clé : utilisateur, texte normalisé (casse, espaces) et empreinte du contexte."""
+        payload = json.dumps(
+            {"user_id": user_id, "text": " ".join(text.casefold().split()), "context": context or [], **extra},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await factory()
+
+        flight = self._flights.get(key)
+        if flight is None or flight.task.done():
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            self.computed += 1
+        else:
+            self.coalesced += 1
+
+        if flight.abandon_handle is not None:
+            flight.abandon_handle.cancel()
+            flight.abandon_handle = None
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Tous les clients sont partis : délai de grâce pour un retry
+                flight.abandon_handle = asyncio.get_running_loop().call_later(
+                    max(0.0, self.grace_period), self._abandon, flight
+                )
+        return copy.deepcopy(result)
+
+    def _abandon(self, flight: _Flight) -> None:
+        flight.abandon_handle = None
+        if flight.waiters == 0 and not flight.task.done():
+            # Personne n'est revenu : libérer LLM, TTS...
+            flight.task.cancel()
+            self.abandoned += 1
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "grace_period_seconds": self.grace_period,
+            "in_flight": len(self._flights),
+            "computed": self.computed,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+
+async def cancel_on_disconnect(request, awaitable: Awaitable[Any]) -> Any:
+    """
+    Attend `awaitable` tant que le client HTTP est connecté ; à la
+    déconnexion, l'attente est annulée (réponse 499, jamais reçue).
+    """
+    task = asyncio.ensure_future(awaitable)
+
+    async def disconnected() -> None:
+        # Corps déjà lu par FastAPI : le prochain message est la déconnexion
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if task.done() and not task.cancelled():
+        return task.result()
+    raise HTTPException(status_code=499, detail="Client disconnected")
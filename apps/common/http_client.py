@@ -0,0 +1,296 @@
+from typing import Any, Dict, Optional
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+
+from common.instrumentation import Span, SPAN_KIND_CLIENT, trace_headers
+
+# Statuts considérés comme une panne du service appelé (retry + disjoncteur)
+RETRYABLE_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(Exception):
+    """Le disjoncteur du service est ouvert : appel refusé sans connexion."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Circuit open for {host} (retry in {retry_after:.1f}s)")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur par hôte :
+    - closed : appels normaux, les échecs consécutifs sont comptés
+    - open : après `failure_threshold` échecs, appels refusés pendant `reset_timeout`
+    - half_open : un seul appel d'essai ; succès -> closed, échec -> open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class ServiceResponse:
+    """Réponse HTTP entièrement lue (la connexion est rendue au pool)."""
+
+    def __init__(self, status: int, headers: Dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+class HTTPClient:
+    """
+    Client HTTP partagé entre les appels inter-services.
+    - une session aiohttp créée au démarrage de l'app, fermée à l'arrêt
+    - pool de connexions keep-alive par hôte (limit_per_host)
+    - timeouts configurables, par défaut et par appel
+    - retries avec backoff exponentiel à jitter complet : erreurs de
+      connexion toujours, timeouts et 502/503/504 pour les méthodes idempotentes
+    - disjoncteur par hôte pour ne pas attendre un service tombé
+    """
+
+    def __init__(self, timeout: float = 30.0, connect_timeout: float = 2.0, retries: int = 2,
+                 backoff_base: float = 0.1, backoff_max: float = 2.0, limit_per_host: int = 16,
+                 keepalive_timeout: float = 30.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_env(cls) -> "HTTPClient":
+        return cls(
+            timeout=float(os.getenv("HTTP_TIMEOUT", "30")),
+            connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "2")),
+            retries=int(os.getenv("HTTP_RETRIES", "2")),
+            backoff_base=float(os.getenv("HTTP_BACKOFF_BASE", "0.1")),
+            backoff_max=float(os.getenv("HTTP_BACKOFF_MAX", "2")),
+            limit_per_host=int(os.getenv("HTTP_POOL_PER_HOST", "16")),
+            keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30")),
+            failure_threshold=int(os.getenv("HTTP_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("HTTP_BREAKER_RESET", "30")),
+        )
+
+    async def start(self) -> None:
+        """Crée la session (à appeler au démarrage de l'app)."""
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+        )
+
+    async def close(self) -> None:
+        """Ferme la session et ses connexions (à appeler à l'arrêt de l'app)."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _session(self) -> aiohttp.ClientSession:
+        # Création paresseuse si l'app n'a pas appelé start() (scripts, tests)
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+
+    def _host(self, url: str) -> str:
+        return urlsplit(url).netloc
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self.counters[host] = {"requests": 0, "failures": 0, "retries": 0, "short_circuited": 0}
+        return self.breakers[host]
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _check_breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breaker(host)
+        if not breaker.allow():
+            self.counters[host]["short_circuited"] += 1
+            raise CircuitOpenError(host, breaker.retry_after())
+        return breaker
+
+    def _timeout(self, timeout: Optional[float]) -> Optional[aiohttp.ClientTimeout]:
+        if timeout is None:
+            return None
+        return aiohttp.ClientTimeout(total=timeout, connect=min(self.connect_timeout, timeout))
+
+    async def request(self, method: str, url: str, *, timeout: Optional[float] = None,
+                      retries: Optional[int] = None, idempotent: Optional[bool] = None,
+                      **kwargs: Any) -> ServiceResponse:
+        """
+        Envoie une requête et lit la réponse complète.
+        `idempotent` (par défaut selon la méthode) autorise le retry après un
+        timeout ou un 502/503/504 ; un POST non idempotent n'est rejoué que
+        si la connexion n'a pas pu être établie.
+        Lève CircuitOpenError, aiohttp.ClientError ou asyncio.TimeoutError.
+        """
+        method = method.upper()
+        host = self._host(url)
+        retries = self.retries if retries is None else retries
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        session = await self._session()
+
+        attempt = 0
+        while True:
+            breaker = self._check_breaker(host)
+            self.counters[host]["requests"] += 1
+            try:
+                with self._client_span(method, host, attempt) as client_span:
+                    async with session.request(method, url, timeout=self._timeout(timeout),
+                                               **self._with_trace(kwargs)) as resp:
+                        body = await resp.read()
+                        response = ServiceResponse(resp.status, dict(resp.headers), body)
+                    client_span.set_attribute("http.status_code", resp.status)
+            except aiohttp.ClientConnectorError:
+                # Requête jamais envoyée : rejouable quelle que soit la méthode
+                self._record_failure(host, breaker)
+                if attempt >= retries:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self._record_failure(host, breaker)
+                if not idempotent or attempt >= retries:
+                    raise
+            except BaseException:
+                # Annulation : libérer l'éventuel appel d'essai du disjoncteur
+                breaker.trial_in_flight = False
+                raise
+            else:
+                if response.status not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    return response
+                self._record_failure(host, breaker)
+                if not idempotent or attempt >= retries:
+                    return response
+
+            self.counters[host]["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _client_span(self, method: str, host: str, attempt: int = 0) -> Span:
+        return Span(f"http.client {host}", kind=SPAN_KIND_CLIENT,
+                    attributes={"http.method": method, "net.peer.name": host, "retry": attempt})
+
+    @staticmethod
+    def _with_trace(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Ajoute l'en-tête traceparent du span courant (le span client)."""
+        return {**kwargs, "headers": {**trace_headers(), **(kwargs.get("headers") or {})}}
+
+    def _record_failure(self, host: str, breaker: CircuitBreaker) -> None:
+        self.counters[host]["failures"] += 1
+        breaker.record_failure()
+
+    async def get(self, url: str, **kwargs: Any) -> ServiceResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> ServiceResponse:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, *, timeout: Optional[float] = None, **kwargs: Any):
+        """
+        Requête dont la réponse est consommée en flux (SSE, audio, upload).
+        Sans retry (le corps peut déjà être partiellement consommé) ; le
+        disjoncteur s'applique.
+        """
+        host = self._host(url)
+        breaker = self._check_breaker(host)
+        self.counters[host]["requests"] += 1
+        session = await self._session()
+        try:
+            async with self._client_span(method.upper(), host) as client_span, \
+                    session.request(method.upper(), url, timeout=self._timeout(timeout),
+                                    **self._with_trace(kwargs)) as resp:
+                client_span.set_attribute("http.status_code", resp.status)
+                if resp.status in RETRYABLE_STATUSES:
+                    self._record_failure(host, breaker)
+                else:
+                    breaker.record_success()
+                yield resp
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self._record_failure(host, breaker)
+            raise
+        finally:
+            breaker.trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            host: {
+                "state": breaker.state,
+                "consecutive_failures": breaker.failures,
+                **self.counters[host],
+            }
+            for host, breaker in self.breakers.items()
+        }
@@ -0,0 +1,383 @@
+from typing import Any, Dict, List, Optional, Tuple
+from contextvars import ContextVar
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+
+# Propagation W3C Trace Context entre services ; X-Trace-Id renvoyé au client
+TRACEPARENT_HEADER = "traceparent"
+TRACE_ID_HEADER = "X-Trace-Id"
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Types de span OTLP
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Histogram:
+    """Histogramme Prometheus (buckets cumulés), thread-safe."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            # [compteurs par bucket..., somme, nombre]
+            series = self._series.setdefault(labels, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+                sep = "," if base else ""
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {int(count)}')
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {int(series[-1])}')
+                lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+                lines.append(f"{self.name}_count{{{base}}} {int(series[-1])}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+HTTP_DURATION = Histogram(
+    "jarvis_http_request_duration_seconds",
+    "Durée des requêtes HTTP servies",
+    ("service", "method", "route", "status")
+)
+STAGE_DURATION = Histogram(
+    "jarvis_stage_duration_seconds",
+    "Durée des étapes de traitement (spans)",
+    ("service", "stage")
+)
+
+
+class Span:
+    """
+    Étape chronométrée d'une trace. S'utilise en `with` ou `async with` ;
+    les spans ouverts dans le même contexte (tâche asyncio, thread) en
+    deviennent les enfants.
+    """
+
+    def __init__(self, name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None,
+                 record_metric: bool = True):
+        parent = _current_span.get()
+        if trace_id is None and parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        self.name = name
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.record_metric = record_metric
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self.start_time = time.time()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Sortie dans un autre contexte (générateur repris ailleurs)
+                pass
+        self.end()
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.__exit__(exc_type, exc, tb)
+
+    def end(self, end_time: Optional[float] = None) -> None:
+        if self.end_time is not None:
+            return
+        self.end_time = end_time or time.time()
+        if self.record_metric:
+            STAGE_DURATION.observe(self.end_time - self.start_time, _state["service"], self.name)
+        if _state["exporter"] is not None:
+            _state["exporter"].submit(self)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("jarvis_current_span", default=None)
+_state: Dict[str, Any] = {"service": os.getenv("OTEL_SERVICE_NAME", "jarvis"), "exporter": None}
+
+
+def span(name: str, **attributes: Any) -> Span:
+    """Span d'une étape (ex: `with span("stt.decode", model="base"):`)."""
+    return Span(name, attributes=attributes)
+
+
+def record_span(name: str, start_time: float, duration: float, **attributes: Any) -> None:
+    """Enregistre une étape déjà mesurée (ex: timings remontés par un worker)."""
+    recorded = Span(name, attributes=attributes)
+    recorded.start_time = start_time
+    recorded.end(start_time + duration)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    active = _current_span.get()
+    return active.trace_id if active else None
+
+
+def trace_headers() -> Dict[str, str]:
+    """En-têtes à ajouter aux appels sortants pour prolonger la trace courante."""
+    active = _current_span.get()
+    return {TRACEPARENT_HEADER: active.traceparent()} if active else {}
+
+
+def _parse_parent(headers: Dict[bytes, bytes]) -> Tuple[Optional[str], Optional[str]]:
+    traceparent = headers.get(b"traceparent", b"").decode("latin-1").strip().lower()
+    match = _TRACEPARENT.match(traceparent)
+    if match:
+        return match.group(1), match.group(2)
+    trace_id = headers.get(TRACE_ID_HEADER.lower().encode(), b"").decode("latin-1").strip().lower()
+    if re.fullmatch(r"[0-9a-f]{32}", trace_id):
+        return trace_id, None
+    return None, None
+
+
+class OTLPExporter:
+    """
+    Export des spans au format OTLP/HTTP JSON vers un collecteur local
+    (ex: OpenTelemetry Collector, Jaeger, Tempo sur :4318). Envoi par lots
+    depuis un thread dédié ; en cas de saturation ou d'erreur, les spans
+    sont abandonnés sans impacter les requêtes.
+    """
+
+    def __init__(self, endpoint: str, service_name: str, batch_size: int = 256,
+                 flush_interval: float = 2.0, max_queue: int = 4096, timeout: float = 2.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=max_queue)
+        self.exported = 0
+        self.dropped = 0
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, finished: Span) -> None:
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._export(batch)
+            if stop:
+                return
+
+    def _encode(self, finished: Span) -> Dict[str, Any]:
+        encoded = {
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": finished.kind,
+            "startTimeUnixNano": str(int(finished.start_time * 1e9)),
+            "endTimeUnixNano": str(int(finished.end_time * 1e9)),
+            "attributes": [_otlp_attribute(k, v) for k, v in finished.attributes.items()],
+            "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+        }
+        if finished.parent_id:
+            encoded["parentSpanId"] = finished.parent_id
+        return encoded
+
+    def _export(self, batch: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "jarvis.instrumentation"},
+                    "spans": [self._encode(item) for item in batch],
+                }],
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+            self.exported += len(batch)
+        except Exception as e:
+            self.failures += 1
+            self.dropped += len(batch)
+            if self.failures == 1:
+                print(f"OTLP export error ({self.endpoint}): {e}")
+
+    def close(self) -> None:
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=self.timeout + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI : reprend (ou démarre) la trace de la requête entrante,
+    ouvre un span serveur couvrant toute la réponse (streaming compris),
+    renvoie X-Trace-Id et alimente l'histogramme des requêtes HTTP.
+    """
+
+    def __init__(self, app, service_name: str, excluded_paths: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.service_name = service_name
+        self.excluded_paths = excluded_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or scope.get("path") in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = _parse_parent(headers)
+        method = scope.get("method", "WS")
+        status = {"code": 500 if scope["type"] == "http" else 101}
+        server_span = Span(f"{method} {scope.get('path', '')}", trace_id=trace_id, parent_id=parent_id,
+                           kind=SPAN_KIND_SERVER, record_metric=False)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers") or []) + [
+                    (TRACE_ID_HEADER.lower().encode(), server_span.trace_id.encode())
+                ]
+            await send(message)
+
+        start = time.monotonic()
+        with server_span:
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                # Route déclarée (ex: /audio/{clip_id}) : cardinalité bornée
+                route = scope.get("route")
+                path = getattr(route, "path", None) or "unmatched"
+                server_span.name = f"{method} {path}"
+                server_span.set_attribute("http.route", path)
+                server_span.set_attribute("http.status_code", status["code"])
+                if scope["type"] == "http":
+                    HTTP_DURATION.observe(time.monotonic() - start, self.service_name, method, path,
+                                          str(status["code"]))
+
+
+def render_metrics() -> str:
+    lines = HTTP_DURATION.render() + STAGE_DURATION.render()
+    exporter = _state["exporter"]
+    if exporter is not None:
+        lines += [
+            "# HELP jarvis_otlp_spans_dropped_total Spans non exportés",
+            "# TYPE jarvis_otlp_spans_dropped_total counter",
+            f'jarvis_otlp_spans_dropped_total{{service="{_escape(_state["service"])}"}} {exporter.dropped}',
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def instrument_app(app, service_name: str) -> None:
+    """
+    Instrumente une app FastAPI : trace par requête (en-tête traceparent),
+    endpoint /metrics (format Prometheus) et export OTLP optionnel si
+    OTEL_EXPORTER_OTLP_ENDPOINT (ou ..._TRACES_ENDPOINT) est défini.
+    """
+    from fastapi.responses import PlainTextResponse
+
+    service_name = os.getenv("OTEL_SERVICE_NAME", service_name)
+    _state["service"] = service_name
+
+    traces_endpoint = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+    if not traces_endpoint and os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        traces_endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT").rstrip("/") + "/v1/traces"
+    if traces_endpoint and _state["exporter"] is None:
+        _state["exporter"] = OTLPExporter(traces_endpoint, service_name)
+
+    app.add_middleware(TracingMiddleware, service_name=service_name)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @app.on_event("shutdown")
+    async def flush_spans():
+        if _state["exporter"] is not None:
+            _state["exporter"].close()
+            _state["exporter"] = None
@@ -0,0 +1,70 @@
+from typing import Any, Callable, Dict, List, Optional
+import re
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def approximate_token_count(text: str) -> int:
+    """Estimation sans tokenizer (~4 caractères par token)."""
+    return max(1, len(text) // 4)
+
+
+class ContextPacker:
+    """
+    Sélectionne les snippets de contexte à injecter dans le prompt :
+    - contexte fourni par le client d'abord (ordre d'origine), puis
+      souvenirs triés par distance croissante (plus pertinents d'abord)
+    - dédoublonnage en conservant le premier rang
+    - remplissage glouton d'un budget de tokens mesuré avec le tokenizer du modèle
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None, token_budget: int = 512):
+        self.count_tokens = count_tokens or approximate_token_count
+        self.token_budget = token_budget
+
+    @staticmethod
+    def format_snippet(snippet: str) -> str:
+        """Ligne telle qu'insérée dans {{retrieved_memory_snippets}}."""
+        return f"- {snippet}"
+
+    def rank(self, provided: List[str], memories: List[Dict[str, Any]]) -> List[str]:
+        """Classe et dédoublonne les snippets candidats."""
+        ranked_memories = sorted(
+            memories,
+            key=lambda mem: mem.get("distance") if mem.get("distance") is not None else float("inf")
+        )
+        candidates = list(provided) + [mem["text"] for mem in ranked_memories]
+
+        seen = set()
+        ranked = []
+        for snippet in candidates:
+            snippet = snippet.strip()
+            key = _WHITESPACE.sub(" ", snippet).casefold()
+            if not snippet or key in seen:
+                continue
+            seen.add(key)
+            ranked.append(snippet)
+        return ranked
+
+    def pack(self, provided: List[str], memories: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Retourne les snippets retenus et le nombre de tokens consommés."""
+        snippets = []
+        used = 0
+        dropped = 0
+
+        for snippet in self.rank(provided, memories):
+            # +1 pour le saut de ligne entre deux snippets
+            cost = self.count_tokens(self.format_snippet(snippet)) + 1
+            if used + cost > self.token_budget:
+                # Un snippet trop long ne bloque pas les suivants, plus courts
+                dropped += 1
+                continue
+            snippets.append(snippet)
+            used += cost
+
+        return {
+            "snippets": snippets,
+            "tokens": used,
+            "dropped": dropped,
+            "budget": self.token_budget,
+        }
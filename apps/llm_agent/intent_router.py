@@ -0,0 +1,155 @@
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import copy
+import json
+import re
+from datetime import datetime
+
+import numpy as np
+
+from response_cache import normalize_input
+
+try:
+    from chromadb.utils import embedding_functions
+    EMBEDDINGS_AVAILABLE = True
+except ImportError:
+    EMBEDDINGS_AVAILABLE = False
+
+_DAYS_FR = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+_MONTHS_FR = ["janvier", "février", "mars", "avril", "mai", "juin", "juillet",
+              "août", "septembre", "octobre", "novembre", "décembre"]
+
+
+class _TemplateValues(dict):
+    """Laisse intacts les champs inconnus lors du rendu des templates."""
+
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def _render(value: Any, values: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return value.format_map(values)
+    if isinstance(value, list):
+        return [_render(item, values) for item in value]
+    if isinstance(value, dict):
+        return {key: _render(item, values) for key, item in value.items()}
+    return value
+
+
+class IntentRouter:
+    """
+    Routage rapide des commandes courantes sans passer par le LLM.
+    1. Règles (regex sur l'entrée normalisée, avec extraction de slots)
+    2. Plus proche voisin par embeddings sur les exemples de chaque intent
+    Au-dessus du seuil de confiance, la réponse (plan + tool_calls) est
+    produite directement ; sinon la requête continue vers le LLM.
+    """
+
+    def __init__(self, intents_path: str, threshold: float = 0.85, use_embeddings: bool = True):
+        self.threshold = threshold
+        with open(intents_path, 'r', encoding='utf-8') as f:
+            self.intents = json.load(f)["intents"]
+
+        self.rules: List[Tuple[Dict[str, Any], re.Pattern]] = [
+            (intent, re.compile(pattern, re.IGNORECASE))
+            for intent in self.intents
+            for pattern in intent.get("patterns", [])
+        ]
+
+        # Compteurs
+        self.routed = 0
+        self.fallthrough = 0
+        self.by_intent: Dict[str, int] = {}
+        self.by_method = {"rule": 0, "embedding": 0}
+
+        # Index d'embeddings des exemples (les intents à slots n'ont que des règles)
+        self.embedder = None
+        self.example_intents: List[Dict[str, Any]] = []
+        self.example_vectors: Optional[np.ndarray] = None
+        if use_embeddings and EMBEDDINGS_AVAILABLE:
+            try:
+                self.embedder = embedding_functions.DefaultEmbeddingFunction()
+                examples = []
+                for intent in self.intents:
+                    for example in intent.get("examples", []):
+                        examples.append(normalize_input(example))
+                        self.example_intents.append(intent)
+                if examples:
+                    self.example_vectors = self._embed(examples)
+                print(f"✅ Intent router: {len(self.intents)} intents, {len(examples)} examples indexed")
+            except Exception as e:
+                print(f"❌ Failed to load intent embeddings: {e}")
+                self.embedder = None
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.embedder(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-8)
+
+    def _match_rules(self, text: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+        for intent, pattern in self.rules:
+            match = pattern.match(text)
+            if match:
+                slots = {key: value.strip() for key, value in match.groupdict().items() if value}
+                return intent, slots
+        return None
+
+    def _match_embedding(self, text: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        if self.embedder is None or self.example_vectors is None:
+            return None
+        query = self._embed([text])[0]
+        scores = self.example_vectors @ query
+        best = int(np.argmax(scores))
+        return self.example_intents[best], float(scores[best])
+
+    def _build_response(self, intent: Dict[str, Any], slots: Dict[str, str], user_id: str,
+                        method: str, confidence: float) -> Dict[str, Any]:
+        now = datetime.now()
+        values = _TemplateValues(
+            user_id=user_id,
+            now_time=f"{now.hour}h{now.minute:02d}",
+            now_date=f"{_DAYS_FR[now.weekday()]} {now.day} {_MONTHS_FR[now.month - 1]} {now.year}",
+            **slots
+        )
+        response = _render(copy.deepcopy(intent["response"]), values)
+        response.setdefault("need_user_confirmation", False)
+        response.setdefault("safety", {
+            "level": "low",
+            "notes": f"Intent '{intent['name']}' routé sans LLM ({method}, confiance {confidence:.2f})"
+        })
+        return response
+
+    async def route(self, user_input: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Retourne une réponse structurée si l'intent est reconnu avec assez de confiance."""
+        text = normalize_input(user_input)
+
+        # Casse d'origine conservée pour les slots extraits (ex: noms propres)
+        result = self._match_rules(normalize_input(user_input, casefold=False))
+        if result:
+            intent, slots = result
+            method, confidence = "rule", 1.0
+        else:
+            match = await asyncio.to_thread(self._match_embedding, text) if self.embedder else None
+            if not match or match[1] < self.threshold:
+                self.fallthrough += 1
+                return None
+            intent, confidence = match
+            slots, method = {}, "embedding"
+
+        self.routed += 1
+        self.by_method[method] += 1
+        self.by_intent[intent["name"]] = self.by_intent.get(intent["name"], 0) + 1
+        return self._build_response(intent, slots, user_id, method, confidence)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.routed + self.fallthrough
+        return {
+            "threshold": self.threshold,
+            "embeddings": self.embedder is not None,
+            "routed": self.routed,
+            "fallthrough": self.fallthrough,
+            "routed_ratio": round(self.routed / total, 3) if total else 0.0,
+            "by_method": self.by_method,
+            "by_intent": self.by_intent,
+        }
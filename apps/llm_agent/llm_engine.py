@@ -1,8 +1,17 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
+import hashlib
 import json
 import os
+import time
 from datetime import datetime
-import aiohttp
+from streaming import ExplanationExtractor
+from model_pool import ModelPool, in_pool_worker
+from response_cache import ResponseCache
+from context_packer import ContextPacker, approximate_token_count
+from scheduler import InferenceScheduler, InferenceJob, QueueFullError, DeadlineExceededError
+from common.http_client import HTTPClient
+from common.instrumentation import span, record_span
 
 try:
     from llama_cpp import Llama
@@ -14,9 +23,11 @@ except ImportError:
 class LLMEngine:
     """Moteur LLM avec support Llama local."""
     
-    def __init__(self, model_path: str = None, **kwargs):
+    def __init__(self, model_path: str = None, http_client: Optional[HTTPClient] = None, **kwargs):
         self.model_path = model_path or os.getenv("LLM_MODEL_PATH")
-        self.llm = None
+        self.http_client = http_client or HTTPClient.from_env()
+        self.memory_host = os.getenv("MEMORY_HOST", "localhost:8003")
+        self.pool = None
         self.max_tokens = int(os.getenv("MAX_TOKENS", "2048"))
         self.temperature = float(os.getenv("TEMPERATURE", "0.7"))
         
@@ -30,23 +41,96 @@ class LLMEngine:
         with open(template_path, 'r', encoding='utf-8') as f:
             self.user_template = f.read()
         
-        # Initialiser le modèle si disponible
-        if self.model_path and LLAMA_AVAILABLE:
+        # Grammaire GBNF du schéma de réponse (décodage contraint en JSON valide)
+        self.response_grammar = None
+        if os.getenv("LLM_JSON_GRAMMAR", "true").lower() == "true":
+            grammar_path = os.path.join(os.path.dirname(__file__), "prompts/agent_response.gbnf")
+            with open(grammar_path, 'r', encoding='utf-8') as f:
+                self.response_grammar = f.read()
+        
+        # Cache des réponses (invalidé automatiquement si les prompts changent)
+        template_version = hashlib.sha256(
+            f"{self.system_prompt}\0{self.user_template}\0{self.response_grammar or ''}".encode("utf-8")
+        ).hexdigest()[:12]
+        self.response_cache = None
+        if os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true":
+            self.response_cache = ResponseCache(
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+                ttl=float(os.getenv("LLM_CACHE_TTL", "3600")),
+                template_version=template_version
+            )
+        
+        # Initialiser le pool de modèles si disponible
+        workers = int(os.getenv("LLM_WORKERS", "1"))
+        if self.model_path and LLAMA_AVAILABLE and not in_pool_worker():
             try:
-                self.llm = Llama(
+                prefix_cache = os.getenv("LLM_PREFIX_CACHE", "true").lower() == "true"
+                self.pool = ModelPool(
                     model_path=self.model_path,
-                    n_ctx=4096,
-                    n_threads=8,
-                    n_gpu_layers=0,  # CPU only, augmenter pour GPU
-                    verbose=False
+                    workers=workers,
+                    n_ctx=int(os.getenv("LLM_N_CTX", "4096")),
+                    threads_per_worker=int(os.getenv("LLM_THREADS_PER_WORKER", "0")) or None,
+                    pin_cpus=os.getenv("LLM_PIN_CPUS", "false").lower() == "true",
+                    # Évaluer le system prompt une fois par worker (état KV réutilisé)
+                    prefix=f"{self.system_prompt}\n\n" if prefix_cache else None,
+                    prefix_cache_path=os.getenv("LLM_PREFIX_CACHE_PATH", "./cache/system_prefix.kv") or None,
+                    # Décodage spéculatif si un modèle brouillon est configuré
+                    draft_model_path=os.getenv("LLM_DRAFT_MODEL_PATH") or None,
+                    draft_tokens=int(os.getenv("LLM_DRAFT_TOKENS", "4"))
                 )
-                print(f"✅ LLM loaded: {self.model_path}")
+                print(f"✅ LLM loaded: {self.model_path} ({self.pool.size} worker(s))")
             except Exception as e:
                 print(f"❌ Failed to load LLM: {e}")
+        
+        # Tokenizer seul (vocab_only) pour mesurer les prompts sans accès aux workers
+        self.tokenizer = None
+        if self.pool:
+            try:
+                self.tokenizer = Llama(model_path=self.model_path, vocab_only=True, verbose=False)
+            except Exception as e:
+                print(f"❌ Failed to load tokenizer: {e}")
+        
+        # Sélection du contexte dans un budget de tokens
+        self.context_packer = ContextPacker(
+            count_tokens=self.count_tokens,
+            token_budget=int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "512"))
+        )
+        # Coût fixe du prompt (system prompt + template sans contexte ni entrée)
+        self.base_prompt_tokens = self.count_tokens(self.build_prompt("", [], ""))
+        
+        # File d'inférence : un thread dispatcher par worker du pool
+        self.scheduler = InferenceScheduler(
+            max_queue_size=int(os.getenv("LLM_QUEUE_MAX_SIZE", "16")),
+            default_timeout=float(os.getenv("LLM_REQUEST_TIMEOUT", "120")),
+            workers=self.pool.size if self.pool else 1
+        )
+        if self.pool:
+            self.scheduler.start()
+    
+    @property
+    def loaded(self) -> bool:
+        return self.pool is not None
+    
+    def close(self) -> None:
+        self.scheduler.stop()
+        if self.pool:
+            self.pool.close()
+    
+    def count_tokens(self, text: str) -> int:
+        """Nombre de tokens selon le tokenizer du modèle (estimation sinon)."""
+        if self.tokenizer is None:
+            return approximate_token_count(text)
+        return len(self.tokenizer.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+    
+    def pack_context(self, provided: List[str], memories: List[Dict[str, Any]], user_input: str) -> Dict[str, Any]:
+        """Sélectionne le contexte dans le budget et estime la taille totale du prompt."""
+        packed = self.context_packer.pack(provided, memories)
+        packed["prompt_tokens"] = self.base_prompt_tokens + packed["tokens"] + self.count_tokens(user_input)
+        return packed
     
     def format_prompt(self, user_input: str, context: List[str], user_id: str) -> str:
-        """Formate le prompt utilisateur avec contexte."""
-        memory_snippets = "\n".join([f"- {ctx}" for ctx in context[:5]])
+        """Formate le prompt utilisateur avec contexte (déjà sélectionné par pack_context)."""
+        memory_snippets = "\n".join([self.context_packer.format_snippet(ctx) for ctx in context])
         
         prompt = self.user_template.replace("{{user_id}}", user_id)
         prompt = prompt.replace("{{iso_timestamp}}", datetime.utcnow().isoformat())
@@ -55,40 +139,115 @@ class LLMEngine:
         
         return prompt
     
-    async def generate(self, user_input: str, context: List[str], user_id: str) -> Dict[str, Any]:
-        """Génère une réponse avec plan et tool calls."""
+    def build_prompt(self, user_input: str, context: List[str], user_id: str) -> str:
+        """Construit le prompt complet (system prompt + prompt utilisateur)."""
+        user_prompt = self.format_prompt(user_input, context, user_id)
+        return f"{self.system_prompt}\n\n{user_prompt}"
+    
+    def _parse_response(self, response_text: str) -> Dict[str, Any]:
+        """Parse la sortie du LLM en réponse structurée."""
+        response_text = response_text.strip()
+        
+        # Parser la réponse JSON si possible
+        try:
+            return json.loads(response_text)
+        except json.JSONDecodeError:
+            # Fallback: réponse textuelle
+            return {
+                "plan": [{"step": 1, "desc": "Répondre à l'utilisateur", "tool": None, "args": {}}],
+                "tool_calls": [],
+                "explanation": response_text,
+                "need_user_confirmation": False,
+                "safety": {"level": "low", "notes": "Réponse conversationnelle"}
+            }
+    
+    def _completion_params(self) -> Dict[str, Any]:
+        params = {
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+        }
+        if self.response_grammar:
+            # La grammaire termine la génération à la fermeture de l'objet JSON :
+            # pas de stop sur "\n\n" qui tronquerait un JSON indenté
+            params["grammar"] = self.response_grammar
+        else:
+            params["stop"] = ["\n\n", "USER:"]
+        return params
+    
+    def _completion(self, prompt: str, job: InferenceJob) -> Dict[str, Any]:
+        """
+        Complétion sur le worker le moins chargé du pool. S'arrête dès que le
+        job est abandonné ou expiré : le worker est libéré sans aller jusqu'à
+        max_tokens.
+        """
+        output = []
+        with self.pool.acquire() as worker:
+            for text in self._timed_stream(worker, prompt, job=job):
+                if job.expired():
+                    raise DeadlineExceededError("Inference deadline exceeded")
+                output.append(text)
+        return {"choices": [{"text": "".join(output)}]}
+    
+    def _timed_stream(self, worker, prompt: str, job: Optional[InferenceJob] = None):
+        """
+        Tokens du worker, avec les spans llm.prompt_eval (jusqu'au premier
+        token) et llm.decode (génération des suivants).
+        """
+        start = time.time()
+        first_token_at = None
+        tokens = 0
+        try:
+            for text in worker.stream(prompt, self._completion_params(), job=job):
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    record_span("llm.prompt_eval", start, first_token_at - start)
+                tokens += 1
+                yield text
+        finally:
+            if first_token_at is not None:
+                record_span("llm.decode", first_token_at, time.time() - first_token_at, tokens=tokens)
+    
+    def _cache_key(self, user_input: str, context: List[str], user_id: str, use_cache: bool,
+                   cache_context: Optional[List[str]] = None) -> Optional[str]:
+        if not (use_cache and self.response_cache and self.pool):
+            return None
+        return self.response_cache.make_key(user_id, user_input, context if cache_context is None else cache_context)
+    
+    async def generate(self, user_input: str, context: List[str], user_id: str,
+                       priority: str = "interactive", use_cache: bool = True,
+                       cache_context: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Génère une réponse avec plan et tool calls.
+        `cache_context` : contexte pris en compte par la clé du cache (défaut : `context`).
+        L'inférence passe par le scheduler (QueueFullError / DeadlineExceededError
+        sont propagées pour être traduites en 429 / 504).
+        """
+        
+        # Réponse déjà générée pour la même demande et le même contexte
+        cache_key = self._cache_key(user_input, context, user_id, use_cache, cache_context)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
         # Formater le prompt
-        user_prompt = self.format_prompt(user_input, context, user_id)
-        full_prompt = f"{self.system_prompt}\n\n{user_prompt}"
+        full_prompt = self.build_prompt(user_input, context, user_id)
         
         # Si modèle local disponible
-        if self.llm:
+        if self.pool:
             try:
-                output = self.llm(
-                    full_prompt,
-                    max_tokens=self.max_tokens,
-                    temperature=self.temperature,
-                    stop=["\n\n", "USER:"],
-                    echo=False
+                output = await self.scheduler.submit(
+                    lambda job: self._completion(full_prompt, job),
+                    priority=priority
                 )
                 
-                response_text = output['choices'][0]['text'].strip()
-                
-                # Parser la réponse JSON si possible
-                try:
-                    response_data = json.loads(response_text)
-                    return response_data
-                except json.JSONDecodeError:
-                    # Fallback: réponse textuelle
-                    return {
-                        "plan": [{"step": 1, "desc": "Répondre à l'utilisateur", "tool": None, "args": {}}],
-                        "tool_calls": [],
-                        "explanation": response_text,
-                        "need_user_confirmation": False,
-                        "safety": {"level": "low", "notes": "Réponse conversationnelle"}
-                    }
+                response = self._parse_response(output['choices'][0]['text'])
+                if cache_key:
+                    self.response_cache.put(cache_key, user_id, response)
+                return response
             
+            except (QueueFullError, DeadlineExceededError):
+                raise
             except Exception as e:
                 print(f"LLM generation error: {e}")
                 return self._fallback_response(user_input)
@@ -97,6 +256,100 @@ class LLMEngine:
             # Fallback sans modèle local
             return self._fallback_response(user_input)
     
+    def generate_stream(self, user_input: str, context: List[str], user_id: str,
+                        priority: str = "interactive", use_cache: bool = True,
+                        cache_context: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Génère la réponse token par token (streaming llama-cpp).
+        Émet des évènements "token", "explanation" (texte décodé du champ
+        explanation au fil de l'eau) puis "done" avec la réponse parsée.
+        La requête est mise en file immédiatement : QueueFullError est levée
+        avant l'envoi de la première réponse HTTP.
+        """
+        if not self.pool:
+            return self.replay_stream(self._fallback_response(user_input))
+        
+        cache_key = self._cache_key(user_input, context, user_id, use_cache, cache_context)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return self.replay_stream(cached)
+        
+        full_prompt = self.build_prompt(user_input, context, user_id)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        def produce(job: InferenceJob):
+            # Itérateur bloquant : exécuté dans le thread dispatcher du scheduler
+            try:
+                with self.pool.acquire() as worker:
+                    for text in self._timed_stream(worker, full_prompt, job=job):
+                        if job.expired():
+                            raise DeadlineExceededError("Inference deadline exceeded")
+                        loop.call_soon_threadsafe(queue.put_nowait, ("token", text))
+                loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+        
+        job = self.scheduler.enqueue(produce, priority=priority)
+        return self._consume_stream(job, queue, user_input, user_id, cache_key)
+    
+    async def _consume_stream(self, job: InferenceJob, queue: asyncio.Queue, user_input: str,
+                              user_id: str, cache_key: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        """Relaie les tokens produits par le worker sous forme d'évènements."""
+        waiter = asyncio.ensure_future(self.scheduler.wait(job))
+        extractor = ExplanationExtractor()
+        output = []
+        try:
+            while True:
+                if waiter.done():
+                    # Job terminé : vider les messages restants sans attendre
+                    if queue.empty():
+                        # Aucun message terminal (expiré en file, scheduler arrêté...)
+                        waiter.result()
+                        break
+                    kind, value = queue.get_nowait()
+                else:
+                    getter = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({getter, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    kind, value = getter.result()
+                
+                if kind == "error":
+                    if isinstance(value, DeadlineExceededError):
+                        raise value
+                    print(f"LLM generation error: {value}")
+                    yield {"type": "done", "response": self._fallback_response(user_input)}
+                    return
+                if kind == "end":
+                    break
+                
+                output.append(value)
+                yield {"type": "token", "text": value}
+                
+                explanation_delta = extractor.feed(value)
+                if explanation_delta:
+                    yield {"type": "explanation", "text": explanation_delta}
+            
+            response = self._parse_response("".join(output))
+            if cache_key:
+                self.response_cache.put(cache_key, user_id, response)
+            if not extractor.started and response.get("explanation"):
+                # Sortie non JSON : l'explication est le texte complet
+                yield {"type": "explanation", "text": response["explanation"]}
+            yield {"type": "done", "response": response}
+        finally:
+            job.cancelled = True
+            if not waiter.done():
+                waiter.cancel()
+    
+    async def replay_stream(self, response: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Rejoue une réponse déjà disponible (cache, fallback) sous forme d'évènements."""
+        yield {"type": "explanation", "text": response["explanation"]}
+        yield {"type": "done", "response": response}
+    
     def _fallback_response(self, user_input: str) -> Dict[str, Any]:
         """Réponse par défaut quand LLM non disponible."""
         return {
@@ -110,23 +363,22 @@ class LLMEngine:
             "safety": {"level": "low", "notes": "Mode fallback actif"}
         }
     
-    async def retrieve_memory(self, query: str, user_id: str, top_k: int = 5) -> List[str]:
-        """Récupère le contexte depuis le service Memory."""
-        memory_host = os.getenv("MEMORY_HOST", "localhost:8003")
-        
+    async def retrieve_memory(self, query: str, user_id: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Récupère les souvenirs pertinents (texte + distance) depuis le service Memory."""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"http://{memory_host}/query",
+            # Requête en lecture seule : rejouable en cas de timeout ou de 503
+            with span("memory.retrieve", top_k=top_k):
+                resp = await self.http_client.post(
+                    f"http://{self.memory_host}/query",
                     json={
                         "user_id": user_id,
                         "query_text": query,
                         "top_k": top_k
-                    }
-                ) as resp:
-                    if resp.status == 200:
-                        memories = await resp.json()
-                        return [mem['text'] for mem in memories]
+                    },
+                    idempotent=True
+                )
+            if resp.status == 200:
+                return [{"text": mem['text'], "distance": mem.get('distance')} for mem in resp.json()]
         except Exception as e:
             print(f"Memory retrieval error: {e}")
         
@@ -1,25 +1,65 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Literal
+import asyncio
 import os
+import uuid
 from dotenv import load_dotenv
 from datetime import datetime
 from llm_engine import LLMEngine
 from tools_executor import ToolsExecutor
+from streaming import sse_event
+from scheduler import QueueFullError, DeadlineExceededError
+from intent_router import IntentRouter
+from pending_actions import PendingActionStore
+from common.http_client import HTTPClient
+from common.instrumentation import instrument_app
+from common.coalescing import RequestCoalescer, cancel_on_disconnect
 
 load_dotenv()
 
 app = FastAPI(title="JARVIS LLM Agent", version="0.2.0")
+instrument_app(app, "llm_agent")
+
+# Client HTTP partagé (sessions keep-alive vers Memory / Action Exec)
+http_client = HTTPClient.from_env()
 
 # Initialiser le moteur LLM
-llm_engine = LLMEngine()
-tools_executor = ToolsExecutor()
+llm_engine = LLMEngine(http_client=http_client)
+tools_executor = ToolsExecutor(http_client=http_client)
+
+# Routage rapide des intents courants (avant le LLM)
+intent_router = None
+if os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true":
+    intent_router = IntentRouter(
+        intents_path=os.path.join(os.path.dirname(__file__), "prompts/intents.json"),
+        threshold=float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.85")),
+        use_embeddings=os.getenv("INTENT_ROUTER_EMBEDDINGS", "true").lower() == "true"
+    )
+
+# Plans en attente de confirmation utilisateur
+pending_actions = PendingActionStore(
+    ttl=float(os.getenv("PENDING_ACTIONS_TTL", "600")),
+    max_entries=int(os.getenv("PENDING_ACTIONS_MAX", "1000")),
+    snapshot_path=os.getenv("PENDING_ACTIONS_SNAPSHOT_PATH") or None
+)
+
+# Requêtes /think identiques en cours : une seule génération (et une seule exécution des tools)
+think_coalescer = RequestCoalescer(
+    enabled=os.getenv("COALESCE_REQUESTS", "true").lower() == "true",
+    grace_period=float(os.getenv("COALESCE_GRACE_S", "5"))
+)
 
 class ThinkRequest(BaseModel):
     user_id: str
     input: str
     context: Optional[List[str]] = []
+    # Derniers échanges de la session (bridge) : dans le prompt, hors clé du cache de réponses
+    session: Optional[List[str]] = []
     tools: Optional[List[str]] = []
+    priority: Literal["interactive", "background"] = "interactive"
+    use_cache: bool = True  # False pour les demandes dépendant de l'instant
 
 class ThinkResponse(BaseModel):
     id: str
@@ -30,78 +70,263 @@ class ThinkResponse(BaseModel):
     need_user_confirmation: bool
     safety: Dict[str, Any]
     timestamp: str
+    usage: Optional[Dict[str, Any]] = None
 
 @app.get("/health")
 async def health():
     return {
         "status": "healthy",
         "service": "llm_agent",
-        "llm_loaded": llm_engine.llm is not None,
+        "llm_loaded": llm_engine.loaded,
         "model_path": llm_engine.model_path,
+        "inference_queue": llm_engine.scheduler.stats(),
+        "workers": llm_engine.pool.stats() if llm_engine.pool else [],
+        "response_cache": llm_engine.response_cache.stats() if llm_engine.response_cache else None,
+        "intent_router": intent_router.stats() if intent_router else None,
+        "pending_actions": pending_actions.stats(),
+        "http_client": http_client.stats(),
+        "coalescing": think_coalescer.stats(),
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.on_event("startup")
+async def startup():
+    await http_client.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    pending_actions.save()
+    llm_engine.close()
+    await http_client.close()
+
+def queue_full_exception(e: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="LLM inference queue is full",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def build_think_response(llm_response: Dict[str, Any], tool_results: List[Dict[str, Any]],
+                         usage: Optional[Dict[str, Any]] = None) -> ThinkResponse:
+    """Construit la réponse structurée à partir de la sortie du LLM."""
+    # Générer ID transaction (clé du store des actions en attente)
+    tx_id = f"tx-{uuid.uuid4().hex[:16]}"
+    
+    return ThinkResponse(
+        id=tx_id,
+        plan=llm_response.get('plan', []),
+        tool_calls=llm_response.get('tool_calls', []),
+        tool_results=tool_results,
+        explanation=llm_response.get('explanation', ''),
+        need_user_confirmation=llm_response.get('need_user_confirmation', False),
+        safety=llm_response.get('safety', {"level": "low", "notes": ""}),
+        timestamp=datetime.utcnow().isoformat(),
+        usage=usage
+    )
+
+async def run_tools(llm_response: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Exécute les tool_calls si aucune confirmation n'est requise."""
+    if llm_response.get('need_user_confirmation', False):
+        return []
+    tool_calls = llm_response.get('tool_calls', [])
+    if not tool_calls:
+        return []
+    return await tools_executor.execute_tools(tool_calls, plan=llm_response.get('plan', []))
+
+def forget_cached_responses(user_id: str, tool_calls: List[Dict[str, Any]]) -> None:
+    """Une écriture en mémoire change le contexte : les réponses en cache de l'utilisateur sont oubliées."""
+    if not llm_engine.response_cache:
+        return
+    if any(call.get('tool') == 'memory' and call.get('call', {}).get('method', 'write') == 'write'
+           for call in tool_calls):
+        llm_engine.response_cache.invalidate_user(user_id)
+
+async def finalize(request: ThinkRequest, llm_response: Dict[str, Any],
+                   usage: Optional[Dict[str, Any]] = None) -> ThinkResponse:
+    """
+    Exécute les tools autorisés et construit la réponse. Un plan nécessitant
+    confirmation est conservé pour que /confirm l'exécute tel quel.
+    Une fois lancés, les effets de bord vont jusqu'au bout : l'annulation de la
+    requête (client parti, calcul fusionné abandonné) n'est possible qu'avant.
+    """
+    return await asyncio.shield(asyncio.ensure_future(apply_plan(request, llm_response, usage)))
+
+async def apply_plan(request: ThinkRequest, llm_response: Dict[str, Any],
+                     usage: Optional[Dict[str, Any]] = None) -> ThinkResponse:
+    tool_results = await run_tools(llm_response)
+    if tool_results:
+        forget_cached_responses(request.user_id, llm_response.get('tool_calls', []))
+    response = build_think_response(llm_response, tool_results, usage=usage)
+    
+    if response.need_user_confirmation and response.tool_calls:
+        pending_actions.put(
+            response.id,
+            user_id=request.user_id,
+            plan=response.plan,
+            tool_calls=response.tool_calls,
+            explanation=response.explanation
+        )
+    
+    return response
+
+async def gather_context(request: ThinkRequest) -> Dict[str, Any]:
+    """
+    Récupère les souvenirs pertinents et sélectionne le contexte du prompt :
+    classement par distance, dédoublonnage, budget de tokens.
+    """
+    memories = await llm_engine.retrieve_memory(
+        query=request.input,
+        user_id=request.user_id,
+        top_k=5
+    )
+    return llm_engine.pack_context(list(request.context or []) + list(request.session or []), memories, request.input)
+
+def cache_context(request: ThinkRequest, packed: Dict[str, Any]) -> List[str]:
+    """Contexte retenu pour la clé du cache : sans les échanges de session, qui changent à chaque tour."""
+    session = {snippet.strip() for snippet in request.session or []}
+    return [snippet for snippet in packed["snippets"] if snippet not in session]
+
+def context_usage(packed: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": packed["prompt_tokens"],
+        "context_tokens": packed["tokens"],
+        "context_budget": packed["budget"],
+        "context_snippets": len(packed["snippets"]),
+        "context_dropped": packed["dropped"],
+    }
+
 @app.post("/think", response_model=ThinkResponse)
-async def think(request: ThinkRequest):
+async def think(request: ThinkRequest, http_request: Request):
     """
     Endpoint principal de raisonnement et planification.
     1. Récupère contexte mémoire
     2. Génère plan avec LLM
     3. Exécute tool_calls si autorisé
     4. Retourne résultat structuré
+    Une requête identique déjà en cours (même utilisateur, texte normalisé,
+    contexte et tools) partage sa génération au lieu d'en lancer une autre.
     """
+    key = think_coalescer.make_key(
+        request.user_id, request.input, request.context,
+        tools=request.tools, use_cache=request.use_cache, session=request.session
+    )
+    return await cancel_on_disconnect(http_request, think_coalescer.run(key, lambda: run_think(request)))
+
+async def run_think(request: ThinkRequest) -> ThinkResponse:
+    """Contexte, génération et tools (calcul partagé par les requêtes fusionnées)."""
     try:
-        # Récupérer contexte mémoire
-        memory_context = await llm_engine.retrieve_memory(
-            query=request.input,
-            user_id=request.user_id,
-            top_k=5
-        )
+        # Commande courante : réponse directe sans contexte ni LLM
+        llm_response = await intent_router.route(request.input, request.user_id) if intent_router else None
+        if llm_response is not None:
+            return await finalize(request, llm_response)
         
-        # Fusionner avec contexte fourni
-        full_context = list(set(request.context + memory_context))
+        # Récupérer et sélectionner le contexte
+        packed = await gather_context(request)
         
         # Générer réponse avec LLM
         llm_response = await llm_engine.generate(
             user_input=request.input,
-            context=full_context,
-            user_id=request.user_id
+            context=packed["snippets"],
+            user_id=request.user_id,
+            priority=request.priority,
+            use_cache=request.use_cache,
+            cache_context=cache_context(request, packed)
         )
         
         # Exécuter tools si pas besoin de confirmation
-        tool_results = []
-        if not llm_response.get('need_user_confirmation', False):
-            tool_calls = llm_response.get('tool_calls', [])
-            if tool_calls:
-                tool_results = await tools_executor.execute_tools(tool_calls)
-        
-        # Générer ID transaction
-        tx_id = f"tx-{datetime.utcnow().timestamp()}"
-        
-        return ThinkResponse(
-            id=tx_id,
-            plan=llm_response.get('plan', []),
-            tool_calls=llm_response.get('tool_calls', []),
-            tool_results=tool_results,
-            explanation=llm_response.get('explanation', ''),
-            need_user_confirmation=llm_response.get('need_user_confirmation', False),
-            safety=llm_response.get('safety', {"level": "low", "notes": ""}),
-            timestamp=datetime.utcnow().isoformat()
-        )
+        return await finalize(request, llm_response, usage=context_usage(packed))
     
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+    except DeadlineExceededError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM processing error: {str(e)}")
 
+@app.post("/think/stream")
+async def think_stream(request: ThinkRequest):
+    """
+    Variante streaming de /think (Server-Sent Events).
+    Évènements émis :
+    - token : texte brut produit par le LLM
+    - explanation : fragment décodé du champ explanation (utilisable par le TTS)
+    - result : réponse complète au format ThinkResponse
+    - error : erreur de traitement
+    """
+    routed_response = await intent_router.route(request.input, request.user_id) if intent_router else None
+    usage = None
+    if routed_response is not None:
+        events = llm_engine.replay_stream(routed_response)
+    else:
+        packed = await gather_context(request)
+        usage = context_usage(packed)
+        
+        # Mise en file avant l'envoi des en-têtes : le délestage reste un vrai 429
+        try:
+            events = llm_engine.generate_stream(
+                user_input=request.input,
+                context=packed["snippets"],
+                user_id=request.user_id,
+                priority=request.priority,
+                use_cache=request.use_cache,
+                cache_context=cache_context(request, packed)
+            )
+        except QueueFullError as e:
+            raise queue_full_exception(e)
+    
+    async def event_source():
+        try:
+            async for event in events:
+                if event["type"] == "done":
+                    response = await finalize(request, event["response"], usage=usage)
+                    yield sse_event("result", response.model_dump())
+                else:
+                    yield sse_event(event["type"], {"text": event["text"]})
+        
+        except Exception as e:
+            yield sse_event("error", {"detail": f"LLM processing error: {str(e)}"})
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/confirm")
-async def confirm_action(tx_id: str, approved: bool):
+async def confirm_action(tx_id: str, approved: bool, user_id: str):
     """
     Confirme ou rejette une action en attente.
-    TODO: Implémenter système de pending actions avec cache Redis/memory
+    Les tool_calls conservés lors de /think sont exécutés directement,
+    sans nouvelle génération : le plan exécuté est celui présenté.
+    Seul l'utilisateur à l'origine du plan peut le confirmer.
     """
+    pending = pending_actions.get(tx_id)
+    if pending is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired transaction")
+    
+    if user_id != pending["user_id"]:
+        raise HTTPException(status_code=403, detail="Transaction belongs to another user")
+    
+    # Usage unique : une confirmation répétée ne ré-exécute pas les tools
+    pending_actions.pop(tx_id)
+    
+    if not approved:
+        return {
+            "tx_id": tx_id,
+            "approved": False,
+            "status": "rejected",
+            "tool_results": []
+        }
+    
+    tool_results = await tools_executor.execute_tools(pending["tool_calls"], plan=pending["plan"])
+    forget_cached_responses(user_id, pending["tool_calls"])
     return {
         "tx_id": tx_id,
-        "approved": approved,
-        "status": "Action confirmation system in development"
+        "approved": True,
+        "status": "executed",
+        "plan": pending["plan"],
+        "tool_results": tool_results,
+        "timestamp": datetime.utcnow().isoformat()
     }
 
 @app.get("/")
@@ -110,7 +335,7 @@ async def root():
         "message": "JARVIS LLM Agent API",
         "version": "0.2.0",
         "docs": "/docs",
-        "llm_status": "loaded" if llm_engine.llm else "not_loaded"
+        "llm_status": "loaded" if llm_engine.loaded else "not_loaded"
     }
 
 if __name__ == "__main__":
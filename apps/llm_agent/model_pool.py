@@ -0,0 +1,340 @@
+from typing import Any, Dict, Iterator, List, Optional
+import multiprocessing
+import os
+import threading
+from contextlib import contextmanager
+
+from prefix_cache import PrefixCache
+from speculative import SmallModelDraft, SPECULATIVE_AVAILABLE
+
+try:
+    from llama_cpp import Llama, LlamaGrammar
+    LLAMA_AVAILABLE = True
+except ImportError:
+    LLAMA_AVAILABLE = False
+
+WORKER_ENV_FLAG = "JARVIS_LLM_POOL_WORKER"
+
+
+def in_pool_worker() -> bool:
+    """Vrai dans un process worker du pool."""
+    return os.getenv(WORKER_ENV_FLAG) == "1"
+
+
+class LlamaRunner:
+    """Instance Llama + cache KV du system prompt, utilisée par un seul worker à la fois."""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+
+        # Modèle brouillon optionnel (décodage spéculatif)
+        self.draft = None
+        if config.get("draft_model_path"):
+            if not SPECULATIVE_AVAILABLE:
+                print("Warning: llama-cpp-python too old for speculative decoding, draft model ignored.")
+            else:
+                try:
+                    self.draft = SmallModelDraft(
+                        config["draft_model_path"],
+                        num_pred_tokens=config.get("draft_tokens", 4),
+                        n_ctx=config["n_ctx"],
+                        n_threads=config["n_threads"]
+                    )
+                except Exception as e:
+                    print(f"❌ Failed to load draft model, using single-model decoding: {e}")
+                    self.draft = None
+
+        self.llm = Llama(
+            model_path=config["model_path"],
+            n_ctx=config["n_ctx"],
+            n_threads=config["n_threads"],
+            n_gpu_layers=0,  # CPU only, augmenter pour GPU
+            use_mmap=True,   # poids partagés entre workers via le page cache
+            draft_model=self.draft,
+            verbose=False
+        )
+        self.prefix_cache = None
+        self._grammars: Dict[str, Any] = {}
+
+        # Pré-évaluer le system prompt (état KV réutilisé à chaque requête).
+        # Pas avec un brouillon : le décodage spéculatif impose logits_all, et
+        # l'état sauvegardé embarque alors n_ctx x n_vocab logits float32
+        # (~2 Go à 4096 x 128k), copiés à chaque restore() : plus lent que
+        # de ré-évaluer le system prompt.
+        if config.get("prefix") and self.draft:
+            print("Warning: system prompt KV cache disabled with a draft model (logits_all state too large).")
+        elif config.get("prefix"):
+            try:
+                self.prefix_cache = PrefixCache(
+                    self.llm,
+                    prefix=config["prefix"],
+                    model_path=config["model_path"],
+                    cache_path=config.get("prefix_cache_path")
+                )
+                self.prefix_cache.warmup()
+            except Exception as e:
+                print(f"❌ Failed to warm up system prompt cache: {e}")
+                self.prefix_cache = None
+
+    def _grammar(self, grammar_text: str):
+        """Compile (une seule fois) une grammaire GBNF reçue sous forme de texte."""
+        if grammar_text not in self._grammars:
+            self._grammars[grammar_text] = LlamaGrammar.from_string(grammar_text, verbose=False)
+        return self._grammars[grammar_text]
+
+    def _call(self, prompt: str, params: Dict[str, Any], stream: bool):
+        """Appel llama-cpp en repartant de l'état KV du system prompt."""
+        params = dict(params)
+        # Les objets LlamaGrammar ne traversent pas la pipe : la grammaire circule en texte
+        if params.get("grammar"):
+            params["grammar"] = self._grammar(params["grammar"])
+        if self.prefix_cache:
+            self.prefix_cache.restore()
+        return self.llm(prompt, echo=False, stream=stream, **params)
+
+    def complete(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self._call(prompt, params, stream=False)
+
+    def stream(self, prompt: str, params: Dict[str, Any]) -> Iterator[str]:
+        for chunk in self._call(prompt, params, stream=True):
+            yield chunk['choices'][0]['text']
+
+    def speculative_stats(self) -> Optional[Dict[str, Any]]:
+        return self.draft.stats() if self.draft else None
+
+
+def _pin_cpus(cpus: Optional[List[int]]) -> None:
+    """Fixe l'affinité CPU du process courant (Linux uniquement)."""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            print(f"CPU affinity error: {e}")
+
+
+def _worker_main(conn, config: Dict[str, Any]) -> None:
+    """Boucle d'un process worker : charge le modèle puis sert les requêtes du parent."""
+    _pin_cpus(config.get("cpus"))
+    try:
+        runner = LlamaRunner(config)
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+
+        kind = message[0]
+        if kind == "stop":
+            return
+
+        try:
+            if kind == "complete":
+                _, prompt, params = message
+                output = runner.complete(prompt, params)
+                conn.send(("result", (output, runner.speculative_stats())))
+
+            elif kind == "stream":
+                _, prompt, params = message
+                for text in runner.stream(prompt, params):
+                    # Le parent peut annuler entre deux tokens (client déconnecté, échéance)
+                    if conn.poll() and conn.recv()[0] == "cancel":
+                        break
+                    conn.send(("token", text))
+                conn.send(("end", runner.speculative_stats()))
+
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class LocalWorker:
+    """Worker dans le process courant (pool de taille 1, pas de coût IPC)."""
+
+    def __init__(self, index: int, config: Dict[str, Any]):
+        self.index = index
+        self.cpus = config.get("cpus")
+        self.n_threads = config["n_threads"]
+        self.in_flight = 0
+        self.served = 0
+        self.pid = os.getpid()
+        self.runner = LlamaRunner(config)
+
+    @property
+    def speculative(self) -> Optional[Dict[str, Any]]:
+        return self.runner.speculative_stats()
+
+    def complete(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self.runner.complete(prompt, params)
+
+    def stream(self, prompt: str, params: Dict[str, Any], job=None) -> Iterator[str]:
+        for text in self.runner.stream(prompt, params):
+            if job is not None and job.cancelled:
+                break
+            yield text
+
+    def close(self) -> None:
+        pass
+
+
+class ProcessWorker:
+    """Proxy vers un process worker possédant sa propre instance Llama."""
+
+    def __init__(self, index: int, config: Dict[str, Any], ctx):
+        self.index = index
+        self.cpus = config.get("cpus")
+        self.n_threads = config["n_threads"]
+        self.in_flight = 0
+        self.served = 0
+        # Statistiques spéculatives, rafraîchies à chaque fin de requête
+        self.speculative: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, config),
+            name=f"llm-worker-{index}",
+            daemon=True
+        )
+        # Marqueur hérité par le process enfant : si le module principal est
+        # ré-importé au démarrage (spawn), il ne doit pas recréer de pool
+        os.environ[WORKER_ENV_FLAG] = "1"
+        try:
+            self.process.start()
+        finally:
+            os.environ.pop(WORKER_ENV_FLAG, None)
+        child_conn.close()
+
+        kind, value = self.conn.recv()
+        if kind != "ready":
+            raise RuntimeError(f"LLM worker {index} failed to start: {value}")
+        self.pid = value
+
+    def complete(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.conn.send(("complete", prompt, params))
+            kind, value = self.conn.recv()
+        if kind == "error":
+            raise RuntimeError(value)
+        output, self.speculative = value
+        return output
+
+    def stream(self, prompt: str, params: Dict[str, Any], job=None) -> Iterator[str]:
+        with self._lock:
+            self.conn.send(("stream", prompt, params))
+            finished = False
+            try:
+                while True:
+                    kind, value = self.conn.recv()
+                    if kind == "end":
+                        finished = True
+                        self.speculative = value
+                        return
+                    if kind == "error":
+                        finished = True
+                        raise RuntimeError(value)
+                    if job is not None and job.cancelled:
+                        break
+                    yield value
+            finally:
+                if not finished:
+                    self._cancel_stream()
+
+    def _cancel_stream(self) -> None:
+        """Annule le stream en cours et vide la pipe jusqu'au message terminal."""
+        self.conn.send(("cancel",))
+        while True:
+            kind, value = self.conn.recv()
+            if kind == "end":
+                self.speculative = value
+            if kind in ("end", "error"):
+                return
+
+    def close(self) -> None:
+        try:
+            self.conn.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ModelPool:
+    """
+    Pool de N workers Llama. Au-delà d'un worker, chaque instance vit dans
+    son propre process avec son nombre de threads et son affinité CPU ;
+    les poids GGUF sont mappés en mémoire (mmap) et partagés via le page
+    cache, seuls le contexte KV et les buffers de calcul sont dupliqués.
+    """
+
+    def __init__(self, model_path: str, workers: int = 1, n_ctx: int = 4096,
+                 threads_per_worker: Optional[int] = None, pin_cpus: bool = False,
+                 prefix: Optional[str] = None, prefix_cache_path: Optional[str] = None,
+                 draft_model_path: Optional[str] = None, draft_tokens: int = 4):
+        self.model_path = model_path
+        self.size = max(1, workers)
+        self.n_ctx = n_ctx
+        cpu_count = os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker or (8 if self.size == 1 else max(1, cpu_count // self.size))
+        self.workers: List[Any] = []
+        self._lock = threading.Lock()
+
+        ctx = multiprocessing.get_context("spawn")
+        for index in range(self.size):
+            cpus = None
+            if pin_cpus:
+                start = (index * self.threads_per_worker) % cpu_count
+                cpus = [(start + i) % cpu_count for i in range(self.threads_per_worker)]
+
+            config = {
+                "model_path": model_path,
+                "n_ctx": n_ctx,
+                "n_threads": self.threads_per_worker,
+                "cpus": cpus,
+                "prefix": prefix,
+                "prefix_cache_path": prefix_cache_path,
+                "draft_model_path": draft_model_path,
+                "draft_tokens": draft_tokens,
+            }
+
+            if self.size == 1:
+                _pin_cpus(cpus)
+                self.workers.append(LocalWorker(index, config))
+            else:
+                self.workers.append(ProcessWorker(index, config, ctx))
+            print(f"✅ LLM worker {index} ready (threads={self.threads_per_worker}, cpus={cpus or 'all'})")
+
+    @contextmanager
+    def acquire(self):
+        """Réserve le worker le moins chargé (à égalité : celui qui a le moins servi)."""
+        with self._lock:
+            worker = min(self.workers, key=lambda w: (w.in_flight, w.served))
+            worker.in_flight += 1
+        try:
+            yield worker
+        finally:
+            with self._lock:
+                worker.in_flight -= 1
+                worker.served += 1
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.close()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "index": w.index,
+                "pid": w.pid,
+                "threads": w.n_threads,
+                "cpus": w.cpus,
+                "in_flight": w.in_flight,
+                "served": w.served,
+                "speculative": w.speculative,
+            }
+            for w in self.workers
+        ]
@@ -0,0 +1,104 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import json
+import os
+import time
+
+
+class PendingActionStore:
+    """
+    Plans en attente de confirmation, indexés par tx_id.
+    /confirm exécute exactement les tool_calls générés, sans nouvel appel au LLM.
+    Éviction par TTL et par taille (les plus anciens d'abord) ; snapshot
+    JSON optionnel pour survivre à un redémarrage.
+    """
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 1000, snapshot_path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.snapshot_path = snapshot_path
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.snapshot_path:
+            self.load()
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        expired = [tx_id for tx_id, entry in self._entries.items() if entry["expires_at"] <= now]
+        for tx_id in expired:
+            del self._entries[tx_id]
+        self.expirations += len(expired)
+
+    def put(self, tx_id: str, user_id: str, plan: List[Dict[str, Any]], tool_calls: List[Dict[str, Any]],
+            explanation: str = "") -> None:
+        self._purge_expired()
+        now = time.time()
+        self._entries[tx_id] = {
+            "user_id": user_id,
+            "plan": plan,
+            "tool_calls": tool_calls,
+            "explanation": explanation,
+            "created_at": now,
+            "expires_at": now + self.ttl,
+        }
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, tx_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(tx_id)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= time.time():
+            del self._entries[tx_id]
+            self.expirations += 1
+            return None
+        return entry
+
+    def pop(self, tx_id: str) -> Optional[Dict[str, Any]]:
+        """Retire et retourne l'action (usage unique : pas de double exécution)."""
+        entry = self.get(tx_id)
+        if entry is not None:
+            del self._entries[tx_id]
+        return entry
+
+    def load(self) -> None:
+        """Recharge le snapshot disque (entrées encore valides uniquement)."""
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            now = time.time()
+            for tx_id, entry in entries.items():
+                if entry["expires_at"] > now:
+                    self._entries[tx_id] = entry
+            print(f"✅ Pending actions restored: {len(self._entries)}")
+        except Exception as e:
+            print(f"Pending actions load error: {e}")
+
+    def save(self) -> None:
+        """Écrit le snapshot disque de manière atomique."""
+        if not self.snapshot_path:
+            return
+        self._purge_expired()
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.snapshot_path)), exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"Pending actions save error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        self._purge_expired()
+        return {
+            "pending": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
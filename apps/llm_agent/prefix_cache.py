@@ -0,0 +1,83 @@
+from typing import Any, Optional
+import hashlib
+import os
+import pickle
+import time
+
+
+class PrefixCache:
+    """
+    Snapshot de l'état KV llama.cpp après évaluation du system prompt.
+    Le préfixe étant constant, il est évalué une seule fois puis restauré
+    avant chaque requête : seule la partie utilisateur est ré-évaluée.
+    """
+
+    def __init__(self, llm: Any, prefix: str, model_path: str, cache_path: Optional[str] = None):
+        self.llm = llm
+        self.prefix = prefix
+        self.model_path = model_path
+        self.cache_path = cache_path
+        self.state = None
+        self.n_tokens = 0
+
+    def _cache_key(self) -> str:
+        """Clé d'invalidation : modèle, taille de contexte et texte du préfixe."""
+        try:
+            stat = os.stat(self.model_path)
+            model_id = f"{self.model_path}|{stat.st_size}|{int(stat.st_mtime)}"
+        except OSError:
+            model_id = self.model_path
+        raw = f"{model_id}|{self.llm.n_ctx()}|{self.prefix}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _load_snapshot(self, key: str):
+        """Charge le snapshot persisté s'il correspond au modèle et au prompt courants."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, "rb") as f:
+                snapshot = pickle.load(f)
+            if snapshot.get("key") == key:
+                return snapshot["state"]
+        except Exception as e:
+            print(f"Prefix cache load error: {e}")
+        return None
+
+    def _save_snapshot(self, key: str, state) -> None:
+        """Persiste le snapshot de manière atomique."""
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"key": key, "state": state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"Prefix cache save error: {e}")
+
+    def warmup(self) -> None:
+        """Évalue le préfixe (ou recharge le snapshot disque) et mémorise l'état KV."""
+        start_time = time.time()
+        key = self._cache_key()
+
+        state = self._load_snapshot(key)
+        source = "disk"
+        if state is None:
+            tokens = self.llm.tokenize(self.prefix.encode("utf-8"), special=True)
+            # Retirer le dernier token : il peut fusionner (BPE) avec le début du prompt utilisateur
+            tokens = tokens[:-1]
+            self.llm.reset()
+            self.llm.eval(tokens)
+            state = self.llm.save_state()
+            self._save_snapshot(key, state)
+            source = "eval"
+
+        self.state = state
+        self.n_tokens = state.n_tokens
+        print(f"✅ System prompt KV cache ready ({self.n_tokens} tokens, {source}, {time.time() - start_time:.2f}s)")
+
+    def restore(self) -> None:
+        """Restaure l'état KV du préfixe avant une nouvelle génération."""
+        if self.state is not None:
+            self.llm.load_state(self.state)
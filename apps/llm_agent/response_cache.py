@@ -0,0 +1,101 @@
+from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+import copy
+import hashlib
+import re
+import time
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?…,;:]+$")
+
+
+def normalize_input(text: str, casefold: bool = True) -> str:
+    """Normalise une commande utilisateur (casse, espaces, ponctuation finale)."""
+    text = unicodedata.normalize("NFKC", text).strip()
+    if casefold:
+        text = text.casefold()
+    text = text.replace("’", "'")
+    text = _WHITESPACE.sub(" ", text)
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def context_hash(context: List[str]) -> str:
+    """Empreinte du contexte récupéré (indépendante de l'ordre)."""
+    digest = hashlib.sha256()
+    for snippet in sorted(context):
+        digest.update(snippet.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache LRU + TTL des réponses LLM, cloisonné par utilisateur.
+    Clé : (user_id, entrée normalisée, hash du contexte, version du template).
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, template_version: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.template_version = template_version
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+        # Métriques
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def make_key(self, user_id: str, user_input: str, context: List[str]) -> str:
+        raw = "|".join([
+            user_id,
+            normalize_input(user_input),
+            context_hash(context),
+            self.template_version,
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user_id, response = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(response)
+
+    def put(self, key: str, user_id: str, response: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, user_id, copy.deepcopy(response))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_user(self, user_id: str) -> int:
+        """Supprime toutes les entrées d'un utilisateur (ex: mémoire modifiée)."""
+        keys = [key for key, entry in self._entries.items() if entry[1] == user_id]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
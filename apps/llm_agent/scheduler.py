@@ -0,0 +1,216 @@
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+
+from common.instrumentation import record_span
+
+# Classes de priorité : plus la valeur est basse, plus la requête passe tôt
+PRIORITIES = {
+    "interactive": 0,  # commandes vocales / utilisateur en attente
+    "background": 1,   # tâches de fond (résumés, maintenance mémoire...)
+}
+
+
+class QueueFullError(Exception):
+    """File d'inférence pleine : la requête est rejetée (HTTP 429)."""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Inference queue is full")
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(Exception):
+    """La requête n'a pas pu être servie avant son échéance (HTTP 504)."""
+
+
+class InferenceJob:
+    """Requête d'inférence en attente d'exécution par le worker."""
+
+    def __init__(self, fn: Callable[["InferenceJob"], Any], priority: str, deadline: float,
+                 loop: asyncio.AbstractEventLoop):
+        self.fn = fn
+        self.priority = priority
+        self.deadline = deadline
+        self.loop = loop
+        self.future = loop.create_future()
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.cancelled = False
+        # Contexte de la requête (span courant) repris dans le thread worker
+        self.context = contextvars.copy_context()
+
+    def expired(self) -> bool:
+        return time.monotonic() > self.deadline
+
+    def _resolve(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+class InferenceScheduler:
+    """
+    Ordonnanceur d'inférence : file bornée à priorités, consommée par des
+    threads workers qui seuls accèdent au modèle. L'event loop FastAPI n'est
+    jamais bloqué par la génération (/health reste disponible).
+    """
+
+    def __init__(self, max_queue_size: int = 16, default_timeout: float = 120.0, workers: int = 1):
+        self.max_queue_size = max_queue_size
+        self.default_timeout = default_timeout
+        self.workers = workers
+        self._heap: List[Any] = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+        # Statistiques
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.total_wait = 0.0
+        self.total_compute = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"llm-inference-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            pending = [entry[2] for entry in self._heap]
+            self._heap.clear()
+            self._cond.notify_all()
+        for job in pending:
+            job.loop.call_soon_threadsafe(job._resolve, None, DeadlineExceededError("Scheduler stopped"))
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def enqueue(self, fn: Callable[[InferenceJob], Any], priority: str = "interactive",
+                timeout: Optional[float] = None) -> InferenceJob:
+        """
+        Ajoute une requête dans la file. Lève QueueFullError immédiatement si
+        la file est pleine (délestage plutôt qu'attente illimitée).
+        `fn` reçoit le job et s'exécute dans le thread worker.
+        """
+        if priority not in PRIORITIES:
+            priority = "background"
+
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + (timeout or self.default_timeout)
+        job = InferenceJob(fn, priority, deadline, loop)
+
+        with self._cond:
+            if len(self._heap) >= self.max_queue_size:
+                self.rejected += 1
+                raise QueueFullError(retry_after=self._retry_after())
+            heapq.heappush(self._heap, (PRIORITIES[priority], next(self._seq), job))
+            self._cond.notify()
+
+        return job
+
+    async def wait(self, job: InferenceJob) -> Any:
+        """Attend le résultat d'un job en respectant son échéance."""
+        remaining = max(0.0, job.deadline - time.monotonic())
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout=remaining)
+        except asyncio.TimeoutError:
+            job.cancelled = True
+            raise DeadlineExceededError("Inference deadline exceeded")
+        except asyncio.CancelledError:
+            job.cancelled = True
+            raise
+
+    async def submit(self, fn: Callable[[InferenceJob], Any], priority: str = "interactive",
+                     timeout: Optional[float] = None) -> Any:
+        job = self.enqueue(fn, priority=priority, timeout=timeout)
+        return await self.wait(job)
+
+    def _retry_after(self) -> int:
+        """Estimation grossière du délai avant qu'une place se libère (secondes)."""
+        avg_compute = (self.total_compute / self.completed) if self.completed else 1.0
+        return max(1, int(avg_compute * len(self._heap) / max(1, self.workers)))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._heap:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                self.in_flight += 1
+
+            try:
+                if job.cancelled:
+                    continue
+                if job.expired():
+                    self.expired += 1
+                    job.loop.call_soon_threadsafe(
+                        job._resolve, None, DeadlineExceededError("Deadline exceeded while queued")
+                    )
+                    continue
+
+                job.started_at = time.monotonic()
+                wait = job.started_at - job.enqueued_at
+                self.last_wait = wait
+                self.max_wait = max(self.max_wait, wait)
+                self.total_wait += wait
+                job.context.run(record_span, "llm.queue_wait", time.time() - wait, wait,
+                                priority=job.priority)
+
+                try:
+                    result = job.context.run(job.fn, job)
+                    job.loop.call_soon_threadsafe(job._resolve, result, None)
+                except Exception as e:
+                    job.loop.call_soon_threadsafe(job._resolve, None, e)
+                finally:
+                    self.completed += 1
+                    self.total_compute += time.monotonic() - job.started_at
+            finally:
+                with self._cond:
+                    self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            by_priority = {name: 0 for name in PRIORITIES}
+            for _, _, job in self._heap:
+                by_priority[job.priority] += 1
+            depth = len(self._heap)
+
+        avg_wait = (self.total_wait / self.completed) if self.completed else 0.0
+        avg_compute = (self.total_compute / self.completed) if self.completed else 0.0
+        return {
+            "queue_depth": depth,
+            "queue_capacity": self.max_queue_size,
+            "queued_by_priority": by_priority,
+            "in_flight": self.in_flight,
+            "workers": self.workers,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "wait_ms": {
+                "last": round(self.last_wait * 1000, 1),
+                "avg": round(avg_wait * 1000, 1),
+                "max": round(self.max_wait * 1000, 1),
+            },
+            "compute_ms_avg": round(avg_compute * 1000, 1),
+        }
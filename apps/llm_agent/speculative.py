@@ -0,0 +1,92 @@
+from typing import Any, Dict, List
+import threading
+
+import numpy as np
+
+try:
+    from llama_cpp import Llama
+    from llama_cpp.llama_speculative import LlamaDraftModel
+    SPECULATIVE_AVAILABLE = True
+except ImportError:
+    LlamaDraftModel = object
+    SPECULATIVE_AVAILABLE = False
+
+
+class SmallModelDraft(LlamaDraftModel):
+    """
+    Modèle brouillon pour le décodage spéculatif : un petit GGUF partageant
+    le vocabulaire du modèle principal (ex: Llama 3.2 1B pour Llama 3.1 8B)
+    propose `num_pred_tokens` tokens en greedy, que le modèle principal
+    vérifie en une seule passe. Les tokens refusés sont rééchantillonnés par
+    le modèle principal : la sortie est identique au décodage simple.
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int = 4, n_ctx: int = 4096, n_threads: int = 4):
+        self.model_path = model_path
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            n_gpu_layers=0,
+            use_mmap=True,
+            verbose=False
+        )
+        self._lock = threading.Lock()
+        self._last_input: List[int] = []
+        self._last_draft: List[int] = []
+
+        # Statistiques d'acceptation
+        self.calls = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    def _record_acceptance(self, input_ids: List[int]) -> None:
+        """
+        Déduit combien de tokens de la proposition précédente ont été
+        acceptés : le modèle principal rappelle le brouillon avec la
+        séquence validée, qui prolonge l'entrée précédente.
+        """
+        previous = len(self._last_input)
+        if not self._last_draft or input_ids[:previous] != self._last_input:
+            return
+        validated = input_ids[previous:previous + len(self._last_draft)]
+        accepted = 0
+        for proposed, kept in zip(self._last_draft, validated):
+            if proposed != kept:
+                break
+            accepted += 1
+        self.accepted += accepted
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs: Any) -> np.ndarray:
+        tokens = input_ids.tolist()
+        draft: List[int] = []
+
+        with self._lock:
+            self._record_acceptance(tokens)
+
+            # Génération greedy ; llama-cpp réutilise le préfixe KV déjà évalué
+            eos = self.llm.token_eos()
+            for token in self.llm.generate(tokens, temp=0.0, top_k=1, reset=True):
+                if token == eos:
+                    break
+                draft.append(token)
+                if len(draft) >= self.num_pred_tokens:
+                    break
+
+            self.calls += 1
+            self.drafted += len(draft)
+            self._last_input = tokens
+            self._last_draft = draft
+
+        return np.array(draft, dtype=np.intc)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "draft_model": self.model_path,
+            "draft_tokens": self.num_pred_tokens,
+            "calls": self.calls,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "acceptance_rate": round(self.accepted / self.drafted, 3) if self.drafted else 0.0,
+        }
@@ -0,0 +1,85 @@
+from typing import Any, Dict, Optional
+import json
+import re
+
+_EXPLANATION_KEY = re.compile(r'"explanation"\s*:\s*"')
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class ExplanationExtractor:
+    """
+    Extrait incrémentalement la valeur du champ JSON "explanation"
+    pendant que le LLM génère sa réponse token par token.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.text = ""
+
+    def feed(self, chunk: str) -> str:
+        """Ajoute un morceau de sortie et retourne le nouveau texte d'explication décodé."""
+        if self.finished:
+            return ""
+
+        self.buffer += chunk
+
+        if not self.started:
+            match = _EXPLANATION_KEY.search(self.buffer, max(0, self.pos - 32))
+            if not match:
+                self.pos = len(self.buffer)
+                return ""
+            self.started = True
+            self.pos = match.end()
+
+        delta = []
+        while self.pos < len(self.buffer):
+            char = self.buffer[self.pos]
+
+            if char == '"':
+                self.finished = True
+                self.pos += 1
+                break
+
+            if char != '\\':
+                delta.append(char)
+                self.pos += 1
+                continue
+
+            # Séquence d'échappement : attendre qu'elle soit complète
+            if self.pos + 1 >= len(self.buffer):
+                break
+            code = self.buffer[self.pos + 1]
+            if code == 'u':
+                if self.pos + 6 > len(self.buffer):
+                    break
+                try:
+                    delta.append(chr(int(self.buffer[self.pos + 2:self.pos + 6], 16)))
+                except ValueError:
+                    pass
+                self.pos += 6
+            else:
+                delta.append(_SIMPLE_ESCAPES.get(code, code))
+                self.pos += 2
+
+        new_text = "".join(delta)
+        self.text += new_text
+        return new_text
+
+
+def sse_event(event: str, data: Optional[Dict[str, Any]] = None) -> str:
+    """Formate un évènement Server-Sent Events."""
+    payload = json.dumps(data or {}, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
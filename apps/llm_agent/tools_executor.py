@@ -1,31 +1,162 @@
-from typing import List, Dict, Any
-import aiohttp
+from typing import List, Dict, Any, Optional, Set
+import asyncio
 import os
 
+from common.http_client import HTTPClient
+from common.instrumentation import span
+
+# Limites de concurrence par tool (surchargeables via TOOL_CONCURRENCY="action_exec=2,memory=4")
+DEFAULT_TOOL_CONCURRENCY = {"action_exec": 2, "memory": 4, "notify": 4}
+
+def _parse_tool_settings(raw: str, cast) -> Dict[str, Any]:
+    settings = {}
+    for item in raw.split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            settings[name.strip()] = cast(value.strip())
+    return settings
+
 class ToolsExecutor:
     """Exécuteur de tools (actions externes)."""
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[HTTPClient] = None):
+        self.http_client = http_client or HTTPClient.from_env()
         self.action_exec_host = os.getenv("ACTION_EXEC_HOST", "localhost:8001")
         self.memory_host = os.getenv("MEMORY_HOST", "localhost:8003")
         self.notify_host = os.getenv("NOTIFY_HOST", "localhost:8004")
+        
+        # Concurrence et timeouts par tool
+        concurrency = {**DEFAULT_TOOL_CONCURRENCY, **_parse_tool_settings(os.getenv("TOOL_CONCURRENCY", ""), int)}
+        self.semaphores = {name: asyncio.Semaphore(limit) for name, limit in concurrency.items()}
+        self.default_timeout = float(os.getenv("TOOL_TIMEOUT", "30"))
+        self.timeouts = _parse_tool_settings(os.getenv("TOOL_TIMEOUTS", ""), float)
     
-    async def execute_tools(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Exécute une liste de tool calls et retourne les résultats."""
-        results = []
+    async def execute_tools(self, tool_calls: List[Dict[str, Any]],
+                            plan: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Exécute une liste de tool calls et retourne les résultats (dans l'ordre des appels).
+        Les appels indépendants d'après le graphe de dépendances du plan
+        sont lancés en parallèle.
+        """
+        dependencies = self._build_dependencies(tool_calls, plan or [])
+        tasks: List[asyncio.Task] = []
         
-        for tool_call in tool_calls:
+        async def run(index: int, tool_call: Dict[str, Any]) -> Dict[str, Any]:
             tool_name = tool_call.get('tool')
             call_data = tool_call.get('call', {})
             
-            result = await self._execute_single_tool(tool_name, call_data)
-            results.append({
+            # Attendre les appels dont celui-ci dépend
+            failed = False
+            for dep in dependencies[index]:
+                dep_result = await tasks[dep]
+                if isinstance(dep_result['output'], dict) and 'error' in dep_result['output']:
+                    failed = True
+            
+            if failed:
+                result = {"error": "Skipped: a dependency failed"}
+            else:
+                result = await self._execute_with_limits(tool_name, call_data)
+            
+            return {
                 'tool': tool_name,
                 'input': call_data,
                 'output': result
-            })
+            }
+        
+        for index, tool_call in enumerate(tool_calls):
+            tasks.append(asyncio.ensure_future(run(index, tool_call)))
+        
+        return list(await asyncio.gather(*tasks))
+    
+    def _build_dependencies(self, tool_calls: List[Dict[str, Any]],
+                            plan: List[Dict[str, Any]]) -> List[Set[int]]:
+        """
+        Construit le DAG des appels à partir du plan.
+        - Un appel est rattaché à l'étape indiquée par son champ "step", sinon
+          à la k-ième étape du plan utilisant le même tool.
+        - Une étape avec "depends_on" dépend explicitement de ces étapes (les
+          étapes sans tool_call sont traversées) ; seul "depends_on": [] rend
+          un appel indépendant. Sans "depends_on", un appel attend l'appel
+          précédent : le plan s'exécute dans l'ordre.
+        - En cas de cycle, exécution séquentielle.
+        """
+        steps = {step.get('step'): step for step in plan if isinstance(step, dict)}
         
-        return results
+        # Rattacher chaque appel à une étape du plan
+        call_steps: List[Any] = []
+        used_steps: Set[Any] = set()
+        for tool_call in tool_calls:
+            step_id = tool_call.get('step')
+            if step_id not in steps:
+                step_id = next(
+                    (s.get('step') for s in plan
+                     if isinstance(s, dict) and s.get('tool') == tool_call.get('tool') and s.get('step') not in used_steps),
+                    None
+                )
+            used_steps.add(step_id)
+            call_steps.append(step_id)
+        
+        calls_by_step: Dict[Any, List[int]] = {}
+        for index, step_id in enumerate(call_steps):
+            if step_id is not None:
+                calls_by_step.setdefault(step_id, []).append(index)
+        
+        def calls_for_steps(step_ids, visited: Set[Any]) -> Set[int]:
+            result: Set[int] = set()
+            for step_id in step_ids or []:
+                if step_id in visited or step_id not in steps:
+                    continue
+                visited.add(step_id)
+                if step_id in calls_by_step:
+                    result.update(calls_by_step[step_id])
+                else:
+                    result.update(calls_for_steps(steps[step_id].get('depends_on'), visited))
+            return result
+        
+        dependencies: List[Set[int]] = []
+        for index in range(len(tool_calls)):
+            step = steps.get(call_steps[index])
+            if step is not None and isinstance(step.get('depends_on'), list):
+                deps = calls_for_steps(step['depends_on'], {call_steps[index]})
+                deps.discard(index)
+            else:
+                # Dépendances non déclarées : ordre du plan
+                deps = {index - 1} if index > 0 else set()
+            dependencies.append(deps)
+        
+        if self._has_cycle(dependencies):
+            return [{index - 1} if index > 0 else set() for index in range(len(tool_calls))]
+        return dependencies
+    
+    @staticmethod
+    def _has_cycle(dependencies: List[Set[int]]) -> bool:
+        state = [0] * len(dependencies)  # 0: non visité, 1: en cours, 2: terminé
+        
+        def visit(node: int) -> bool:
+            if state[node] == 1:
+                return True
+            if state[node] == 2:
+                return False
+            state[node] = 1
+            if any(visit(dep) for dep in dependencies[node]):
+                return True
+            state[node] = 2
+            return False
+        
+        return any(visit(node) for node in range(len(dependencies)))
+    
+    async def _execute_with_limits(self, tool: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Exécute un tool sous sa limite de concurrence et son timeout."""
+        timeout = self.timeouts.get(tool, self.default_timeout)
+        semaphore = self.semaphores.get(tool)
+        try:
+            with span(f"tool.{tool}"):
+                if semaphore is None:
+                    return await asyncio.wait_for(self._execute_single_tool(tool, data), timeout=timeout)
+                async with semaphore:
+                    return await asyncio.wait_for(self._execute_single_tool(tool, data), timeout=timeout)
+        except asyncio.TimeoutError:
+            return {"error": f"Tool '{tool}' timed out after {timeout}s"}
     
     async def _execute_single_tool(self, tool: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Exécute un tool spécifique."""
@@ -45,15 +176,12 @@ class ToolsExecutor:
     async def _call_action_exec(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Appelle le service Action Exec."""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"http://{self.action_exec_host}/run",
-                    json=data
-                ) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    else:
-                        return {"error": f"Action exec failed: {resp.status}"}
+            # Pas de retry après envoi : une commande ne doit pas s'exécuter deux fois
+            resp = await self.http_client.post(f"http://{self.action_exec_host}/run", json=data)
+            if resp.status == 200:
+                return resp.json()
+            else:
+                return {"error": f"Action exec failed: {resp.status}"}
         except Exception as e:
             return {"error": str(e)}
     
@@ -63,15 +191,15 @@ class ToolsExecutor:
             method = data.get('method', 'write')
             endpoint = '/write' if method == 'write' else '/query'
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"http://{self.memory_host}{endpoint}",
-                    json=data
-                ) as resp:
-                    if resp.status == 200:
-                        return await resp.json()
-                    else:
-                        return {"error": f"Memory service failed: {resp.status}"}
+            resp = await self.http_client.post(
+                f"http://{self.memory_host}{endpoint}",
+                json=data,
+                idempotent=(endpoint == '/query')
+            )
+            if resp.status == 200:
+                return resp.json()
+            else:
+                return {"error": f"Memory service failed: {resp.status}"}
         except Exception as e:
             return {"error": str(e)}
     
@@ -6,8 +6,10 @@ from chromadb.config import Settings
 from datetime import datetime
 import os
 import uuid
+from common.instrumentation import instrument_app, span
 
 app = FastAPI(title="JARVIS Memory Service", version="0.1.0")
+instrument_app(app, "memory")
 
 # Configuration Chroma
 CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
@@ -82,11 +84,12 @@ async def write_memory(memory: MemoryWrite):
             **memory.metadata
         }
         
-        collection.add(
-            ids=[memory_id],
-            documents=[memory.text],
-            metadatas=[metadata]
-        )
+        with span("memory.chroma_write"):
+            collection.add(
+                ids=[memory_id],
+                documents=[memory.text],
+                metadatas=[metadata]
+            )
         
         # TODO: Ajouter audit log
         
@@ -113,11 +116,12 @@ async def query_memory(query: MemoryQuery):
         if query.memory_type:
             where["type"] = query.memory_type
         
-        results = collection.query(
-            query_texts=[query.query_text],
-            n_results=query.top_k,
-            where=where
-        )
+        with span("memory.chroma_query", top_k=query.top_k):
+            results = collection.query(
+                query_texts=[query.query_text],
+                n_results=query.top_k,
+                where=where
+            )
         
         memories = []
         if results["ids"][0]:
@@ -0,0 +1,97 @@
+from typing import Optional
+import io
+import wave
+
+import numpy as np
+
+try:
+    from faster_whisper.audio import decode_audio as _av_decode
+    DECODER_AVAILABLE = True
+except ImportError:
+    DECODER_AVAILABLE = False
+
+# Fréquence attendue par Whisper
+SAMPLE_RATE = 16000
+
+PCM_EXTENSIONS = {".pcm", ".raw"}
+PCM_CONTENT_TYPES = {"audio/l16", "audio/pcm", "audio/x-raw"}
+
+
+class AudioDecodeError(Exception):
+    """Contenu audio illisible ou format non pris en charge."""
+
+
+def decode_audio(data: bytes, extension: str = "", content_type: Optional[str] = None,
+                 pcm_sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Décode un fichier audio reçu en mémoire en float32 mono 16 kHz, sans
+    fichier temporaire :
+    - PCM 16 bits brut (.pcm/.raw, audio/L16) et WAV PCM : NumPy seul
+    - autres formats (MP3, OGG, FLAC, M4A, WebM, WAV float...) : décodeur
+      PyAV de faster-whisper, lu depuis un tampon mémoire
+    """
+    extension = extension.lower()
+    content_type = (content_type or "").split(";")[0].strip().lower()
+
+    if extension in PCM_EXTENSIONS or content_type in PCM_CONTENT_TYPES:
+        return _resample(pcm16_to_float32(data), pcm_sample_rate)
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        samples = _decode_wav(data)
+        if samples is not None:
+            return samples
+
+    return _decode_with_av(data)
+
+
+def pcm16_to_float32(pcm: bytes) -> np.ndarray:
+    """PCM 16 bits signé little-endian -> float32 dans [-1, 1]."""
+    usable = len(pcm) - (len(pcm) % 2)
+    return np.frombuffer(pcm[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _decode_wav(data: bytes) -> Optional[np.ndarray]:
+    """WAV PCM entier 8/16/32 bits ; None si le décodeur générique est nécessaire."""
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels = wav.getnchannels()
+            width = wav.getsampwidth()
+            rate = wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        # WAV float ou compressé (WAVE_FORMAT_EXTENSIBLE...) : non géré par `wave`
+        return None
+
+    if width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        return None
+
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE and DECODER_AVAILABLE:
+        # Rééchantillonnage filtré par le décodeur (meilleure qualité)
+        return None
+    return _resample(samples, rate)
+
+
+def _resample(samples: np.ndarray, rate: int) -> np.ndarray:
+    if rate == SAMPLE_RATE or len(samples) == 0:
+        return np.ascontiguousarray(samples, dtype=np.float32)
+    # Interpolation linéaire (repli sans PyAV)
+    target_length = int(len(samples) * SAMPLE_RATE / rate)
+    positions = np.linspace(0, len(samples) - 1, target_length)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def _decode_with_av(data: bytes) -> np.ndarray:
+    if not DECODER_AVAILABLE:
+        raise AudioDecodeError("Compressed audio requires PyAV (faster-whisper)")
+    try:
+        return _av_decode(io.BytesIO(data), sampling_rate=SAMPLE_RATE)
+    except Exception as e:
+        raise AudioDecodeError(f"Cannot decode audio: {e}")
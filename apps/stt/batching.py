@@ -0,0 +1,220 @@
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import contextvars
+import threading
+import time
+
+from common.instrumentation import record_span
+
+
+class QueueFullError(Exception):
+    """File de transcription pleine : la requête est rejetée (HTTP 429)."""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Transcription queue is full")
+        self.retry_after = retry_after
+
+
+class TranscriptionJob:
+    """Requête de transcription en attente d'un lot."""
+
+    def __init__(self, payload: Any, loop: asyncio.AbstractEventLoop):
+        self.payload = payload
+        self.loop = loop
+        self.future = loop.create_future()
+        self.enqueued_at = time.monotonic()
+        self.cancelled = False
+        self.result: Any = None
+        # Contexte de la requête (span courant) repris dans le thread worker
+        self.context = contextvars.copy_context()
+
+        # Timings remontés au client
+        self.queue_wait = 0.0
+        self.compute = 0.0
+        self.batch_size = 0
+
+    def timings(self) -> Dict[str, Any]:
+        return {
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "compute_ms": round(self.compute * 1000, 1),
+            "batch_size": self.batch_size,
+        }
+
+    def _resolve(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+class BatchingQueue:
+    """
+    File de transcription regroupant les requêtes concurrentes : le thread
+    worker attend au plus `max_wait_ms` après la première requête (ou
+    `max_batch` requêtes) puis passe tout le lot à `handler` en un seul
+    appel. L'event loop n'est jamais bloqué par le décodage, et le débit
+    croît avec la taille des lots quand plusieurs pièces parlent en même temps.
+    `handler(payloads)` retourne un résultat par payload, dans l'ordre.
+    Seules les requêtes acceptées par `batchable(payload)` sont regroupées ;
+    les autres sont traitées seules, sans fenêtre d'attente, et chacune est
+    résolue dès la fin de son propre décodage.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], max_batch: int = 8,
+                 max_wait_ms: float = 20.0, max_queue_size: int = 64, name: str = "stt-batch",
+                 batchable: Optional[Callable[[Any], bool]] = None):
+        self.handler = handler
+        self.batchable = batchable or (lambda payload: True)
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self._queue: List[TranscriptionJob] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        # Statistiques
+        self.batches = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_compute = 0.0
+        self.max_wait_seen = 0.0
+        self.largest_batch = 0
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            pending = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        for job in pending:
+            job.loop.call_soon_threadsafe(job._resolve, None, RuntimeError("Transcription queue stopped"))
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    async def submit(self, payload: Any) -> TranscriptionJob:
+        """
+        Ajoute une requête et attend son lot. Lève QueueFullError immédiatement
+        si la file est pleine. Retourne le job : `result` et `timings()`.
+        """
+        job = TranscriptionJob(payload, asyncio.get_running_loop())
+        with self._cond:
+            if len(self._queue) >= self.max_queue_size:
+                self.rejected += 1
+                raise QueueFullError(retry_after=self._retry_after())
+            self._queue.append(job)
+            self._cond.notify()
+
+        try:
+            job.result = await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            job.cancelled = True
+            raise
+        return job
+
+    def _retry_after(self) -> int:
+        """Estimation grossière du délai avant qu'une place se libère (secondes)."""
+        avg_batch = (self.total_compute / self.batches) if self.batches else 1.0
+        return max(1, int(avg_batch * len(self._queue) / self.max_batch))
+
+    def _next_batch(self) -> Optional[List[TranscriptionJob]]:
+        with self._cond:
+            while self._running and not self._queue:
+                self._cond.wait()
+            if not self._running:
+                return None
+            head = self._queue[0]
+            if not self.batchable(head.payload):
+                # Requête non batchable : traitée seule, immédiatement
+                del self._queue[0]
+                return [] if head.cancelled else [head]
+
+            # Fenêtre de regroupement, comptée depuis l'arrivée de la plus ancienne requête
+            deadline = head.enqueued_at + self.max_wait
+            while self._running and self._batchable_count() < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not self._running:
+                return None
+            # Les requêtes non batchables gardent leur place dans la file
+            batch: List[TranscriptionJob] = []
+            rest: List[TranscriptionJob] = []
+            for job in self._queue:
+                if len(batch) < self.max_batch and self.batchable(job.payload):
+                    batch.append(job)
+                else:
+                    rest.append(job)
+            self._queue = rest
+        return [job for job in batch if not job.cancelled]
+
+    def _batchable_count(self) -> int:
+        return sum(1 for job in self._queue if self.batchable(job.payload))
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+
+            started_at = time.monotonic()
+            for job in batch:
+                job.queue_wait = started_at - job.enqueued_at
+                job.batch_size = len(batch)
+                self.total_wait += job.queue_wait
+                self.max_wait_seen = max(self.max_wait_seen, job.queue_wait)
+                job.context.run(record_span, "stt.queue_wait", time.time() - job.queue_wait,
+                                job.queue_wait, batch_size=len(batch))
+
+            try:
+                results = self.handler([job.payload for job in batch])
+                error = None
+            except Exception as e:
+                results, error = [None] * len(batch), e
+
+            compute = time.monotonic() - started_at
+            self.batches += 1
+            self.completed += len(batch)
+            self.total_compute += compute
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for job, result in zip(batch, results):
+                job.compute = compute
+                job.context.run(record_span, "stt.batch_decode", time.time() - compute, compute,
+                                batch_size=len(batch))
+                job.loop.call_soon_threadsafe(job._resolve, result, error)
+
+    def stats(self) -> Dict[str, Any]:
+        avg_wait = (self.total_wait / self.completed) if self.completed else 0.0
+        avg_compute = (self.total_compute / self.batches) if self.batches else 0.0
+        return {
+            "queue_depth": self.queue_depth(),
+            "queue_capacity": self.max_queue_size,
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "batches": self.batches,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_batch_size": round(self.completed / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "wait_ms": {
+                "avg": round(avg_wait * 1000, 1),
+                "max": round(self.max_wait_seen * 1000, 1),
+            },
+            "compute_ms_avg": round(avg_compute * 1000, 1),
+        }
@@ -0,0 +1,69 @@
+from typing import Any, Dict, Optional
+
+# Repli en température de faster-whisper : redécodage si le texte est
+# trop répétitif ou trop peu probable
+FALLBACK_TEMPERATURES = [0.0, 0.2, 0.4, 0.6, 0.8, 1.0]
+
+# Profils de décodage, du moins cher au plus précis. `batchable` : le chemin
+# batché reproduit le profil (VAD, seuil « sans parole », greedy sans repli) ;
+# le repli en température ne se batche pas.
+DECODE_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Commandes vocales courtes : greedy, sans horodatage par mot ni repli
+    "command": {
+        "beam_size": 1,
+        "word_timestamps": False,
+        "vad_filter": True,
+        "vad_parameters": {"min_silence_duration_ms": 300, "speech_pad_ms": 100},
+        "temperature": 0.0,
+        "condition_on_previous_text": False,
+        "batchable": True,
+    },
+    # Dictée : comportement historique du service
+    "dictation": {
+        "beam_size": 5,
+        "word_timestamps": True,
+        "vad_filter": True,
+        "vad_parameters": {"min_silence_duration_ms": 500},
+        "temperature": FALLBACK_TEMPERATURES,
+        "condition_on_previous_text": True,
+        "batchable": False,
+    },
+    # Enregistrements longs : précision maximale
+    "archive": {
+        "beam_size": 5,
+        "best_of": 5,
+        "word_timestamps": True,
+        "vad_filter": True,
+        "vad_parameters": {"min_silence_duration_ms": 1000, "speech_pad_ms": 400},
+        "temperature": FALLBACK_TEMPERATURES,
+        "condition_on_previous_text": True,
+        "batchable": False,
+    },
+}
+
+AUTO_PROFILE = "auto"
+CHEAPEST_PROFILE = "command"
+
+
+def select_profile(requested: Optional[str], queue_depth: int, default: str = "dictation",
+                   degrade_depth: int = 4) -> str:
+    """
+    Profil effectif d'une requête. `auto` (ou aucun profil) prend `default`,
+    puis descend au profil le moins cher quand la file atteint `degrade_depth`
+    requêtes en attente. Lève ValueError pour un profil inconnu.
+    """
+    name = (requested or AUTO_PROFILE).lower()
+    if name == AUTO_PROFILE:
+        if degrade_depth > 0 and queue_depth >= degrade_depth:
+            return CHEAPEST_PROFILE
+        return default
+    if name not in DECODE_PROFILES:
+        raise ValueError(
+            f"Unknown decode profile '{requested}'. Available: {', '.join([AUTO_PROFILE, *DECODE_PROFILES])}"
+        )
+    return name
+
+
+def transcribe_options(profile: str) -> Dict[str, Any]:
+    """Paramètres `WhisperModel.transcribe` du profil."""
+    return {key: value for key, value in DECODE_PROFILES[profile].items() if key != "batchable"}
@@ -1,12 +1,20 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from typing import Optional
+import asyncio
+import json
 import os
-import tempfile
+import re
 from datetime import datetime
-from whisper_engine import WhisperEngine
+from whisper_engine import WhisperEngine, process_rss_bytes
+from streaming import StreamingTranscriber, segment_message
+from audio_decoding import decode_audio, AudioDecodeError
+from batching import BatchingQueue, QueueFullError
+from decode_profiles import DECODE_PROFILES, select_profile
+from common.instrumentation import instrument_app, span
 
 app = FastAPI(title="JARVIS STT Service", version="0.2.0")
+instrument_app(app, "stt")
 
 # Initialiser Whisper
 model_size = os.getenv("WHISPER_MODEL_SIZE", "base")  # tiny, base, small, medium, large
@@ -19,6 +27,78 @@ whisper_engine = WhisperEngine(
     compute_type=compute_type
 )
 
+# Modèle rapide (partielles, mot d'activation) ; "none" = un seul modèle
+fast_model_size = os.getenv("STT_FAST_MODEL_SIZE", "tiny")
+fast_compute_type = os.getenv("STT_FAST_COMPUTE_TYPE", "int8")
+# Charges routées vers le modèle rapide : partial, wake, command, stream_final
+FAST_ROUTES = {route.strip() for route in os.getenv("STT_FAST_ROUTES", "partial,wake").split(",") if route.strip()}
+WAKE_PHRASE = os.getenv("STT_WAKE_PHRASE", "jarvis")
+
+if fast_model_size.lower() in ("", "none") or (fast_model_size, fast_compute_type) == (model_size, compute_type):
+    fast_engine = whisper_engine
+else:
+    fast_engine = WhisperEngine(
+        model_size=fast_model_size,
+        device=device,
+        compute_type=fast_compute_type
+    )
+
+# File de transcription batchée par modèle (/transcribe, /transcribe/stream, /wake)
+BATCH_MAX_SIZE = int(os.getenv("STT_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("STT_BATCH_MAX_WAIT_MS", "20"))
+QUEUE_MAX_SIZE = int(os.getenv("STT_QUEUE_MAX_SIZE", "64"))
+
+def make_queue(engine: WhisperEngine, name: str) -> BatchingQueue:
+    """
+    File du modèle : son worker est le seul à utiliser le WhisperModel.
+    Payloads : transcription ({audio, language, profile}) ou décodage horodaté
+    par mot des sessions websocket ({words: True, audio, language, prompt, beam_size}).
+    """
+    def handle(payloads: list) -> list:
+        if payloads[0].get("words"):
+            payload = payloads[0]
+            return [engine.decode_words(payload["audio"], payload["language"], payload["prompt"],
+                                        payload["beam_size"])]
+        return engine.transcribe_batch(
+            [payload["audio"] for payload in payloads],
+            [payload["language"] for payload in payloads],
+            [payload["profile"] for payload in payloads]
+        )
+    
+    return BatchingQueue(
+        handle,
+        max_batch=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        max_queue_size=QUEUE_MAX_SIZE,
+        name=name,
+        # Seul le profil command est regroupé ; dictation, archive et mots horodatés sont décodés seuls
+        batchable=lambda payload: not payload.get("words") and engine.batchable(payload["audio"], payload["profile"])
+    )
+
+transcription_queue = make_queue(whisper_engine, "stt-batch")
+# Le modèle rapide a son propre worker : les partielles n'attendent pas les finales
+fast_queue = transcription_queue if fast_engine is whisper_engine else make_queue(fast_engine, "stt-batch-fast")
+
+def route(workload: str) -> tuple:
+    """(moteur, file) d'une charge : partial, wake, command, stream_final ou final."""
+    if workload in FAST_ROUTES:
+        return fast_engine, fast_queue
+    return whisper_engine, transcription_queue
+
+# Profils de décodage : `auto` descend au profil "command" quand la file est profonde
+DEFAULT_PROFILE = os.getenv("STT_DEFAULT_PROFILE", "dictation")
+AUTO_DEGRADE_DEPTH = int(os.getenv("STT_AUTO_DEGRADE_DEPTH", "4"))
+if DEFAULT_PROFILE not in DECODE_PROFILES:
+    print(f"❌ Unknown STT_DEFAULT_PROFILE '{DEFAULT_PROFILE}', using 'dictation'")
+    DEFAULT_PROFILE = "dictation"
+profile_usage = {"requests": {name: 0 for name in DECODE_PROFILES}, "degraded": 0}
+
+# Sessions de transcription streaming (/transcribe/ws)
+STREAM_INTERVAL_MS = int(os.getenv("STT_STREAM_INTERVAL_MS", "300"))
+STREAM_MAX_BUFFER_S = float(os.getenv("STT_STREAM_MAX_BUFFER_S", "30"))
+STREAM_MAX_SESSIONS = int(os.getenv("STT_STREAM_MAX_SESSIONS", "16"))
+stream_sessions = {"active": 0, "total": 0, "rejected": 0}
+
 class TranscriptResponse(BaseModel):
     text: str
     confidence: float
@@ -27,6 +107,72 @@ class TranscriptResponse(BaseModel):
     timestamp: str
     segments: list = []
     processing_time: Optional[float] = None
+    queue_wait_ms: Optional[float] = None
+    compute_ms: Optional[float] = None
+    batch_size: Optional[int] = None
+    profile: Optional[str] = None
+
+@app.on_event("startup")
+async def startup():
+    transcription_queue.start()
+    fast_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    transcription_queue.stop()
+    fast_queue.stop()
+
+def resolve_profile(requested: Optional[str]) -> str:
+    """Profil effectif selon la demande et la profondeur de la file ; inconnu -> 400."""
+    try:
+        profile = select_profile(requested, transcription_queue.queue_depth(),
+                                 default=DEFAULT_PROFILE, degrade_depth=AUTO_DEGRADE_DEPTH)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    profile_usage["requests"][profile] += 1
+    if not requested or requested.lower() == "auto":
+        if profile != DEFAULT_PROFILE:
+            profile_usage["degraded"] += 1
+    return profile
+
+async def transcribe_queued(samples, language: Optional[str], profile: str, workload: str = "final"):
+    """Passe par la file batchée du modèle routé ; QueueFullError -> 429."""
+    _, queue = route(workload)
+    try:
+        return await queue.submit({"audio": samples, "language": language, "profile": profile})
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail="STT transcription queue is full",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+async def decode_words_queued(workload: str, audio, language: Optional[str], prompt: Optional[str] = None,
+                              beam_size: int = 1):
+    """Décodage horodaté par mot (websocket) par le worker du modèle routé."""
+    _, queue = route(workload)
+    job = await queue.submit({"words": True, "audio": audio, "language": language,
+                              "prompt": prompt, "beam_size": beam_size})
+    return job.result
+
+def models_health() -> dict:
+    """Modèles chargés, routage et mémoire hôte occupée."""
+    engines = {"final": whisper_engine}
+    if fast_engine is not whisper_engine:
+        engines["fast"] = fast_engine
+    models = {name: engine.info() for name, engine in engines.items()}
+    rss = process_rss_bytes()
+    return {
+        "models": models,
+        "routing": {
+            workload: "fast" if workload in FAST_ROUTES and "fast" in engines else "final"
+            for workload in ("partial", "wake", "command", "stream_final", "final")
+        },
+        "memory": {
+            "models_mb": round(sum(model["memory_mb"] or 0.0 for model in models.values()), 1),
+            "process_rss_mb": round(rss / 1024 / 1024, 1) if rss is not None else None,
+        },
+    }
 
 @app.get("/health")
 async def health():
@@ -35,21 +181,36 @@ async def health():
         "service": "stt",
         "model": model_size,
         "whisper_loaded": whisper_engine.model is not None,
-        "device": device
+        "device": device,
+        **models_health(),
+        "stream_sessions": {**stream_sessions, "max": STREAM_MAX_SESSIONS},
+        "inference_queue": transcription_queue.stats(),
+        "fast_inference_queue": fast_queue.stats() if fast_queue is not transcription_queue else None,
+        "decode_profiles": {
+            "available": ["auto", *DECODE_PROFILES],
+            "default": DEFAULT_PROFILE,
+            "auto_degrade_depth": AUTO_DEGRADE_DEPTH,
+            **profile_usage
+        }
     }
 
 @app.post("/transcribe", response_model=TranscriptResponse)
 async def transcribe(
     audio: UploadFile = File(...),
-    language: Optional[str] = Form(None)
+    language: Optional[str] = Form(None),
+    sample_rate: int = Form(16000),
+    profile: Optional[str] = Form(None)
 ):
     """
     Transcrit un fichier audio en texte.
-    Formats supportés: WAV, MP3, OGG, FLAC, M4A
+    Formats supportés: WAV, MP3, OGG, FLAC, M4A, WebM, PCM 16 bits brut
+    (.pcm/.raw, fréquence `sample_rate`). Décodage en mémoire, sans fichier
+    temporaire.
+    Profil de décodage : command, dictation, archive ou auto (défaut).
     """
     try:
         # Valider le format
-        allowed_formats = [".wav", ".mp3", ".ogg", ".flac", ".m4a", ".webm"]
+        allowed_formats = [".wav", ".mp3", ".ogg", ".flac", ".m4a", ".webm", ".pcm", ".raw"]
         file_ext = os.path.splitext(audio.filename)[1].lower()
         
         if file_ext not in allowed_formats:
@@ -58,17 +219,24 @@ async def transcribe(
                 detail=f"Format non supporté. Formats autorisés: {', '.join(allowed_formats)}"
             )
         
-        # Sauvegarder temporairement le fichier
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp:
-            contents = await audio.read()
-            tmp.write(contents)
-            tmp_path = tmp.name
+        # Décoder en float32 16 kHz directement depuis la mémoire
+        contents = await audio.read()
+        try:
+            with span("stt.audio_decode", format=file_ext, bytes=len(contents)):
+                # PyAV (formats compressés) hors de l'event loop
+                samples = await asyncio.to_thread(
+                    decode_audio, contents, file_ext, audio.content_type, pcm_sample_rate=sample_rate
+                )
+        except AudioDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        # Transcrire
-        result = whisper_engine.transcribe(tmp_path, language=language)
-        
-        # Nettoyer
-        os.unlink(tmp_path)
+        # Transcrire (lot partagé avec les requêtes concurrentes)
+        profile = resolve_profile(profile)
+        workload = "command" if profile == "command" else "final"
+        engine, _ = route(workload)
+        with span("stt.decode", model=engine.model_size, profile=profile):
+            job = await transcribe_queued(samples, language, profile, workload)
+        result = job.result
         
         # Vérifier si erreur
         if "error" in result:
@@ -81,7 +249,9 @@ async def transcribe(
             duration=result["duration"],
             timestamp=datetime.utcnow().isoformat(),
             segments=result.get("segments", []),
-            processing_time=result.get("processing_time")
+            processing_time=result.get("processing_time"),
+            profile=result.get("profile", profile),
+            **job.timings()
         )
     
     except HTTPException:
@@ -97,16 +267,170 @@ async def transcribe_stream(audio_chunk: UploadFile = File(...)):
     """
     try:
         contents = await audio_chunk.read()
-        result = whisper_engine.transcribe_realtime(contents)
+        try:
+            samples = await asyncio.to_thread(decode_audio, contents)
+        except AudioDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Partielles : toujours le profil le moins cher
+        engine, _ = route("partial")
+        with span("stt.decode_partial", model=engine.model_size):
+            job = await transcribe_queued(samples, None, "command", "partial")
+        result = job.result
+        if "error" in result:
+            raise HTTPException(status_code=500, detail=result["error"])
         
         return {
             "partial_text": result["text"],
             "confidence": result["confidence"],
-            "is_final": False
+            "is_final": False,
+            "model": engine.model_size,
+            **job.timings()
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _normalize_phrase(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+@app.post("/wake")
+async def detect_wake_phrase(audio_chunk: UploadFile = File(...), phrase: Optional[str] = Form(None)):
+    """
+    Détection du mot d'activation (défaut STT_WAKE_PHRASE) dans un court
+    morceau audio (WAV ou PCM 16 kHz), décodé par le modèle routé `wake`.
+    """
+    expected = _normalize_phrase(phrase or WAKE_PHRASE)
+    if not expected:
+        raise HTTPException(status_code=400, detail="Empty wake phrase")
+    try:
+        samples = await asyncio.to_thread(decode_audio, await audio_chunk.read())
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    engine, _ = route("wake")
+    with span("stt.wake", model=engine.model_size):
+        job = await transcribe_queued(samples, None, "command", "wake")
+    result = job.result
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+    
+    return {
+        "detected": f" {expected} " in f" {_normalize_phrase(result['text'])} ",
+        "phrase": expected,
+        "text": result["text"],
+        "confidence": result["confidence"],
+        "model": engine.model_size,
+        **job.timings()
+    }
+
+@app.websocket("/transcribe/ws")
+async def transcribe_ws(websocket: WebSocket, language: Optional[str] = None, sample_rate: int = 16000):
+    """
+    Transcription streaming avec état.
+    Client -> serveur : frames binaires PCM 16 bits mono (16 kHz) ;
+    {"type": "end"} termine l'énoncé, {"type": "reset"} l'abandonne.
+    Serveur -> client : partial (hypothèse instable, environ toutes les
+    STT_STREAM_INTERVAL_MS), final (segment validé, ne change plus),
+    done (texte de l'énoncé après "end").
+    Les partial et final suivent la route `partial` ; le texte de done suit
+    la route `stream_final` : si elle désigne un autre modèle, l'énoncé entier
+    y est redécodé (beam 5) et `done` peut corriger les segments final.
+    """
+    await websocket.accept()
+    if sample_rate != 16000:
+        await websocket.send_json({"type": "error", "detail": "Only 16 kHz PCM is supported"})
+        await websocket.close(code=1003)
+        return
+    if stream_sessions["active"] >= STREAM_MAX_SESSIONS:
+        stream_sessions["rejected"] += 1
+        await websocket.send_json({"type": "error", "detail": "Too many streaming sessions"})
+        await websocket.close(code=1013)
+        return
+    
+    stream_sessions["active"] += 1
+    stream_sessions["total"] += 1
+    transcriber = StreamingTranscriber(sample_rate=sample_rate, max_buffer_s=STREAM_MAX_BUFFER_S)
+    transcriber.language = language
+    # Route `partial` : hypothèses et segments validés au fil de l'eau
+    stream_engine, _ = route("partial")
+    final_engine, _ = route("stream_final")
+    decode_lock = asyncio.Lock()
+    new_audio = asyncio.Event()
+    send_lock = asyncio.Lock()
+    
+    async def send(message: dict) -> None:
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def decode(final: bool = False) -> None:
+        # Un seul décodage à la fois par session ; l'audio continue d'arriver
+        async with decode_lock:
+            if not final and transcriber.pending_seconds() <= 0:
+                return
+            audio, offset, prompt = transcriber.snapshot()
+            try:
+                with span("stt.decode_stream", final=final, seconds=round(len(audio) / sample_rate, 2)):
+                    words, detected = await decode_words_queued("partial", audio, transcriber.language, prompt)
+            except Exception as e:
+                await send({"type": "error", "detail": str(e)})
+                return
+            transcriber.language = transcriber.language or detected
+            committed, tentative = transcriber.update(words, offset, final=final)
+            if committed:
+                await send(segment_message("final", committed))
+            if not final:
+                await send(segment_message("partial", tentative))
+    
+    async def finish_utterance() -> dict:
+        """Message done : passe finale sur le modèle `stream_final` si différent."""
+        text, model = transcriber.text(), stream_engine.model_size
+        # None (même modèle, ou énoncé plus long que le tampon) : texte validé du flux
+        audio = transcriber.utterance_audio() if final_engine is not stream_engine else None
+        if audio is not None and len(audio):
+            try:
+                with span("stt.decode_stream_final", model=final_engine.model_size,
+                          seconds=round(len(audio) / sample_rate, 2)):
+                    words, detected = await decode_words_queued("stream_final", audio, transcriber.language,
+                                                                beam_size=5)
+                text, model = "".join(word["word"] for word in words).strip(), final_engine.model_size
+                transcriber.language = transcriber.language or detected
+            except Exception as e:
+                await send({"type": "error", "detail": str(e)})
+        return {"type": "done", "text": text, "language": transcriber.language, "model": model}
+    
+    async def decoder() -> None:
+        while True:
+            await new_audio.wait()
+            new_audio.clear()
+            if transcriber.pending_seconds() * 1000 >= STREAM_INTERVAL_MS:
+                await decode()
+    
+    decoder_task = asyncio.create_task(decoder())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                transcriber.add_pcm(message["bytes"])
+                new_audio.set()
+                continue
+            
+            control = json.loads(message.get("text") or "{}")
+            if control.get("type") == "end":
+                await decode(final=True)
+                await send(await finish_utterance())
+                transcriber.reset()
+            elif control.get("type") == "reset":
+                async with decode_lock:
+                    transcriber.reset()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        decoder_task.cancel()
+        stream_sessions["active"] -= 1
+
 @app.get("/languages")
 async def list_languages():
     """Liste des langues supportées par Whisper."""
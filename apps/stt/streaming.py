@@ -0,0 +1,193 @@
+from typing import Any, Dict, List, Optional, Tuple
+import re
+
+import numpy as np
+
+from audio_decoding import pcm16_to_float32
+
+_NON_WORD = re.compile(r"[^\w']+")
+
+
+class PCMBuffer:
+    """
+    Fenêtre glissante bornée d'échantillons float32 : capacité fixe allouée
+    une fois, les plus anciens échantillons sont libérés en tête.
+    `offset` est le temps absolu (s) du premier échantillon conservé.
+    """
+
+    def __init__(self, sample_rate: int = 16000, max_seconds: float = 30.0):
+        self.sample_rate = sample_rate
+        self.capacity = int(sample_rate * max_seconds)
+        self._data = np.zeros(self.capacity, dtype=np.float32)
+        self._size = 0
+        self.offset = 0.0
+        self.overflowed = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def duration(self) -> float:
+        return self._size / self.sample_rate
+
+    @property
+    def end_time(self) -> float:
+        return self.offset + self.duration
+
+    def append(self, samples: np.ndarray) -> None:
+        if len(samples) > self.capacity:
+            samples = samples[-self.capacity:]
+        overflow = self._size + len(samples) - self.capacity
+        if overflow > 0:
+            # Plus de place : l'audio le plus ancien est perdu
+            self._drop(overflow)
+            self.overflowed += overflow
+        self._data[self._size:self._size + len(samples)] = samples
+        self._size += len(samples)
+
+    def drop_until(self, time_s: float) -> None:
+        """Libère l'audio antérieur à `time_s` (temps absolu)."""
+        count = int((time_s - self.offset) * self.sample_rate)
+        self._drop(max(0, min(count, self._size)))
+
+    def _drop(self, count: int) -> None:
+        if count <= 0:
+            return
+        remaining = self._size - count
+        self._data[:remaining] = self._data[count:self._size]
+        self._size = remaining
+        self.offset += count / self.sample_rate
+
+    def snapshot(self) -> np.ndarray:
+        return self._data[:self._size].copy()
+
+    def clear(self) -> None:
+        self.offset = self.end_time
+        self._size = 0
+
+
+def _normalize(word: str) -> str:
+    return _NON_WORD.sub("", word.casefold())
+
+
+def _join(words: List[Dict[str, Any]]) -> str:
+    return "".join(word["word"] for word in words).strip()
+
+
+class StreamingTranscriber:
+    """
+    Transcription incrémentale d'un flux PCM (politique « local agreement ») :
+    - seul l'audio non encore validé est redécodé (la queue instable)
+    - les mots identiques en tête de deux hypothèses successives sont
+      validés et émis comme segment final ; le reste est une partielle
+    - l'audio validé est libéré du tampon, dont la taille est bornée ; si
+      rien n'est validé avant `force_commit_s`, l'hypothèse est validée
+    Le décodage (`decode(audio, prompt)` -> mots horodatés relatifs à
+    `audio`) est appelé hors de l'event loop : `snapshot()` puis `update()`.
+    """
+
+    def __init__(self, sample_rate: int = 16000, max_buffer_s: float = 30.0,
+                 force_commit_s: Optional[float] = None, keep_context_s: float = 0.2,
+                 prompt_chars: int = 200, max_committed_words: int = 2000):
+        self.sample_rate = sample_rate
+        self.buffer = PCMBuffer(sample_rate, max_buffer_s)
+        # Audio complet de l'énoncé en cours, pour une passe finale sur un autre modèle
+        self.utterance = PCMBuffer(sample_rate, max_buffer_s)
+        self.force_commit_s = force_commit_s or max_buffer_s * 0.8
+        self.keep_context_s = keep_context_s
+        self.prompt_chars = prompt_chars
+        self.max_committed_words = max_committed_words
+        self.committed: List[Dict[str, Any]] = []
+        self.hypothesis: List[Dict[str, Any]] = []
+        self.committed_until = 0.0
+        self.decoded_until = 0.0
+        self.language: Optional[str] = None
+
+    def add_pcm(self, pcm: bytes) -> None:
+        samples = pcm16_to_float32(pcm)
+        self.buffer.append(samples)
+        self.utterance.append(samples)
+
+    def utterance_audio(self) -> Optional[np.ndarray]:
+        """Audio de tout l'énoncé ; None si son début a été perdu (tampon plein)."""
+        if self.utterance.overflowed:
+            return None
+        return self.utterance.snapshot()
+
+    def pending_seconds(self) -> float:
+        """Audio reçu depuis le dernier décodage."""
+        return self.buffer.end_time - max(self.decoded_until, self.buffer.offset)
+
+    def prompt(self) -> Optional[str]:
+        """Fin du texte déjà validé, passée au modèle comme contexte."""
+        text = _join(self.committed[-64:])
+        return text[-self.prompt_chars:] if text else None
+
+    def snapshot(self) -> Tuple[np.ndarray, float, Optional[str]]:
+        self.decoded_until = self.buffer.end_time
+        return self.buffer.snapshot(), self.buffer.offset, self.prompt()
+
+    def update(self, words: List[Dict[str, Any]], offset: float,
+               final: bool = False) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Intègre le résultat d'un décodage de l'audio débutant à `offset`.
+        Retourne (mots nouvellement validés, hypothèse restante).
+        """
+        words = [
+            {"start": offset + word["start"], "end": offset + word["end"], "word": word["word"]}
+            for word in words
+        ]
+        # Mots déjà validés, redécodés dans le contexte conservé
+        words = [word for word in words if (word["start"] + word["end"]) / 2 > self.committed_until]
+
+        if final or self.buffer.duration >= self.force_commit_s:
+            agreed = words
+        else:
+            agreed = []
+            for previous, current in zip(self.hypothesis, words):
+                if _normalize(previous["word"]) != _normalize(current["word"]):
+                    break
+                agreed.append(current)
+
+        self.hypothesis = words[len(agreed):]
+        if agreed:
+            self.committed.extend(agreed)
+            # Dictée sans fin : seuls les derniers mots validés sont gardés
+            del self.committed[:-self.max_committed_words]
+            self.committed_until = agreed[-1]["end"]
+            self.buffer.drop_until(self.committed_until - self.keep_context_s)
+        return agreed, self.hypothesis
+
+    def text(self) -> str:
+        return _join(self.committed)
+
+    def reset(self) -> None:
+        """Nouvel énoncé : l'audio et les hypothèses en cours sont abandonnés."""
+        self.buffer.clear()
+        self.utterance.clear()
+        self.utterance.overflowed = 0
+        self.committed = []
+        self.hypothesis = []
+        self.committed_until = self.buffer.offset
+        self.decoded_until = self.buffer.offset
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buffered_seconds": round(self.buffer.duration, 2),
+            "buffer_capacity_seconds": self.buffer.capacity / self.sample_rate,
+            "committed_words": len(self.committed),
+            "tentative_words": len(self.hypothesis),
+            "overflowed_seconds": round(self.buffer.overflowed / self.sample_rate, 2),
+        }
+
+
+def segment_message(kind: str, words: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Message websocket pour un groupe de mots (final ou partial)."""
+    return {
+        "type": kind,
+        "text": _join(words),
+        "start": round(words[0]["start"], 2) if words else None,
+        "end": round(words[-1]["end"], 2) if words else None,
+        "is_final": kind == "final",
+    }
+
@@ -1,16 +1,35 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 import os
-import tempfile
 import time
 from datetime import datetime
 
+import numpy as np
+
+from audio_decoding import decode_audio, SAMPLE_RATE
+from decode_profiles import DECODE_PROFILES, transcribe_options
+
 try:
     from faster_whisper import WhisperModel
+    from faster_whisper.audio import pad_or_trim
+    from faster_whisper.tokenizer import Tokenizer
+    from faster_whisper.vad import VadOptions, get_speech_timestamps, collect_chunks
     WHISPER_AVAILABLE = True
 except ImportError:
     WHISPER_AVAILABLE = False
     print("Warning: faster-whisper not installed. STT features limited.")
 
+# Seuils par défaut de WhisperModel.transcribe (segments « sans parole »)
+NO_SPEECH_THRESHOLD = 0.6
+LOG_PROB_THRESHOLD = -1.0
+
+def process_rss_bytes() -> Optional[int]:
+    """Mémoire résidente du processus (Linux), None si indisponible."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
 class WhisperEngine:
     """Moteur de transcription Whisper optimisé."""
     
@@ -19,22 +38,44 @@ class WhisperEngine:
         self.device = device
         self.compute_type = compute_type
         self.model = None
+        self.load_time: Optional[float] = None
+        # Mémoire hôte prise par le chargement (delta RSS ; hors mémoire GPU)
+        self.memory_bytes: Optional[int] = None
         
         if WHISPER_AVAILABLE:
             try:
                 print(f"📥 Loading Whisper model '{model_size}'...")
+                rss_before = process_rss_bytes()
+                start_time = time.time()
                 self.model = WhisperModel(
                     model_size,
                     device=device,
                     compute_type=compute_type,
                     download_root=os.getenv("WHISPER_MODELS_DIR", "./models")
                 )
-                print(f"✅ Whisper model loaded: {model_size}")
+                self.load_time = round(time.time() - start_time, 2)
+                rss_after = process_rss_bytes()
+                if rss_before is not None and rss_after is not None:
+                    self.memory_bytes = max(0, rss_after - rss_before)
+                print(f"✅ Whisper model loaded: {model_size} ({compute_type})")
             except Exception as e:
                 print(f"❌ Failed to load Whisper: {e}")
     
-    def transcribe(self, audio_path: str, language: Optional[str] = None) -> Dict[str, Any]:
-        """Transcrit un fichier audio."""
+    def info(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_size,
+            "device": self.device,
+            "compute_type": self.compute_type,
+            "loaded": self.model is not None,
+            "load_time_s": self.load_time,
+            "memory_mb": round(self.memory_bytes / 1024 / 1024, 1) if self.memory_bytes is not None else None,
+        }
+    
+    def transcribe(self, audio, language: Optional[str] = None, profile: str = "dictation") -> Dict[str, Any]:
+        """
+        Transcrit un audio (tableau float32 mono 16 kHz, ou chemin de fichier)
+        avec les paramètres du profil de décodage (voir decode_profiles).
+        """
         
         if not self.model:
             return {
@@ -42,7 +83,8 @@ class WhisperEngine:
                 "confidence": 0.0,
                 "language": "unknown",
                 "duration": 0.0,
-                "segments": []
+                "segments": [],
+                "profile": profile
             }
         
         try:
@@ -50,11 +92,9 @@ class WhisperEngine:
             
             # Transcription avec faster-whisper
             segments, info = self.model.transcribe(
-                audio_path,
+                audio,
                 language=language,
-                beam_size=5,
-                vad_filter=True,  # Voice Activity Detection
-                word_timestamps=True
+                **transcribe_options(profile)
             )
             
             # Collecter segments
@@ -87,7 +127,8 @@ class WhisperEngine:
                 "language": info.language,
                 "duration": info.duration,
                 "segments": transcription_segments,
-                "processing_time": round(processing_time, 2)
+                "processing_time": round(processing_time, 2),
+                "profile": profile
             }
         
         except Exception as e:
@@ -98,19 +139,162 @@ class WhisperEngine:
                 "language": "error",
                 "duration": 0.0,
                 "segments": [],
-                "error": str(e)
+                "error": str(e),
+                "profile": profile
             }
     
-    def transcribe_realtime(self, audio_chunk: bytes) -> Dict[str, Any]:
-        """Transcription temps réel (streaming)."""
-        # TODO: Implémenter buffer et streaming
-        # Pour l'instant, fallback sur transcription classique
+    @staticmethod
+    def batchable(audio: np.ndarray, profile: str) -> bool:
+        """Audio d'au plus 30 s (une fenêtre Whisper) d'un profil batchable."""
+        return 0 < len(audio) <= SAMPLE_RATE * 30 and DECODE_PROFILES[profile]["batchable"]
+    
+    def transcribe_batch(self, audios: List[np.ndarray], languages: List[Optional[str]],
+                         profiles: List[str]) -> List[Dict[str, Any]]:
+        """
+        Transcrit plusieurs audios (float32 16 kHz) en un seul passage
+        encodeur + décodeur batché par profil. Seuls les audios d'au plus 30 s
+        (une fenêtre Whisper) d'un profil batchable sont batchés ; les autres,
+        et un audio isolé, passent par `transcribe`. En cas d'échec du batch,
+        repli audio par audio.
+        """
+        groups: Dict[str, List[int]] = {}
+        for i, (audio, profile) in enumerate(zip(audios, profiles)):
+            if self.batchable(audio, profile):
+                groups.setdefault(profile, []).append(i)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(audios)
+
+        for profile, indices in groups.items():
+            if not self.model or len(indices) < 2:
+                continue
+            try:
+                batched = self._decode_batch(
+                    [audios[i] for i in indices], [languages[i] for i in indices], profile
+                )
+                for i, result in zip(indices, batched):
+                    results[i] = result
+            except Exception as e:
+                print(f"Batched transcription error, falling back: {e}")
+
+        return [
+            result if result is not None else self.transcribe(audio, language=language, profile=profile)
+            for audio, language, profile, result in zip(audios, languages, profiles, results)
+        ]
+    
+    def _decode_batch(self, audios: List[np.ndarray], languages: List[Optional[str]],
+                      profile: str) -> List[Dict[str, Any]]:
+        """
+        Encodeur et décodeur CTranslate2 sur le lot ; un segment par audio,
+        sans horodatage. Reproduit le chemin `transcribe` du profil : VAD
+        appliqué avant le lot (mêmes paramètres) et segments « sans parole »
+        écartés avec les seuils par défaut de faster-whisper.
+        """
+        start_time = time.time()
+        options = DECODE_PROFILES[profile]
+        durations = [len(audio) / SAMPLE_RATE for audio in audios]
+        if options.get("vad_filter"):
+            audios = [self._speech_only(audio, options.get("vad_parameters")) for audio in audios]
         
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-            tmp.write(audio_chunk)
-            tmp_path = tmp.name
+        # Audio sans parole après VAD : rien à décoder, comme en requête seule
+        results: List[Dict[str, Any]] = [
+            self._batch_result("", languages[i] or "unknown", durations[i], None, profile, start_time)
+            for i in range(len(audios))
+        ]
+        speech = [i for i, audio in enumerate(audios) if len(audio) > 0]
+        if not speech:
+            return results
+        audios = [audios[i] for i in speech]
+        languages = [languages[i] for i in speech]
         
-        result = self.transcribe(tmp_path)
-        os.unlink(tmp_path)
+        extractor = self.model.feature_extractor
+        features = np.stack([
+            pad_or_trim(extractor(audio)[:, :extractor.nb_max_frames], extractor.nb_max_frames)
+            for audio in audios
+        ])
+        encoder_output = self.model.encode(features)
         
-        return result
\ No newline at end of file
+        # Langue : imposée par la requête, sinon détectée sur le lot
+        if not self.model.model.is_multilingual:
+            languages = ["en"] * len(audios)
+        elif any(language is None for language in languages):
+            detected = self.model.model.detect_language(encoder_output)
+            languages = [language or probs[0][0][2:-2] for language, probs in zip(languages, detected)]
+        
+        tokenizers = [
+            Tokenizer(self.model.hf_tokenizer, self.model.model.is_multilingual,
+                      task="transcribe", language=language)
+            for language in languages
+        ]
+        prompts = [self.model.get_prompt(tokenizer, [], without_timestamps=True) for tokenizer in tokenizers]
+        generated = self.model.model.generate(
+            encoder_output,
+            prompts,
+            beam_size=options["beam_size"],
+            return_scores=True,
+            return_no_speech_prob=True
+        )
+        
+        for i, language, tokenizer, output in zip(speech, languages, tokenizers, generated):
+            tokens = output.sequences_ids[0]
+            # Même calcul que faster-whisper (length_penalty = 1)
+            avg_logprob = output.scores[0] * len(tokens) / (len(tokens) + 1)
+            # Même règle que faster-whisper : silence probable et texte peu sûr -> segment écarté
+            no_speech = output.no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob <= LOG_PROB_THRESHOLD
+            text = "" if no_speech else tokenizer.decode(tokens).strip()
+            results[i] = self._batch_result(text, language, durations[i], avg_logprob, profile, start_time)
+        return results
+    
+    @staticmethod
+    def _speech_only(audio: np.ndarray, vad_parameters: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Parties parlées de l'audio, concaténées (même filtrage que `vad_filter`)."""
+        chunks = get_speech_timestamps(audio, VadOptions(**(vad_parameters or {})))
+        audio_chunks, _ = collect_chunks(audio, chunks)
+        return np.concatenate(audio_chunks, axis=0)
+    
+    @staticmethod
+    def _batch_result(text: str, language: str, duration: float, avg_logprob: Optional[float],
+                      profile: str, start_time: float) -> Dict[str, Any]:
+        segments = [{"start": 0.0, "end": duration, "text": text, "confidence": avg_logprob}] if text else []
+        confidence = max(0.0, min(1.0, (avg_logprob + 5) / 5)) if text else 0.0
+        return {
+            "text": text,
+            "confidence": round(confidence, 2),
+            "language": language,
+            "duration": duration,
+            "segments": segments,
+            "processing_time": round(time.time() - start_time, 2),
+            "profile": profile
+        }
+    
+    def decode_words(self, audio, language: Optional[str] = None, initial_prompt: Optional[str] = None,
+                     beam_size: int = 1) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Décodage rapide d'un tampon audio (float32 16 kHz) pour le streaming :
+        greedy (ou `beam_size` pour la passe finale d'un énoncé), sans VAD ni
+        conditionnement sur le texte précédent, avec les horodatages par mot
+        nécessaires à la validation incrémentale.
+        Retourne (mots, langue détectée).
+        """
+        if not self.model or len(audio) == 0:
+            return [], language
+        
+        segments, info = self.model.transcribe(
+            audio,
+            language=language,
+            beam_size=beam_size,
+            temperature=0.0,
+            vad_filter=False,
+            word_timestamps=True,
+            condition_on_previous_text=False,
+            initial_prompt=initial_prompt
+        )
+        words = [
+            {"start": word.start, "end": word.end, "word": word.word, "probability": word.probability}
+            for segment in segments
+            for word in (segment.words or [])
+        ]
+        return words, info.language
+    
+    def transcribe_realtime(self, audio_chunk: bytes) -> Dict[str, Any]:
+        """Transcription d'un morceau audio (WAV ou PCM 16 kHz), décodé en mémoire."""
+        # Sessions avec état et partielles incrémentales : /transcribe/ws
+        return self.transcribe(decode_audio(audio_chunk), profile="command")
\ No newline at end of file
@@ -6,8 +6,10 @@ import io
 import os
 from datetime import datetime
 from tts_engine import TTSEngine
+from common.instrumentation import instrument_app, span
 
 app = FastAPI(title="JARVIS TTS Service", version="0.2.0")
+instrument_app(app, "tts")
 
 # Initialiser TTS
 model_name = os.getenv("TTS_MODEL", "tts_models/fr/css10/vits")
@@ -52,20 +54,21 @@ async def synthesize(request: SynthesizeRequest):
         voices = tts_engine.get_available_voices()
         selected_voice = next((v for v in voices if v["id"] == request.voice), None)
         
-        if selected_voice and selected_voice.get("type") == "custom":
-            # Voice cloning
-            audio_data = tts_engine.synthesize_with_voice_cloning(
-                text=request.text,
-                reference_audio_path=selected_voice["path"],
-                language=request.language
-            )
-        else:
-            # Synthèse normale
-            audio_data = tts_engine.synthesize(
-                text=request.text,
-                language=request.language,
-                speed=request.speed
-            )
+        with span("tts.synth", chars=len(request.text), voice=request.voice):
+            if selected_voice and selected_voice.get("type") == "custom":
+                # Voice cloning
+                audio_data = tts_engine.synthesize_with_voice_cloning(
+                    text=request.text,
+                    reference_audio_path=selected_voice["path"],
+                    language=request.language
+                )
+            else:
+                # Synthèse normale
+                audio_data = tts_engine.synthesize(
+                    text=request.text,
+                    language=request.language,
+                    speed=request.speed
+                )
         
         if audio_data is None:
             raise HTTPException(
@@ -94,7 +97,8 @@ async def synthesize_stream(text: str = Form(...), language: str = Form("fr")):
     try:
         # Pour l'instant, même implémentation que synthesize
         # TODO: Implémenter vrai streaming avec chunks
-        audio_data = tts_engine.synthesize(text, language=language)
+        with span("tts.synth", chars=len(text)):
+            audio_data = tts_engine.synthesize(text, language=language)
         
         if audio_data is None:
             raise HTTPException(status_code=500, detail="TTS failed")
@@ -4,10 +4,13 @@ from typing import List, Dict, Any, Optional
 import cv2
 import numpy as np
 from datetime import datetime
+import os
 import time
 from vision_engine import VisionEngine
+from common.instrumentation import instrument_app, span
 
 app = FastAPI(title="JARVIS Vision Service", version="0.2.0")
+instrument_app(app, "vision")
 
 # Initialiser Vision
 yolo_model = os.getenv("YOLO_MODEL", "yolov8n.pt")  # n=nano, s=small, m=medium
@@ -71,8 +74,9 @@ async def analyze_image(
     try:
         # Lire l'image
         contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        with span("vision.decode", bytes=len(contents)):
+            nparr = np.frombuffer(contents, np.uint8)
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if img is None:
             raise HTTPException(status_code=400, detail="Invalid image format")
@@ -82,26 +86,30 @@ async def analyze_image(
         # Détection objets
         objects = []
         if detect_objects:
-            objects_raw = vision_engine.detect_objects(img)
+            with span("vision.yolo", model=yolo_model):
+                objects_raw = vision_engine.detect_objects(img)
             objects = [DetectedObject(**obj) for obj in objects_raw]
         
         # OCR
         ocr_results = []
         if detect_text:
-            ocr_raw = vision_engine.extract_text(img, lang=ocr_language)
+            with span("vision.ocr", lang=ocr_language):
+                ocr_raw = vision_engine.extract_text(img, lang=ocr_language)
             ocr_results = [OCRResult(**ocr) for ocr in ocr_raw]
         
         # Détection visages
         faces_count = 0
         faces_data = []
         if detect_faces:
-            faces_count, faces_raw = vision_engine.detect_faces(img)
+            with span("vision.faces"):
+                faces_count, faces_raw = vision_engine.detect_faces(img)
             faces_data = [FaceData(**face) for face in faces_raw]
         
         # Analyse scène
         scene_analysis = {}
         if analyze_scene:
-            scene_analysis = vision_engine.analyze_scene(img)
+            with span("vision.scene"):
+                scene_analysis = vision_engine.analyze_scene(img)
         
         processing_time = time.time() - start_time
         
@@ -132,7 +140,8 @@ async def detect_objects_only(file: UploadFile = File(...), confidence: float =
         if img is None:
             raise HTTPException(status_code=400, detail="Invalid image")
         
-        objects = vision_engine.detect_objects(img, confidence_threshold=confidence)
+        with span("vision.yolo", model=yolo_model):
+            objects = vision_engine.detect_objects(img, confidence_threshold=confidence)
         return {"objects": objects, "count": len(objects)}
     
     except Exception as e:
@@ -149,7 +158,8 @@ async def detect_text_only(file: UploadFile = File(...), language: str = Form("f
         if img is None:
             raise HTTPException(status_code=400, detail="Invalid image")
         
-        text_results = vision_engine.extract_text(img, lang=language)
+        with span("vision.ocr", lang=language):
+            text_results = vision_engine.extract_text(img, lang=language)
         full_text = " ".join([r["text"] for r in text_results])
         
         return {
@@ -184,8 +194,6 @@ async def list_models():
         }
     }
 
-import os
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
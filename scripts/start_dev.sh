@@ -9,6 +9,9 @@ if [ -d "venv" ]; then
     source venv/bin/activate
 fi
 
+# Modules partagés (apps/common) importables par chaque service
+export PYTHONPATH="$(pwd)/apps:$PYTHONPATH"
+
 # Démarrer ChromaDB en background (si Docker dispo)
 if command -v docker &> /dev/null; then
     echo "Starting ChromaDB..."
@@ -0,0 +1,30 @@
+import importlib.util
+import os
+import sys
+
+APPS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "apps"))
+
+# Modules partagés (common.*), comme avec PYTHONPATH=.. depuis un service
+if APPS_DIR not in sys.path:
+    sys.path.insert(0, APPS_DIR)
+
+
+def load_app_module(app: str, module: str):
+    """
+    Charge `apps/<app>/<module>.py` sous le nom `<app>.<module>` : plusieurs
+    services ont des modules homonymes (ex: streaming.py dans llm_agent et stt).
+    Les imports locaux du module sont résolus dans le dossier du service.
+    """
+    name = f"{app}.{module}"
+    if name in sys.modules:
+        return sys.modules[name]
+    app_dir = os.path.join(APPS_DIR, app)
+    spec = importlib.util.spec_from_file_location(name, os.path.join(app_dir, f"{module}.py"))
+    loaded = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, app_dir)
+    try:
+        spec.loader.exec_module(loaded)
+    finally:
+        sys.path.remove(app_dir)
+    sys.modules[name] = loaded
+    return loaded
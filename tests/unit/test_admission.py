@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from conftest import load_app_module
+
+admission = load_app_module("bridge_api", "admission")
+ServiceGate = admission.ServiceGate
+AdmissionRejected = admission.AdmissionRejected
+
+
+def test_release_hands_slot_to_oldest_waiter():
+    async def scenario():
+        gate = ServiceGate("llm", limit=1, max_queue=4)
+        await gate.acquire(timeout=1)
+        order = []
+
+        async def waiter(name):
+            await gate.acquire(timeout=1)
+            order.append(name)
+
+        first = asyncio.ensure_future(waiter("first"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(waiter("second"))
+        await asyncio.sleep(0)
+
+        gate.release()
+        # Créneau transmis, pas libéré : un nouvel arrivant ne double pas la file
+        assert gate.in_flight == 1
+        with pytest.raises(AdmissionRejected):
+            await gate.acquire(timeout=0)
+        await first
+        assert order == ["first"]
+
+        gate.release()
+        await second
+        gate.release()
+        return gate, order
+
+    gate, order = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert gate.in_flight == 0
+    assert gate.stats()["queued_now"] == 0
+
+
+def test_queue_full_is_rejected_immediately():
+    async def scenario():
+        gate = ServiceGate("vision", limit=1, max_queue=1)
+        await gate.acquire(timeout=1)
+        queued = asyncio.ensure_future(gate.acquire(timeout=1))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await gate.acquire(timeout=1)
+        gate.release()
+        await queued
+        gate.release()
+        return gate, rejected.value
+
+    gate, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert gate.rejected_queue_full == 1
+    assert gate.in_flight == 0
+
+
+def test_deadline_removes_waiter():
+    async def scenario():
+        gate = ServiceGate("llm", limit=1, max_queue=4)
+        await gate.acquire(timeout=1)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await gate.acquire(timeout=0.01)
+        return gate, rejected.value
+
+    gate, error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert error.retry_after >= 1
+    assert gate.rejected_deadline == 1
+    assert gate.stats()["queued_now"] == 0
+    assert gate.in_flight == 1
+
+
+def test_slot_handed_over_at_deadline_is_returned(monkeypatch):
+    async def scenario():
+        gate = ServiceGate("llm", limit=1, max_queue=4)
+        await gate.acquire(timeout=1)
+
+        async def handoff_then_timeout(awaitable, timeout):
+            # Le créneau arrive au moment même où l'échéance expire
+            gate.release()
+            awaitable.cancel()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission.asyncio, "wait_for", handoff_then_timeout)
+        with pytest.raises(AdmissionRejected):
+            await gate.acquire(timeout=1)
+        return gate
+
+    gate = asyncio.run(scenario())
+    assert gate.in_flight == 0
+    assert gate.rejected_deadline == 1
+
+
+def test_cancelled_waiter_returns_handed_slot():
+    async def scenario():
+        gate = ServiceGate("llm", limit=1, max_queue=4)
+        await gate.acquire(timeout=1)
+        waiter = asyncio.ensure_future(gate.acquire(timeout=1))
+        await asyncio.sleep(0)
+
+        # Client parti juste après la transmission du créneau. Selon la version
+        # de Python, wait_for remonte l'annulation ou rend le créneau obtenu :
+        # dans les deux cas, aucun créneau ne doit être perdu.
+        gate.release()
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            assert gate.in_flight == 0
+        else:
+            assert gate.in_flight == 1
+            gate.release()
+        return gate
+
+    gate = asyncio.run(scenario())
+    assert gate.in_flight == 0
+    assert gate.stats()["queued_now"] == 0
+
+
+def test_limit_below_one_is_refused():
+    with pytest.raises(ValueError):
+        ServiceGate("llm", limit=0, max_queue=4)
+
+
+def test_service_without_gate_is_not_limited():
+    async def scenario():
+        controller = admission.AdmissionController(limits={"llm": 1})
+        for _ in range(3):
+            await controller.acquire("vision", timeout=0)
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert "vision" not in controller.gates
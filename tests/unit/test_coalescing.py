@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from common.coalescing import RequestCoalescer
+
+
+class Computation:
+    """Calcul factice : compte ses exécutions et attend `release` pour finir."""
+
+    def __init__(self):
+        self.runs = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"run": self.runs, "tool_results": []}
+
+
+def test_concurrent_identical_requests_share_one_computation():
+    async def scenario():
+        coalescer = RequestCoalescer(grace_period=5.0)
+        compute = Computation()
+        key = coalescer.make_key("user", "Monte  le volume")
+        assert key == coalescer.make_key("user", "monte le volume")
+
+        first = asyncio.ensure_future(coalescer.run(key, compute))
+        second = asyncio.ensure_future(coalescer.run(key, compute))
+        await asyncio.sleep(0)
+        compute.release.set()
+        results = await asyncio.gather(first, second)
+        return coalescer, compute, results
+
+    coalescer, compute, (first, second) = asyncio.run(scenario())
+    assert compute.runs == 1
+    assert first == second == {"run": 1, "tool_results": []}
+    # Chaque requête reçoit sa propre copie
+    assert first is not second
+    stats = coalescer.stats()
+    assert (stats["computed"], stats["coalesced"], stats["in_flight"]) == (1, 1, 0)
+
+
+def test_sequential_repeat_runs_again():
+    async def scenario():
+        coalescer = RequestCoalescer(grace_period=5.0)
+        compute = Computation()
+        compute.release.set()
+        key = coalescer.make_key("user", "monte le volume")
+        first = await coalescer.run(key, compute)
+        second = await coalescer.run(key, compute)
+        return coalescer, compute, first, second
+
+    coalescer, compute, first, second = asyncio.run(scenario())
+    assert compute.runs == 2
+    assert (first["run"], second["run"]) == (1, 2)
+    assert coalescer.stats()["computed"] == 2
+    assert coalescer.stats()["coalesced"] == 0
+
+
+def test_errors_are_shared_by_waiters_but_not_kept():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        key = coalescer.make_key("user", "texte")
+        results = await asyncio.gather(coalescer.run(key, failing), coalescer.run(key, failing),
+                                       return_exceptions=True)
+        with pytest.raises(ValueError):
+            await coalescer.run(key, failing)
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert calls == 2
+
+
+def test_computation_cancelled_after_last_waiter_leaves():
+    async def scenario():
+        coalescer = RequestCoalescer(grace_period=0.01)
+        compute = Computation()
+        key = coalescer.make_key("user", "texte")
+        first = asyncio.ensure_future(coalescer.run(key, compute))
+        second = asyncio.ensure_future(coalescer.run(key, compute))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0.03)
+        # Un client attend encore : le calcul continue
+        assert compute.cancelled == 0
+
+        second.cancel()
+        await asyncio.sleep(0.03)
+        return coalescer, compute
+
+    coalescer, compute = asyncio.run(scenario())
+    assert compute.runs == 1
+    assert compute.cancelled == 1
+    assert coalescer.stats()["abandoned"] == 1
+    assert coalescer.stats()["in_flight"] == 0
+
+
+def test_retry_within_grace_period_joins_abandoned_computation():
+    async def scenario():
+        coalescer = RequestCoalescer(grace_period=5.0)
+        compute = Computation()
+        key = coalescer.make_key("user", "texte")
+        first = asyncio.ensure_future(coalescer.run(key, compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+
+        retry = asyncio.ensure_future(coalescer.run(key, compute))
+        await asyncio.sleep(0)
+        compute.release.set()
+        return coalescer, compute, await retry
+
+    coalescer, compute, result = asyncio.run(scenario())
+    assert compute.runs == 1
+    assert compute.cancelled == 0
+    assert result["run"] == 1
+    assert coalescer.stats()["abandoned"] == 0
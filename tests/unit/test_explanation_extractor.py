@@ -0,0 +1,44 @@
+import json
+
+from conftest import load_app_module
+
+ExplanationExtractor = load_app_module("llm_agent", "streaming").ExplanationExtractor
+
+
+def feed_all(chunks):
+    extractor = ExplanationExtractor()
+    deltas = [extractor.feed(chunk) for chunk in chunks]
+    return extractor, deltas
+
+
+def test_plain_text_across_chunks():
+    extractor, deltas = feed_all(['{"plan": [], "expla', 'nation": "Bon', 'jour", "safety": {}}'])
+    assert deltas == ["", "Bon", "jour"]
+    assert extractor.text == "Bonjour"
+    assert extractor.finished
+
+
+def test_escape_split_across_chunks():
+    extractor, deltas = feed_all(['{"explanation": "a\\', 'nb\\', '"c\\', '\\d"}'])
+    assert deltas == ["a", "\nb", '"c', "\\d"]
+    assert extractor.text == 'a\nb"c\\d'
+
+
+def test_unicode_escape_split_across_chunks():
+    extractor, deltas = feed_all(['{"explanation": "d\\', "u00", "e", '9j\\u00e0 vu"}'])
+    assert deltas == ["d", "", "", "éjà vu"]
+    assert extractor.text == "déjà vu"
+
+
+def test_nothing_emitted_after_closing_quote():
+    extractor, deltas = feed_all(['{"explanation": "fini"', ', "note": "ignoré"}'])
+    assert deltas == ["fini", ""]
+    assert extractor.text == "fini"
+
+
+def test_char_by_char_matches_json_decoding():
+    explanation = 'Il fait 21°C — "confort" \\ ok\n\tsuite été /'
+    output = json.dumps({"plan": [], "explanation": explanation, "safety": {"level": "low"}})
+    extractor, deltas = feed_all(list(output))
+    assert "".join(deltas) == explanation
+    assert extractor.finished
@@ -0,0 +1,84 @@
+from conftest import load_app_module
+
+StreamingTranscriber = load_app_module("stt", "streaming").StreamingTranscriber
+
+SAMPLE_RATE = 16000
+
+
+def silence(seconds: float) -> bytes:
+    return b"\x00\x00" * int(SAMPLE_RATE * seconds)
+
+
+def words(*items):
+    """Mots horodatés (start, end, texte) relatifs à l'audio décodé."""
+    return [{"start": start, "end": end, "word": word} for start, end, word in items]
+
+
+def texts(result):
+    return [word["word"] for word in result]
+
+
+def test_local_agreement_commits_common_prefix():
+    transcriber = StreamingTranscriber(max_buffer_s=10)
+    transcriber.add_pcm(silence(1.0))
+
+    agreed, hypothesis = transcriber.update(words((0.0, 0.3, " allume"), (0.3, 0.5, " la")), offset=0.0)
+    assert agreed == []
+    assert texts(hypothesis) == [" allume", " la"]
+
+    # Casse et ponctuation ignorées pour l'accord
+    agreed, hypothesis = transcriber.update(
+        words((0.0, 0.3, " Allume"), (0.3, 0.5, " la,"), (0.5, 0.9, " lumière")), offset=0.0
+    )
+    assert texts(agreed) == [" Allume", " la,"]
+    assert texts(hypothesis) == [" lumière"]
+    assert transcriber.text() == "Allume la,"
+    assert transcriber.committed_until == 0.5
+
+
+def test_divergence_stops_agreement():
+    transcriber = StreamingTranscriber(max_buffer_s=10)
+    transcriber.add_pcm(silence(1.0))
+    transcriber.update(words((0.0, 0.3, " éteins"), (0.3, 0.5, " le")), offset=0.0)
+
+    agreed, hypothesis = transcriber.update(words((0.0, 0.3, " étends"), (0.3, 0.5, " le")), offset=0.0)
+    assert agreed == []
+    assert texts(hypothesis) == [" étends", " le"]
+
+
+def test_committed_audio_is_released_and_not_recommitted():
+    transcriber = StreamingTranscriber(max_buffer_s=10, keep_context_s=0.2)
+    transcriber.add_pcm(silence(2.0))
+    first = words((0.0, 0.4, " ouvre"), (0.4, 0.8, " les"))
+    transcriber.update(first, offset=0.0)
+    transcriber.update(first, offset=0.0)
+    assert transcriber.buffer.offset == 0.6
+
+    # Redécodage depuis le contexte conservé : " les" (milieu < 0.8 s) est écarté
+    agreed, hypothesis = transcriber.update(words((0.0, 0.2, " les"), (0.2, 0.6, " volets")), offset=0.6)
+    assert agreed == []
+    assert texts(hypothesis) == [" volets"]
+    assert hypothesis[0]["start"] == 0.8
+
+
+def test_forced_commit_when_buffer_is_nearly_full():
+    transcriber = StreamingTranscriber(max_buffer_s=2.0)
+    assert transcriber.force_commit_s == 1.6
+    transcriber.add_pcm(silence(1.7))
+
+    agreed, hypothesis = transcriber.update(words((0.0, 0.8, " dictée"), (0.8, 1.6, " longue")), offset=0.0)
+    assert texts(agreed) == [" dictée", " longue"]
+    assert hypothesis == []
+    assert transcriber.buffer.duration < 0.5
+
+
+def test_final_update_commits_everything():
+    transcriber = StreamingTranscriber(max_buffer_s=10)
+    transcriber.add_pcm(silence(1.0))
+    transcriber.update(words((0.0, 0.3, " stop")), offset=0.0)
+
+    agreed, hypothesis = transcriber.update(words((0.0, 0.3, " stop"), (0.3, 0.6, " musique")), offset=0.0,
+                                            final=True)
+    assert texts(agreed) == [" stop", " musique"]
+    assert hypothesis == []
+    assert transcriber.text() == "stop musique"
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from conftest import load_app_module
+
+batching = load_app_module("stt", "batching")
+whisper_engine = load_app_module("stt", "whisper_engine")
+BatchingQueue = batching.BatchingQueue
+QueueFullError = batching.QueueFullError
+WhisperEngine = whisper_engine.WhisperEngine
+
+SAMPLE_RATE = 16000
+
+
+def run_queue(queue, payloads):
+    async def scenario():
+        queue.start()
+        try:
+            return await asyncio.gather(*(queue.submit(payload) for payload in payloads))
+        finally:
+            queue.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_concurrent_requests_share_one_batch():
+    batches = []
+
+    def handler(payloads):
+        batches.append(list(payloads))
+        return [payload * 10 for payload in payloads]
+
+    jobs = run_queue(BatchingQueue(handler, max_batch=8, max_wait_ms=50), [1, 2, 3])
+    assert batches == [[1, 2, 3]]
+    assert [job.result for job in jobs] == [10, 20, 30]
+    assert all(job.batch_size == 3 for job in jobs)
+
+
+def test_max_batch_splits_batches():
+    batches = []
+
+    def handler(payloads):
+        batches.append(list(payloads))
+        return payloads
+
+    run_queue(BatchingQueue(handler, max_batch=2, max_wait_ms=50), [1, 2, 3])
+    assert batches == [[1, 2], [3]]
+
+
+def test_non_batchable_requests_are_decoded_alone():
+    batches = []
+    finished = {}
+
+    def handler(payloads):
+        batches.append([payload["id"] for payload in payloads])
+        if payloads[0]["profile"] == "dictation":
+            time.sleep(0.05)
+        for payload in payloads:
+            finished[payload["id"]] = time.monotonic()
+        return [payload["id"] for payload in payloads]
+
+    queue = BatchingQueue(handler, max_batch=8, max_wait_ms=50,
+                          batchable=lambda payload: payload["profile"] == "command")
+
+    async def scenario():
+        queue.start()
+        resolved = {}
+
+        async def submit(payload):
+            job = await queue.submit(payload)
+            resolved[payload["id"]] = time.monotonic()
+            return job
+
+        try:
+            jobs = await asyncio.gather(
+                submit({"id": "a", "profile": "command"}),
+                submit({"id": "b", "profile": "dictation"}),
+                submit({"id": "c", "profile": "command"}),
+                submit({"id": "d", "profile": "dictation"}),
+            )
+        finally:
+            queue.stop()
+        return jobs, resolved
+
+    jobs, resolved = asyncio.run(scenario())
+    # Les commandes sont regroupées, chaque dictée est décodée seule
+    assert batches == [["a", "c"], ["b"], ["d"]]
+    by_id = {job.result: job for job in jobs}
+    assert by_id["b"].batch_size == by_id["d"].batch_size == 1
+    # Chaque dictée est rendue dès la fin de son décodage, pas en fin de lot
+    assert resolved["b"] < finished["d"]
+    assert by_id["b"].compute < 0.09
+
+
+def test_queue_full_rejects_immediately():
+    release = threading.Event()
+
+    def handler(payloads):
+        release.wait(1)
+        return payloads
+
+    queue = BatchingQueue(handler, max_batch=1, max_wait_ms=0, max_queue_size=1)
+
+    async def scenario():
+        queue.start()
+        try:
+            running = asyncio.ensure_future(queue.submit(1))
+            await asyncio.sleep(0.05)
+            queued = asyncio.ensure_future(queue.submit(2))
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFullError):
+                await queue.submit(3)
+            release.set()
+            await asyncio.gather(running, queued)
+        finally:
+            queue.stop()
+
+    asyncio.run(scenario())
+    assert queue.rejected == 1
+    assert queue.completed == 2
+
+
+def test_handler_error_is_raised_to_every_job():
+    def handler(payloads):
+        raise RuntimeError("decoder crashed")
+
+    queue = BatchingQueue(handler, max_batch=4, max_wait_ms=50)
+
+    async def scenario():
+        queue.start()
+        try:
+            return await asyncio.gather(queue.submit(1), queue.submit(2), return_exceptions=True)
+        finally:
+            queue.stop()
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+class FakeEngine(WhisperEngine):
+    """Moteur sans modèle : enregistre les lots et les décodages isolés."""
+
+    def __init__(self, fail_batch: bool = False):
+        self.model = object()
+        self.fail_batch = fail_batch
+        self.batches = []
+        self.single = []
+
+    def _decode_batch(self, audios, languages, profile):
+        self.batches.append((profile, [len(audio) for audio in audios]))
+        if self.fail_batch:
+            raise RuntimeError("batch failed")
+        return [{"text": "batch", "profile": profile} for _ in audios]
+
+    def transcribe(self, audio, language=None, profile="dictation"):
+        self.single.append((profile, len(audio)))
+        return {"text": "single", "profile": profile}
+
+
+def clip(seconds: float) -> np.ndarray:
+    return np.zeros(int(SAMPLE_RATE * seconds), dtype=np.float32)
+
+
+def test_batchable_requires_profile_and_single_window():
+    assert WhisperEngine.batchable(clip(2), "command")
+    assert not WhisperEngine.batchable(clip(2), "dictation")
+    assert not WhisperEngine.batchable(clip(2), "archive")
+    assert not WhisperEngine.batchable(clip(31), "command")
+    assert not WhisperEngine.batchable(clip(0), "command")
+
+
+def test_transcribe_batch_groups_batchable_profile_only():
+    engine = FakeEngine()
+    audios = [clip(1), clip(2), clip(1), clip(31), clip(3)]
+    profiles = ["command", "dictation", "command", "command", "archive"]
+    results = engine.transcribe_batch(audios, [None] * 5, profiles)
+
+    assert engine.batches == [("command", [SAMPLE_RATE, SAMPLE_RATE])]
+    assert [result["text"] for result in results] == ["batch", "single", "batch", "single", "single"]
+    assert [result["profile"] for result in results] == profiles
+
+
+def test_lone_batchable_request_uses_regular_path():
+    engine = FakeEngine()
+    results = engine.transcribe_batch([clip(1)], [None], ["command"])
+    assert engine.batches == []
+    assert results == [{"text": "single", "profile": "command"}]
+
+
+def test_batch_failure_falls_back_to_single_decodes():
+    engine = FakeEngine(fail_batch=True)
+    results = engine.transcribe_batch([clip(1), clip(1)], ["fr", "fr"], ["command", "command"])
+    assert len(engine.batches) == 1
+    assert [result["text"] for result in results] == ["single", "single"]
@@ -0,0 +1,79 @@
+import asyncio
+
+from conftest import load_app_module
+
+ToolsExecutor = load_app_module("llm_agent", "tools_executor").ToolsExecutor
+
+CALLS = [{"tool": "memory"}, {"tool": "action_exec"}, {"tool": "memory"}]
+
+
+def build(plan, tool_calls=CALLS):
+    return ToolsExecutor(http_client=None)._build_dependencies(tool_calls, plan)
+
+
+def test_missing_depends_on_follows_plan_order():
+    assert build([]) == [set(), {0}, {1}]
+    plan = [{"step": 1, "tool": "memory"}, {"step": 2, "tool": "action_exec"}, {"step": 3, "tool": "memory"}]
+    assert build(plan) == [set(), {0}, {1}]
+
+
+def test_explicit_empty_depends_on_runs_in_parallel():
+    plan = [
+        {"step": 1, "tool": "memory", "depends_on": []},
+        {"step": 2, "tool": "action_exec", "depends_on": []},
+        {"step": 3, "tool": "memory", "depends_on": [1]},
+    ]
+    assert build(plan) == [set(), set(), {0}]
+
+
+def test_steps_without_tool_call_are_traversed():
+    plan = [
+        {"step": 1, "tool": "memory", "depends_on": []},
+        {"step": 2, "tool": None, "depends_on": [1]},
+        {"step": 3, "tool": "action_exec", "depends_on": [2]},
+    ]
+    assert build(plan, [{"tool": "memory"}, {"tool": "action_exec"}]) == [set(), {0}]
+
+
+def test_call_step_field_takes_precedence():
+    plan = [
+        {"step": 1, "tool": "memory", "depends_on": []},
+        {"step": 2, "tool": "memory", "depends_on": [1]},
+    ]
+    calls = [{"tool": "memory", "step": 2}, {"tool": "memory", "step": 1}]
+    assert build(plan, calls) == [{1}, set()]
+
+
+def test_cycle_falls_back_to_sequential():
+    plan = [
+        {"step": 1, "tool": "memory", "depends_on": [3]},
+        {"step": 2, "tool": "action_exec", "depends_on": []},
+        {"step": 3, "tool": "memory", "depends_on": [1]},
+    ]
+    assert build(plan) == [set(), {0}, {1}]
+
+
+def test_failed_dependency_skips_call():
+    executor = ToolsExecutor(http_client=None)
+    executed = []
+
+    async def fake_tool(tool, data):
+        executed.append(data["id"])
+        return {"error": "boom"} if data["id"] == 1 else {"status": "ok"}
+
+    executor._execute_single_tool = fake_tool
+    calls = [
+        {"tool": "memory", "call": {"id": 1}},
+        {"tool": "action_exec", "call": {"id": 2}},
+        {"tool": "notify", "call": {"id": 3}},
+    ]
+    plan = [
+        {"step": 1, "tool": "memory", "depends_on": []},
+        {"step": 2, "tool": "action_exec", "depends_on": [1]},
+        {"step": 3, "tool": "notify", "depends_on": []},
+    ]
+    results = asyncio.run(executor.execute_tools(calls, plan=plan))
+
+    assert sorted(executed) == [1, 3]
+    assert [result["input"]["id"] for result in results] == [1, 2, 3]
+    assert results[1]["output"] == {"error": "Skipped: a dependency failed"}